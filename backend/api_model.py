@@ -2,9 +2,13 @@ import os
 from openai import OpenAI
 from typing import Dict, Any, Tuple, Generator
 
+# 调用失败时回复内容的前缀
+API_ERROR_PREFIX = "API调用失败"
+
 class APIModelProcessor:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model_name: str = "deepseek-r1"):
         """初始化API模型处理器"""
+        self.model_name = model_name
         self.client = OpenAI(
             api_key=api_key,
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
@@ -25,7 +29,7 @@ class APIModelProcessor:
         """
         try:
             stream = self.client.chat.completions.create(
-                model="deepseek-r1",
+                model=self.model_name,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
                 max_tokens=max_length,
@@ -41,7 +45,7 @@ class APIModelProcessor:
                         yield reasoning, content
                 
         except Exception as e:
-            yield "", f"API调用失败: {str(e)}"
+            yield "", f"{API_ERROR_PREFIX}: {str(e)}"
 
 def test_api_model():
     """测试API模型功能"""
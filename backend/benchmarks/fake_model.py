@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+
+from pose_detection.backends import InferenceBackend
+
+from benchmarks.synthetic import synthetic_track
+
+# 程序功能：替代MoveNet的确定性假模型，基准测试不需要下载模型，也不受模型推理速度的影响
+
+
+class FakeMoveNet(InferenceBackend):
+    """Deterministic stand-in for MoveNet.
+
+    Every crop gets the same synthetic rider pose, shifted slightly by the
+    mean brightness of the crop, so the output depends only on the input and
+    the whole batch is read like a real model would. ms_per_frame adds a
+    fixed sleep per image to mimic the cost of the real model.
+    """
+
+    name = "fake"
+
+    def __init__(self, input_size=256, ms_per_frame=0.0):
+        super().__init__(input_size)
+        self.ms_per_frame = ms_per_frame
+        keypoints, _ = synthetic_track(1, noise=0)
+        self._pose = keypoints[0]
+
+    def infer(self, input_images):
+        images = np.asarray(input_images, dtype=np.float32)
+        brightness = images.mean(axis=(1, 2, 3)) / 255
+        keypoints = np.repeat(self._pose[None], len(images), axis=0)
+        keypoints[:, :, :2] += (brightness[:, None, None] - 0.5) * 0.01
+        if self.ms_per_frame:
+            time.sleep(self.ms_per_frame * len(images) / 1000)
+        return keypoints
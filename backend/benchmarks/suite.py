@@ -0,0 +1,487 @@
+"""""" """""" """""" """""" """
+ BENCHMARK SUITE 离线的分阶段基准测试
+ 用法: python -m benchmarks.suite run --output benchmark.json
+       python -m benchmarks.suite run --real-model --retrieval real --stages inference,retrieval
+       python -m benchmarks.suite compare baseline.json benchmark.json --threshold 0.1
+ 可选依赖: retrieval 阶段需要 llama_index（假检索也使用 llama_index.core 建立索引），--retrieval real 另外需要
+       DASHSCOPE_API_KEY 和网络；--real-model 需要本地模型目录或可以下载模型。缺少时该阶段只记录 error，其他阶段照常运行。
+       TensorFlow 是 pose_detection 的必需依赖，所有阶段都需要
+""" """""" """""" """""" """"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fake_model import FakeMoveNet
+from benchmarks.synthetic import DEFAULT_CADENCE_RPM, DEFAULT_FPS, synthetic_track, write_synthetic_video
+
+# 程序功能：在合成的骑行视频和关键点轨迹上分别计时解码、裁剪、推理、角度计算、踩踏检测、提示词构建和知识库检索，
+# 结果写入JSON文件，用 compare 对比两次提交之间的差异。默认使用假模型和假的嵌入模型，不需要网络
+
+# 结果文件的格式版本，字段不兼容地变化时递增
+RESULT_VERSION = 1
+STAGES = ("decode", "crop", "inference", "keypoints", "angles", "peaks", "strokes", "measure", "prompt", "retrieval")
+# compare 默认把中位数变慢超过10%的阶段视为性能退化
+DEFAULT_THRESHOLD = 0.1
+
+# 合成知识库的段落，假检索时使用
+_KB_TOPICS = ["座椅高度", "座椅前后位置", "把立长度", "把手高度", "锁片位置", "曲柄长度", "车架尺寸", "骑行姿势"]
+
+
+#重复运行func，返回每次的耗时（秒），第一次作为预热不计入
+def _time(func, repeats):
+    func()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+#汇总一个阶段的耗时，items 是每次处理的数量（帧数、调用次数等），用于计算吞吐量
+def _summarize(durations, items, unit, **extra):
+    median = statistics.median(durations)
+    return {
+        "seconds": durations,
+        "min_ms": min(durations) * 1000,
+        "median_ms": median * 1000,
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "items": items,
+        "unit": unit,
+        "per_item_us": median / items * 1e6 if items else None,
+        "items_per_second": items / median if median > 0 else None,
+        **extra,
+    }
+
+
+class Workload:
+    """Synthetic inputs shared by every stage, created once per run.
+
+    The keypoint track, the rendered video and the decoded frames are
+    generated lazily, so running a single stage only pays for what it uses.
+    """
+
+    def __init__(self, frames, fps, cadence, video_size, workdir):
+        self.frames = frames
+        self.fps = fps
+        self.cadence = cadence
+        self.video_size = video_size
+        self.workdir = workdir
+        self.keypoints, self.timestamps = synthetic_track(frames, fps, cadence)
+        # 解码时不截断合成视频
+        self.seconds = frames / fps + 1
+        self._video = None
+        self._decoded = None
+        self._crops = None
+
+    @property
+    def video(self):
+        if self._video is None:
+            self._video = os.path.join(self.workdir, "synthetic.mp4")
+            write_synthetic_video(self._video, self.keypoints, self.fps, self.video_size)
+        return self._video
+
+    @property
+    def decoded(self):
+        from pose_detection.preprocessing import read_video_frames
+
+        if self._decoded is None:
+            self._decoded = read_video_frames(self.video, max_seconds=self.seconds, target_fps=None).frames
+        return self._decoded
+
+    def crops(self, input_size, batch_size):
+        from pose_detection.cropping import crop_and_resize_boxes
+
+        if self._crops is None:
+            self._crops = [
+                crop_and_resize_boxes(batch, boxes, crop_size=[input_size, input_size])
+                for batch, boxes in self.crop_batches(batch_size)
+            ]
+        return self._crops
+
+    def crop_batches(self, batch_size):
+        from pose_detection.cropping import init_crop_box
+
+        frames = self.decoded
+        box = init_crop_box(frames.shape[1], frames.shape[2])
+        for start in range(0, len(frames), batch_size):
+            batch = frames[start : start + batch_size]
+            yield batch, np.repeat(box[None, :], len(batch), axis=0)
+
+    def track(self):
+        from pose_detection.pose_track import PoseTrack
+
+        # 每次新建，PoseTrack 会缓存计算过的列
+        return PoseTrack(self.keypoints, self.timestamps)
+
+
+def bench_decode(workload, repeats, **_):
+    """顺序解码合成视频到 FrameBuffer。"""
+    from pose_detection.preprocessing import read_video_frames
+
+    video = workload.video
+    durations = _time(lambda: read_video_frames(video, max_seconds=workload.seconds, target_fps=None), repeats)
+    return _summarize(durations, len(workload.decoded), "frames", video_size=list(workload.video_size))
+
+
+def bench_crop(workload, repeats, model, batch_size, **_):
+    """按批裁剪并缩放到模型的输入尺寸。"""
+    from pose_detection.cropping import crop_and_resize_boxes
+
+    batches = list(workload.crop_batches(batch_size))
+    size = [model.input_size, model.input_size]
+
+    def _crop():
+        for batch, boxes in batches:
+            crop_and_resize_boxes(batch, boxes, crop_size=size)
+
+    return _summarize(_time(_crop, repeats), len(workload.decoded), "frames")
+
+
+def bench_inference(workload, repeats, model, batch_size, **_):
+    """只计时模型推理，输入是预先裁剪好的图像。"""
+    crops = workload.crops(model.input_size, batch_size)
+
+    def _infer():
+        for batch in crops:
+            model.infer(batch)
+
+    return _summarize(_time(_infer, repeats), len(workload.decoded), "frames", backend=model.name)
+
+
+def bench_keypoints(workload, repeats, model, batch_size, **_):
+    """get_keypoints_from_video 的完整流程：裁剪、推理、坐标还原和裁剪区域跟踪。"""
+    from pose_detection.model import get_keypoints_from_video
+
+    frames = workload.decoded
+    durations = _time(lambda: get_keypoints_from_video(frames, model, batch_size=batch_size), repeats)
+    return _summarize(durations, len(frames), "frames", backend=model.name)
+
+
+def bench_angles(workload, repeats, **_):
+    """所有关节角度的向量化计算。"""
+    from pose_detection.postprocessing import calculate_angles, get_joint_angle_triplets
+
+    triplets = get_joint_angle_triplets("left")
+    keypoints = workload.keypoints
+    durations = _time(lambda: calculate_angles(keypoints, triplets), repeats)
+    return _summarize(durations, workload.frames, "frames", joints=len(triplets))
+
+
+def bench_peaks(workload, repeats, **_):
+    """离线检测踏板的最高点和最低点（find_peaks）。"""
+    from pose_detection.postprocessing import get_highest_pedal_frames, get_lowest_pedal_frames
+
+    found = {}
+
+    def _peaks():
+        track = workload.track()
+        indices = track.front_indices[:4]
+        found["highest"] = len(get_highest_pedal_frames(track, indices, workload.fps))
+        found["lowest"] = len(get_lowest_pedal_frames(track, indices, workload.fps))
+
+    durations = _time(_peaks, repeats)
+    return _summarize(durations, workload.frames, "frames", peaks=found, expected_strokes=_expected_strokes(workload))
+
+
+def bench_strokes(workload, repeats, **_):
+    """逐帧检测踩踏（PedalStrokeDetector），与推理同时进行时的开销。"""
+    from pose_detection.stroke_detector import PedalStrokeDetector
+
+    found = {}
+
+    def _strokes():
+        detector = PedalStrokeDetector(workload.fps)
+        events = []
+        for keypoints, timestamp in zip(workload.keypoints, workload.timestamps):
+            events.extend(detector.update(keypoints, timestamp))
+        events.extend(detector.flush())
+        found["events"] = len(events)
+
+    durations = _time(_strokes, repeats)
+    return _summarize(durations, workload.frames, "frames", events=found, expected_strokes=_expected_strokes(workload))
+
+
+def bench_measure(workload, repeats, **_):
+    """get_pose：从关键点轨迹得到全部测量值。"""
+    from pose_detection.pose_analyzer import get_pose
+
+    durations = _time(lambda: get_pose(workload.track()), repeats)
+    # 同时记录没有噪声的轨迹上的测量值，两者相差很大说明峰值检测或角度过滤与合成骑手不一致
+    return _summarize(
+        durations, workload.frames, "frames",
+        measurements=_measurements(workload), expected_measurements=_expected_measurements(workload),
+    )
+
+
+def bench_prompt(workload, repeats, loops=1000, **_):
+    """根据测量值构建大模型的提示词。"""
+    from bike_fit_advisor import BikeFitAdvisor
+
+    # generate_prompt 不需要模型，不创建API或本地模型的客户端
+    advisor = BikeFitAdvisor.__new__(BikeFitAdvisor)
+    measurements = _measurements(workload)
+
+    def _prompt():
+        for _ in range(loops):
+            advisor.generate_prompt(measurements)
+
+    return _summarize(_time(_prompt, repeats), loops, "prompts")
+
+
+def bench_retrieval(workload, repeats, retrieval="fake", top_k=20, **_):
+    """
+    知识库检索。fake 在内存中用合成的段落和确定性的假嵌入模型建立索引；
+    real 加载 local_rag 的 bike-fit 知识库，使用DashScope嵌入模型，需要 DASHSCOPE_API_KEY 和网络。
+    """
+    from bike_fit_advisor import BikeFitAdvisor
+
+    query = BikeFitAdvisor.__new__(BikeFitAdvisor).generate_prompt(_measurements(workload))
+    if retrieval == "real":
+        from llama_index.core import StorageContext, load_index_from_storage
+        from local_rag.chat import DB_PATH
+
+        start = time.perf_counter()
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=os.path.join(DB_PATH, "bike-fit")))
+        load_ms = (time.perf_counter() - start) * 1000
+        documents = None
+    else:
+        from llama_index.core import Document, VectorStoreIndex
+        from llama_index.core.embeddings import MockEmbedding
+
+        texts = [
+            f"{topic}：第{i}条建议，骑行时膝盖角度、髋关节角度和肩膀角度需要保持在合适的范围内。"
+            for i in range(50) for topic in _KB_TOPICS
+        ]
+        start = time.perf_counter()
+        index = VectorStoreIndex.from_documents(
+            [Document(text=text) for text in texts], embed_model=MockEmbedding(embed_dim=256)
+        )
+        load_ms = (time.perf_counter() - start) * 1000
+        documents = len(texts)
+
+    retriever = index.as_retriever(similarity_top_k=top_k)
+    durations = _time(lambda: retriever.retrieve(query), repeats)
+    return _summarize(durations, 1, "queries", retrieval=retrieval, index_ms=load_ms, documents=documents)
+
+
+_BENCHMARKS = {
+    "decode": bench_decode,
+    "crop": bench_crop,
+    "inference": bench_inference,
+    "keypoints": bench_keypoints,
+    "angles": bench_angles,
+    "peaks": bench_peaks,
+    "strokes": bench_strokes,
+    "measure": bench_measure,
+    "prompt": bench_prompt,
+    "retrieval": bench_retrieval,
+}
+
+
+#合成视频中踏板转过的圈数，每圈各有一次最高点和最低点
+def _expected_strokes(workload):
+    return workload.cadence / 60 * workload.frames / workload.fps
+
+
+def _measurements(workload):
+    from pose_detection.pose_analyzer import get_pose
+
+    return {key: round(float(value), 1) for key, value in get_pose(workload.track()).items()}
+
+
+#没有关键点噪声时合成骑手的测量值
+def _expected_measurements(workload):
+    from pose_detection.pose_analyzer import get_pose
+    from pose_detection.pose_track import PoseTrack
+
+    keypoints, timestamps = synthetic_track(workload.frames, workload.fps, workload.cadence, noise=0)
+    return {key: round(float(value), 1) for key, value in get_pose(PoseTrack(keypoints, timestamps)).items()}
+
+
+def _git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run_suite(stages=STAGES, frames=300, fps=DEFAULT_FPS, cadence=DEFAULT_CADENCE_RPM, video_size=(640, 480),
+              repeats=5, model=None, batch_size=8, retrieval="fake"):
+    """
+    运行各阶段的基准测试。
+
+    参数:
+        stages: 需要运行的阶段，见 STAGES
+        frames (int): 合成视频和关键点轨迹的帧数
+        fps (float): 合成视频的帧率
+        cadence (float): 合成骑手的踏频（转/分钟）
+        video_size (tuple): 合成视频的 (宽, 高)
+        repeats (int): 每个阶段计时的次数，另外先运行一次预热
+        model: 推理后端，默认使用 FakeMoveNet
+        batch_size (int): 裁剪和推理的batch_size
+        retrieval (str): "fake" 或 "real"，见 bench_retrieval
+
+    返回:
+        dict: 可以直接写入JSON的结果，stages 中每个阶段包含耗时统计，失败的阶段只有 error
+    """
+    model = model or FakeMoveNet()
+    commit, dirty = _git_revision()
+    results = {
+        "version": RESULT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "platform": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "frames": frames, "fps": fps, "cadence": cadence, "video_size": list(video_size),
+            "repeats": repeats, "backend": model.name, "batch_size": batch_size, "retrieval": retrieval,
+        },
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bikefit-bench-") as workdir:
+        workload = Workload(frames, fps, cadence, video_size, workdir)
+        for stage in stages:
+            print(f"- {stage}...", end=" ", flush=True)
+            try:
+                row = _BENCHMARKS[stage](
+                    workload, repeats, model=model, batch_size=batch_size, retrieval=retrieval
+                )
+            except Exception as e:
+                # 缺少可选依赖（例如llama_index）或网络时跳过这一阶段，不影响其他阶段
+                results["stages"][stage] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"✗ {e}")
+                continue
+            results["stages"][stage] = row
+            print(f"{row['median_ms']:.2f} ms")
+    return results
+
+
+def compare_results(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    """
+    对比两次结果中每个阶段耗时的中位数。
+
+    返回:
+        list: 两次都成功的每个阶段一项，包含 stage、baseline_ms、candidate_ms、ratio 和 regression
+    """
+    rows = []
+    for stage, base in baseline["stages"].items():
+        new = candidate["stages"].get(stage)
+        if new is None or "error" in base or "error" in new:
+            continue
+        ratio = new["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        rows.append({
+            "stage": stage,
+            "baseline_ms": base["median_ms"],
+            "candidate_ms": new["median_ms"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def _load_backend(args):
+    if not args.real_model:
+        return FakeMoveNet(ms_per_frame=args.fake_ms)
+    import tensorflow as tf
+
+    if not args.gpu:
+        tf.config.set_visible_devices([], "GPU")
+    from pose_detection.registry import get_model
+
+    model, _ = get_model(args.variant)
+    return model
+
+
+def _run(args):
+    stages = [stage.strip() for stage in args.stages.split(",")] if args.stages else list(STAGES)
+    unknown = [stage for stage in stages if stage not in _BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"未知的阶段: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+    width, _, height = args.video_size.partition("x")
+    results = run_suite(
+        stages, args.frames, args.fps, args.cadence, (int(width), int(height)),
+        args.repeats, _load_backend(args), args.batch_size, args.retrieval,
+    )
+    output = args.output or f"benchmark-{(results['commit'] or 'local')[:12]}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"✓ 结果已写入 {output}")
+
+
+def _compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline.get("config") != candidate.get("config"):
+        print("注意：两次运行的配置不同，结果可能不可比")
+    print(f"{'':>2}{'stage':<10} {'baseline_ms':>12} {'candidate_ms':>13} {'change':>8}")
+    rows = compare_results(baseline, candidate, args.threshold)
+    for row in rows:
+        status = "✗" if row["regression"] else "✓"
+        print(
+            f"{status} {row['stage']:<10} {row['baseline_ms']:>12.3f} {row['candidate_ms']:>13.3f} "
+            f"{(row['ratio'] - 1) * 100:>+7.1f}%"
+        )
+    regressions = [row["stage"] for row in rows if row["regression"]]
+    if regressions:
+        # 非零退出码，便于在CI中发现性能退化
+        print(f"变慢超过 {args.threshold:.0%} 的阶段: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成数据上的分阶段基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试并把结果写入JSON文件")
+    run_parser.add_argument("--output", default=None, help="结果文件，默认 benchmark-<commit>.json")
+    run_parser.add_argument("--stages", default=None, help=f"逗号分隔的阶段，默认全部: {','.join(STAGES)}")
+    run_parser.add_argument("--frames", type=int, default=300, help="合成视频的帧数")
+    run_parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="合成视频的帧率")
+    run_parser.add_argument("--cadence", type=float, default=DEFAULT_CADENCE_RPM, help="合成骑手的踏频（转/分钟）")
+    run_parser.add_argument("--video-size", default="640x480", help="合成视频的尺寸，宽x高")
+    run_parser.add_argument("--repeats", type=int, default=5, help="每个阶段计时的次数")
+    run_parser.add_argument("--batch-size", type=int, default=8, help="裁剪和推理的batch_size")
+    run_parser.add_argument("--real-model", action="store_true", help="使用真实的MoveNet模型（POSE_BACKEND），默认使用假模型")
+    run_parser.add_argument("--variant", default="thunder", help="真实模型的变体")
+    run_parser.add_argument("--fake-ms", type=float, default=0.0, help="假模型每帧额外等待的毫秒数")
+    run_parser.add_argument("--gpu", action="store_true", help="真实模型允许使用GPU，默认只在CPU上测试")
+    run_parser.add_argument("--retrieval", choices=("fake", "real"), default="fake", help="知识库检索使用假嵌入还是真实知识库")
+    run_parser.set_defaults(func=_run)
+
+    compare_parser = subparsers.add_parser("compare", help="对比两次结果，有阶段变慢超过阈值时退出码为1")
+    compare_parser.add_argument("baseline", help="基准结果文件")
+    compare_parser.add_argument("candidate", help="对比的结果文件")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许变慢的比例")
+    compare_parser.set_defaults(func=_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
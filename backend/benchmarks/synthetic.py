@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+
+from pose_detection.keypoints import KEYPOINT_DICT
+
+# 程序功能：生成合成的骑行关键点轨迹和视频。骑手的腿按给定踏频绕中轴转动，膝盖位置由大腿和小腿长度反解，
+# 基准测试不需要真实的视频、模型或网络，同样的参数每次生成完全相同的数据
+
+DEFAULT_FPS = 30
+DEFAULT_CADENCE_RPM = 90
+DEFAULT_VIDEO_SIZE = (640, 480)
+
+# 骑手各部位的尺寸和位置，坐标为画面归一化的 (y, x)，x方向按骑手朝向取正负
+_HIP = np.array([0.42, 0.5])
+_BOTTOM_BRACKET = np.array([0.32, 0.05])  # 中轴相对髋部的位置
+_THIGH = 0.22
+_SHIN = 0.22
+_CRANK = 0.09
+_UPPER_BODY = {
+    "shoulder": np.array([-0.22, 0.2]),  # 相对髋部
+    "elbow": np.array([0.12, 0.07]),  # 相对肩膀
+    "wrist": np.array([0.03, 0.12]),  # 相对手肘
+    "nose": np.array([-0.08, 0.08]),  # 相对肩膀
+}
+_HEAD_OFFSETS = {"eye": np.array([-0.015, -0.01]), "ear": np.array([-0.01, -0.05])}  # 相对鼻子
+# 靠近镜头一侧和远离镜头一侧关键点的置信度
+_NEAR_SCORE = 0.9
+_FAR_SCORE = 0.6
+
+# 绘制视频时连接的关键点
+SKELETON_EDGES = [
+    ("shoulder", "elbow"), ("elbow", "wrist"), ("shoulder", "hip"),
+    ("hip", "knee"), ("knee", "ankle"),
+]
+
+
+#两段连杆的反解：已知髋部和脚踝，求膝盖的位置，膝盖总是朝向骑手前方
+def _solve_knee(hip, ankle, forward):
+    v = ankle - hip
+    d = np.linalg.norm(v, axis=-1, keepdims=True)
+    a = (_THIGH ** 2 - _SHIN ** 2 + d ** 2) / (2 * d)
+    h = np.sqrt(np.maximum(_THIGH ** 2 - a ** 2, 0))
+    perpendicular = np.stack([-v[:, 1], v[:, 0]], axis=-1) / d
+    return hip + a * v / d + forward * h * perpendicular
+
+
+def synthetic_track(num_frames=300, fps=DEFAULT_FPS, cadence=DEFAULT_CADENCE_RPM, facing_side="left",
+                    noise=0.003, seed=0):
+    """
+    生成一段合成的骑行关键点轨迹。
+
+    参数:
+        num_frames (int): 帧数
+        fps (float): 帧率
+        cadence (float): 踏频（转/分钟）
+        facing_side (str): 靠近镜头的一侧，'left' 时骑手朝画面左侧骑行
+        noise (float): 关键点坐标的高斯噪声标准差（相对画面）
+        seed (int): 随机数种子
+
+    返回:
+        tuple: (keypoints, timestamps)，keypoints 是 (N,17,3) 的 float32 数组 {y, x, score}，timestamps 是每帧的秒数
+    """
+    rng = np.random.default_rng(seed)
+    far_side = "right" if facing_side == "left" else "left"
+    # 朝画面左侧骑行时前方为 -x
+    forward = -1.0 if facing_side == "left" else 1.0
+    flip = np.array([1.0, forward])
+
+    timestamps = np.arange(num_frames) / fps
+    crank_angle = 2 * np.pi * cadence / 60 * timestamps
+    hip = np.repeat(_HIP[None, :], num_frames, axis=0)
+    bottom_bracket = _HIP + _BOTTOM_BRACKET * flip
+
+    keypoints = np.zeros((num_frames, 17, 3), dtype=np.float32)
+    for side, phase, score in ((facing_side, 0.0, _NEAR_SCORE), (far_side, np.pi, _FAR_SCORE)):
+        angle = crank_angle + phase
+        ankle = bottom_bracket + _CRANK * np.stack([np.sin(angle), forward * np.cos(angle)], axis=-1)
+        knee = _solve_knee(hip, ankle, forward)
+        shoulder = _HIP + _UPPER_BODY["shoulder"] * flip
+        elbow = shoulder + _UPPER_BODY["elbow"] * flip
+        wrist = elbow + _UPPER_BODY["wrist"] * flip
+        for name, position in (("hip", hip), ("knee", knee), ("ankle", ankle),
+                               ("shoulder", shoulder), ("elbow", elbow), ("wrist", wrist)):
+            index = KEYPOINT_DICT[f"{side}_{name}"]
+            keypoints[:, index, :2] = position
+            keypoints[:, index, 2] = score
+
+    nose = _HIP + (_UPPER_BODY["shoulder"] + _UPPER_BODY["nose"]) * flip
+    keypoints[:, KEYPOINT_DICT["nose"], :2] = nose
+    for side in ("left", "right"):
+        for name, offset in _HEAD_OFFSETS.items():
+            keypoints[:, KEYPOINT_DICT[f"{side}_{name}"], :2] = nose + offset * flip
+    for name in ("nose", "left_eye", "right_eye", "left_ear", "right_ear"):
+        keypoints[:, KEYPOINT_DICT[name], 2] = _NEAR_SCORE
+
+    keypoints[:, :, :2] += rng.normal(0, noise, size=(num_frames, 17, 2))
+    return keypoints, timestamps
+
+
+def render_frames(keypoints, size=DEFAULT_VIDEO_SIZE, seed=0):
+    """
+    把关键点轨迹画成骑手的火柴人图像，背景带有固定的纹理，使视频编码和解码的开销接近真实视频。
+
+    参数:
+        keypoints: (N,17,3) 关键点
+        size (tuple): 图像的 (宽, 高)
+
+    返回:
+        generator: 每次产出一帧 (高, 宽, 3) 的 BGR uint8 图像
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    background = rng.integers(90, 150, size=(height, width, 3), dtype=np.uint8)
+    scale = np.array([height, width])
+    for frame in keypoints:
+        image = background.copy()
+        for side, color in (("right", (90, 90, 200)), ("left", (40, 200, 240))):
+            points = {
+                name: tuple(int(v) for v in (frame[KEYPOINT_DICT[f"{side}_{name}"], :2] * scale)[::-1])
+                for name in ("shoulder", "elbow", "wrist", "hip", "knee", "ankle")
+            }
+            for start, end in SKELETON_EDGES:
+                cv2.line(image, points[start], points[end], color, thickness=max(2, height // 80))
+        nose = tuple(int(v) for v in (frame[KEYPOINT_DICT["nose"], :2] * scale)[::-1])
+        cv2.circle(image, nose, max(4, height // 30), (200, 180, 160), thickness=-1)
+        yield image
+
+
+def write_synthetic_video(path, keypoints, fps=DEFAULT_FPS, size=DEFAULT_VIDEO_SIZE):
+    """把 render_frames 的图像编码为mp4视频，返回写入的帧数。"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"无法写入视频: {path}")
+    count = 0
+    try:
+        for image in render_frames(keypoints, size):
+            writer.write(image)
+            count += 1
+    finally:
+        writer.release()
+    return count
@@ -1,8 +1,10 @@
 from typing import Dict, Any
 import os
-from pose_detection import upload_video
-from local_model import LocalModelProcessor
-from api_model import APIModelProcessor
+
+from telemetry import time_stream
+
+# 提示词的版本号，修改 generate_prompt 时需要递增，使缓存的建议失效
+PROMPT_VERSION = "1"
 
 class BikeFitAdvisor:
     def __init__(self, use_api: bool = False, api_key: str = None):
@@ -25,9 +27,14 @@ class BikeFitAdvisor:
         if use_api:
             if not api_key:
                 raise ValueError("使用API模式时必须提供API密钥")
+            from api_model import APIModelProcessor
+
             self.model = APIModelProcessor(api_key)
             print("使用在线API模式")
         else:
+            # 本地模型需要torch和transformers，只在使用时导入
+            from local_model import LocalModelProcessor
+
             self.model = LocalModelProcessor()
             print("使用本地模型模式")
 
@@ -66,6 +73,8 @@ class BikeFitAdvisor:
                 raise FileNotFoundError(f"视频文件不存在: {abs_video_path}")
                 
             # 获取姿态数据
+            from pose_detection import upload_video
+
             pose_data = upload_video(abs_video_path)
             
             # 提取需要分析的测量数据
@@ -153,7 +162,9 @@ class BikeFitAdvisor:
         is_answering = False
 
 
-        for reasoning, content in self.model.generate_response(test_prompt):
+        # 记录首个片段的延迟和生成速度，见 telemetry.time_stream
+        model_name = self.model.model_name
+        for reasoning, content in time_stream(self.model.generate_response(test_prompt), model_name):
             if reasoning:
                 full_reasoning += reasoning
                 yield {"type": "reasoning", "message": reasoning}
@@ -10,6 +10,7 @@ import shutil
 class LocalModelProcessor:
     def __init__(self, model_name: str = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"):
         """初始化本地模型处理器"""
+        self.model_name = model_name
         self.device = self._get_optimal_device()
         print(f"Using local model on device: {self.device}")
         
@@ -7,7 +7,7 @@ from llama_index.embeddings.dashscope import (
     DashScopeTextEmbeddingType,
 )
 from llama_index.postprocessor.dashscope_rerank import DashScopeRerank
-from .create_kb import *
+from telemetry import span, time_stream
 DB_PATH = "VectorStore"
 TMP_NAME = "tmp_abcd"
 EMBED_MODEL = DashScopeEmbedding(
@@ -31,25 +31,31 @@ def get_model_response(multi_modal_input,history,model,temperature,max_tokens,hi
         db_name = TMP_NAME
     else:
         if tmp_files:
+            # 创建知识库需要gradio和pandas，只在上传了临时文件时导入
+            from .create_kb import create_tmp_kb
             create_tmp_kb(tmp_files)
             db_name = TMP_NAME
     # 获取index
     print(f"prompt:{prompt},tmp_files:{tmp_files},db_name:{db_name}")
     try:
         dashscope_rerank = DashScopeRerank(top_n=chunk_cnt,return_documents=True)
-        storage_context = StorageContext.from_defaults(
-            persist_dir=os.path.join(DB_PATH,db_name)
-        )
-        index = load_index_from_storage(storage_context)
+        with span("rag.load_index", db=db_name):
+            storage_context = StorageContext.from_defaults(
+                persist_dir=os.path.join(DB_PATH,db_name)
+            )
+            index = load_index_from_storage(storage_context)
         print("index获取完成")
         retriever_engine = index.as_retriever(
             similarity_top_k=20,
         )
         # 获取chunk
-        retrieve_chunk = retriever_engine.retrieve(prompt)
+        with span("rag.retrieve") as attrs:
+            retrieve_chunk = retriever_engine.retrieve(prompt)
+            attrs["chunks"] = len(retrieve_chunk)
         print(f"原始chunk为：{retrieve_chunk}")
         try:
-            results = dashscope_rerank.postprocess_nodes(retrieve_chunk, query_str=prompt)
+            with span("rag.rerank"):
+                results = dashscope_rerank.postprocess_nodes(retrieve_chunk, query_str=prompt)
             print(f"rerank成功，重排后的chunk为：{results}")
         except:
             results = retrieve_chunk[:chunk_cnt]
@@ -87,7 +93,7 @@ def get_model_response(multi_modal_input,history,model,temperature,max_tokens,hi
         stream=True
         )
     assistant_response = ""
-    for chunk in completion:
+    for chunk in time_stream(completion, model):
         assistant_response += chunk.choices[0].delta.content
         history[-1][-1] = assistant_response
         yield history,chunk_show
\ No newline at end of file
@@ -1,28 +1,61 @@
-from .pose_analyzer import upload_video, init, get_pose
-from .model import load_model_from_tfhub, get_keypoints_from_video
-from .preprocessing import pre_process_video
-from .postprocessing import (
-    find_camera_facing_side,
-    get_front_keypoint_indices,
-    get_lowest_pedal_frames,
-    get_highest_pedal_frames,
-    filter_bad_knee_angles,
-    get_hip_knee_ankle_angle,
-    calculate_angle
-)
+import importlib
 
-__all__ = [
-    'upload_video',
-    'init',
-    'get_pose',
-    'load_model_from_tfhub',
-    'get_keypoints_from_video',
-    'pre_process_video',
-    'find_camera_facing_side',
-    'get_front_keypoint_indices',
-    'get_lowest_pedal_frames',
-    'get_highest_pedal_frames',
-    'filter_bad_knee_angles',
-    'get_hip_knee_ankle_angle',
-    'calculate_angle'
-]
+# 导出的名称及其所在的模块。模块在第一次访问对应的名称时才导入，
+# 导入 pose_detection 本身不会加载TensorFlow、OpenCV等较慢的依赖
+_EXPORTS = {
+    'upload_video': 'pose_analyzer',
+    'init': 'pose_analyzer',
+    'get_pose': 'pose_analyzer',
+    'load_model_from_tfhub': 'model',
+    'get_keypoints_from_video': 'model',
+    'InferenceBackend': 'backends',
+    'SavedModelBackend': 'backends',
+    'TFLiteBackend': 'backends',
+    'ONNXRuntimeBackend': 'backends',
+    'load_backend': 'backends',
+    'ArtifactError': 'artifacts',
+    'verify_artifact': 'artifacts',
+    'DynamicBatcher': 'batcher',
+    'ModelRegistry': 'registry',
+    'get_model': 'registry',
+    'is_model_ready': 'registry',
+    'KeypointStore': 'keypoint_store',
+    'get_keypoint_store': 'keypoint_store',
+    'PoseTrack': 'pose_track',
+    'pre_process_video': 'preprocessing',
+    'iter_video_frames': 'preprocessing',
+    'stream_video_frames': 'preprocessing',
+    'read_video_frames': 'preprocessing',
+    'FrameBuffer': 'preprocessing',
+    'read_video_frames_parallel': 'segment_decoder',
+    'OnlinePeakDetector': 'stroke_detector',
+    'PedalStrokeDetector': 'stroke_detector',
+    'detect_strokes': 'stroke_detector',
+    'ConvergenceMonitor': 'convergence',
+    'find_camera_facing_side': 'postprocessing',
+    'get_front_keypoint_indices': 'postprocessing',
+    'get_lowest_pedal_frames': 'postprocessing',
+    'get_highest_pedal_frames': 'postprocessing',
+    'filter_bad_knee_angles': 'postprocessing',
+    'get_hip_knee_ankle_angle': 'postprocessing',
+    'get_frame_rate': 'postprocessing',
+    'get_peak_distance': 'postprocessing',
+    'get_joint_angle_triplets': 'postprocessing',
+    'calculate_angle': 'postprocessing',
+    'calculate_angles': 'postprocessing',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
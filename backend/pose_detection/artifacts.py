@@ -0,0 +1,201 @@
+"""""" """""" """""" """""" """
+ MODEL ARTIFACTS 本地模型文件的校验和获取
+ 用法: python -m pose_detection.artifacts fetch --variant thunder
+       python -m pose_detection.artifacts verify
+       python -m pose_detection.artifacts manifest --variant thunder --dir "../thunder model"
+""" """""" """""" """""" """"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# 程序功能：模型目录中的 manifest.json 记录每个文件的sha256，加载模型前校验，服务器运行时不需要联网下载模型
+
+MANIFEST_NAME = "manifest.json"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 每个模型变体一个本地目录：依次查找仓库根目录下的 "<变体> model"（模型随仓库提供的位置）和 backend 下的同名目录
+_MODEL_DIR_CANDIDATES = [
+    os.path.dirname(_BACKEND_DIR),
+    _BACKEND_DIR,
+]
+# 本地没有模型时是否允许通过kagglehub下载，POSE_MODEL_DOWNLOAD=0 时只使用本地模型
+ALLOW_DOWNLOAD = os.getenv("POSE_MODEL_DOWNLOAD", "1") != "0"
+
+# 已经校验过的目录：path -> 校验时每个文件的 (大小, 修改时间)
+_verified = {}
+_verified_lock = threading.Lock()
+
+
+class ArtifactError(ValueError):
+    """Raised when a model directory is missing files or a checksum does not match."""
+
+
+def default_model_dir(variant="thunder"):
+    """
+    返回模型变体的默认本地目录，都不存在时返回第一个候选目录。
+
+    设置了 POSE_MODEL_DIR 时，其中有以变体命名的子目录（<POSE_MODEL_DIR>/<变体>）则使用子目录，
+    否则把 POSE_MODEL_DIR 本身作为这个变体的目录，由 manifest.json 中记录的变体防止加载错误的模型。
+    """
+    configured = os.getenv("POSE_MODEL_DIR")
+    if configured:
+        per_variant = os.path.join(configured, variant)
+        return per_variant if os.path.isdir(per_variant) else configured
+    candidates = [os.path.join(parent, f"{variant} model") for parent in _MODEL_DIR_CANDIDATES]
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            return candidate
+    return candidates[0]
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _model_files(model_dir):
+    for root, _, names in os.walk(model_dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, model_dir)
+            if relative != MANIFEST_NAME:
+                yield relative.replace(os.sep, "/"), path
+
+
+def write_manifest(model_dir, source=None, variant=None):
+    """
+    计算目录中每个文件的sha256，写入 manifest.json。
+
+    参数:
+        model_dir (str): 模型目录
+        source (str): 可选的模型来源，记录在manifest中
+        variant (str): 可选的模型变体，记录在manifest中，加载其他变体时校验失败
+
+    返回:
+        dict: 写入的manifest
+    """
+    manifest = {
+        "source": source,
+        "variant": variant,
+        "files": {relative: _sha256(path) for relative, path in _model_files(model_dir)},
+    }
+    with open(os.path.join(model_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def has_manifest(model_dir):
+    return bool(model_dir) and os.path.exists(os.path.join(model_dir, MANIFEST_NAME))
+
+
+def read_manifest(model_dir):
+    """
+    读取模型目录中的 manifest.json。
+
+    异常:
+        ArtifactError: 没有manifest或格式不正确
+    """
+    manifest_path = os.path.join(model_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"无法读取模型清单 {manifest_path}: {e}") from e
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+        raise ArtifactError(f"无法读取模型清单 {manifest_path}: 缺少 files")
+    return manifest
+
+
+def verify_artifact(model_dir, variant=None):
+    """
+    按 manifest.json 校验模型目录中的每个文件。同一进程中文件没有变化时只校验一次。
+
+    参数:
+        model_dir (str): 模型目录
+        variant (str): 期望的模型变体，manifest中记录了其他变体时校验失败；没有记录变体的旧manifest不检查
+
+    异常:
+        ArtifactError: 没有manifest、变体不一致、缺少文件或sha256不一致
+    """
+    manifest = read_manifest(model_dir)
+    recorded = manifest.get("variant")
+    if variant and recorded and recorded != variant:
+        raise ArtifactError(f"{model_dir} 中是 {recorded} 模型，不是 {variant}")
+    files = manifest["files"]
+
+    paths = {relative: os.path.join(model_dir, *relative.split("/")) for relative in files}
+    try:
+        stats = {relative: (os.path.getsize(path), os.path.getmtime(path)) for relative, path in paths.items()}
+    except OSError as e:
+        raise ArtifactError(f"模型文件缺失: {e.filename}") from e
+    key = os.path.abspath(model_dir)
+    with _verified_lock:
+        if _verified.get(key) == stats:
+            return
+
+    for relative, expected in files.items():
+        if _sha256(paths[relative]) != expected:
+            raise ArtifactError(f"模型文件校验失败: {relative}，请重新获取模型（python -m pose_detection.artifacts fetch）")
+    with _verified_lock:
+        _verified[key] = stats
+
+
+def fetch_artifact(variant="thunder", model_dir=None):
+    """
+    通过kagglehub下载MoveNet SavedModel，复制到本地模型目录并写入manifest。只需要在部署时运行一次。
+
+    参数:
+        variant (str): 模型变体
+        model_dir (str): 目标目录，默认是这个变体的目录（见 default_model_dir）
+
+    返回:
+        str: 模型目录
+
+    异常:
+        ArtifactError: 目标目录的manifest中记录的是其他变体，不覆盖
+    """
+    model_dir = model_dir or default_model_dir(variant)
+    if has_manifest(model_dir):
+        recorded = read_manifest(model_dir).get("variant")
+        if recorded and recorded != variant:
+            raise ArtifactError(f"{model_dir} 中已经是 {recorded} 模型，请用 --dir 指定 {variant} 模型的目录")
+    import kagglehub
+
+    source = f"google/movenet/tensorFlow2/singlepose-{variant}"
+    path = kagglehub.model_download(source)
+    shutil.copytree(path, model_dir, dirs_exist_ok=True)
+    write_manifest(model_dir, source, variant)
+    return model_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地MoveNet模型文件的获取和校验")
+    parser.add_argument("command", choices=("fetch", "verify", "manifest"))
+    parser.add_argument("--dir", default=None, help="模型目录，默认使用 POSE_MODEL_DIR 或仓库根目录下的 \"<变体> model\"")
+    parser.add_argument("--variant", default="thunder", help="模型变体，fetch 时下载、manifest 时记录、verify 时检查")
+    args = parser.parse_args()
+
+    model_dir = args.dir or default_model_dir(args.variant)
+    if args.command == "fetch":
+        print(f"✓ 模型已保存到 {fetch_artifact(args.variant, model_dir)}")
+    elif args.command == "manifest":
+        manifest = write_manifest(model_dir, variant=args.variant)
+        print(f"✓ 已写入 {len(manifest['files'])} 个文件的sha256")
+    else:
+        try:
+            verify_artifact(model_dir, args.variant)
+        except ArtifactError as e:
+            raise SystemExit(f"✗ {e}")
+        print(f"✓ {model_dir} 校验通过")
+
+
+if __name__ == "__main__":
+    main()
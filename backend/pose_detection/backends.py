@@ -0,0 +1,313 @@
+"""""" """""" """""" """""" """
+ INFERENCE BACKENDS 不同推理引擎的统一接口
+ SavedModel(TF-Hub) / TFLite(XNNPACK) / ONNX Runtime
+""" """""" """""" """""" """"""
+
+import glob
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from pose_detection.artifacts import ALLOW_DOWNLOAD, default_model_dir, has_manifest, verify_artifact
+
+# 支持的模型变体及其对应的输入尺寸
+MODEL_VARIANTS = {
+    "thunder": 256,
+    "lightning": 192,
+}
+
+# thunder模型的本地目录，可以放置 saved_model.pb、*.tflite 或 *.onnx，以及校验用的 manifest.json（见 artifacts.py）。
+# 其他变体的目录见 default_model_dir
+LOCAL_MODEL_DIR = default_model_dir()
+
+
+class InferenceBackend:
+    """Common interface of every MoveNet inference engine.
+
+    A backend takes a batch of already cropped and resized frames and returns
+    the raw model output, i.e. keypoints relative to the crop.
+    """
+
+    name = "base"
+    # 模型是否有真正的batch维度，一次调用可以推理多张图像；为False时多张图像在infer中逐张推理
+    batched = False
+
+    def __init__(self, input_size):
+        self.input_size = input_size
+
+    def infer(self, input_images):
+        """Runs the model on a batch of images.
+
+        Args:
+            input_images: a [B, input_size, input_size, 3] tensor or array with
+                RGB values in [0, 255]
+        Returns:
+            A [B, 17, 3] float32 numpy array with the {y, x, confidence} of every keypoint.
+        """
+        raise NotImplementedError
+
+
+class SavedModelBackend(InferenceBackend):
+    """Runs the TF-Hub SavedModel `serving_default` signature."""
+
+    name = "savedmodel"
+
+    def __init__(self, signature, input_size, module=None):
+        super().__init__(input_size)
+        self.signature = signature
+        if module is not None:
+            # this prevents the python 3.8.x garbage collector from
+            # deleting variable references if the model is stored in memory for a long time
+            signature._backref_to_saved_model = module
+        self.batched = _accepts_batches(signature)
+
+    @classmethod
+    def from_tfhub(cls, variant="thunder"):
+        if not ALLOW_DOWNLOAD:
+            raise FileNotFoundError(
+                "本地没有SavedModel且 POSE_MODEL_DOWNLOAD=0，请先运行 python -m pose_detection.artifacts fetch"
+            )
+        import kagglehub
+
+        path = kagglehub.model_download(f"google/movenet/tensorFlow2/singlepose-{variant}")
+        return cls.from_directory(path, variant)
+
+    @classmethod
+    def from_directory(cls, path, variant="thunder"):
+        import tensorflow_hub as hub
+
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"未知的模型变体: {variant}")
+        module = hub.load(path)
+        return cls(module.signatures["serving_default"], MODEL_VARIANTS[variant], module)
+
+    def infer(self, input_images):
+        # SavedModel format expects tensor type of int32.
+        input_images = tf.cast(input_images, dtype=tf.int32)
+        if self.batched:
+            outputs = self.signature(input=input_images)["output_0"]
+        else:
+            # 签名的batch维度固定为1时逐张调用，但仍然只在最后同步一次
+            outputs = tf.concat(
+                [self.signature(input=input_images[i : i + 1])["output_0"] for i in range(input_images.shape[0])],
+                axis=0,
+            )
+        # output_0 is a [B,1,17,3] array
+        return outputs.numpy().reshape(-1, 17, 3)
+
+
+# TFLite模型支持的精度，以及本地目录中对应的文件名模式
+TFLITE_PRECISIONS = {
+    "fp32": ("*float32*.tflite", "model.tflite"),
+    "fp16": ("*float16*.tflite", "*fp16*.tflite"),
+    "int8": ("*int8*.tflite",),
+}
+# TF-Hub(Kaggle)上官方发布的降低精度的tflite模型
+_KAGGLE_TFLITE_SUFFIXES = {"fp16": "float16", "int8": "int8"}
+
+
+class TFLiteBackend(InferenceBackend):
+    """Runs a MoveNet .tflite file with the TFLite interpreter.
+
+    The default op resolver applies the XNNPACK delegate to float models on CPU.
+    The precision (fp32, fp16 or int8) is part of the backend name, so results
+    of different precisions are never mixed up, e.g. in the keypoint store.
+    """
+
+    def __init__(self, model_path, num_threads=None, use_xnnpack=True, precision="fp32"):
+        self.name = "tflite" if precision == "fp32" else f"tflite-{precision}"
+        self.precision = precision
+        resolver = (
+            tf.lite.experimental.OpResolverType.AUTO
+            if use_xnnpack
+            else tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        )
+        self.interpreter = tf.lite.Interpreter(
+            model_path=model_path,
+            num_threads=num_threads or os.cpu_count(),
+            experimental_op_resolver_type=resolver,
+        )
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        # 解释器不是线程安全的
+        self._lock = threading.Lock()
+        super().__init__(int(self._input["shape"][1]))
+
+    def infer(self, input_images):
+        input_images = np.asarray(input_images).astype(self._input["dtype"], copy=False)
+        keypoints = np.empty((input_images.shape[0], 17, 3), dtype=np.float32)
+        with self._lock:
+            # MoveNet的tflite模型batch维度固定为1
+            for i in range(input_images.shape[0]):
+                self.interpreter.set_tensor(self._input["index"], input_images[i : i + 1])
+                self.interpreter.invoke()
+                keypoints[i] = self.interpreter.get_tensor(self._output["index"]).reshape(17, 3)
+        return keypoints
+
+
+# onnx输入类型到numpy类型的映射
+_ONNX_DTYPES = {
+    "tensor(int32)": np.int32,
+    "tensor(uint8)": np.uint8,
+    "tensor(float)": np.float32,
+}
+
+
+class ONNXRuntimeBackend(InferenceBackend):
+    """Runs a MoveNet .onnx file (e.g. converted with tf2onnx) with ONNX Runtime on CPU."""
+
+    name = "onnx"
+
+    def __init__(self, model_path, num_threads=None, input_size=MODEL_VARIANTS["thunder"]):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("使用ONNX后端需要安装 onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or os.cpu_count()
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input_dtype = _ONNX_DTYPES.get(model_input.type, np.int32)
+        self.batched = not isinstance(model_input.shape[0], int) or model_input.shape[0] > 1
+        if isinstance(model_input.shape[1], int):
+            input_size = model_input.shape[1]
+        super().__init__(input_size)
+
+    def infer(self, input_images):
+        input_images = np.asarray(input_images).astype(self._input_dtype, copy=False)
+        if self.batched:
+            outputs = self.session.run(None, {self._input_name: input_images})[0]
+        else:
+            outputs = np.concatenate(
+                [
+                    self.session.run(None, {self._input_name: input_images[i : i + 1]})[0]
+                    for i in range(input_images.shape[0])
+                ]
+            )
+        return outputs.reshape(-1, 17, 3).astype(np.float32, copy=False)
+
+
+#判断模型签名是否接受batch大于1的输入
+def _accepts_batches(signature):
+    try:
+        batch_dim = signature.structured_input_signature[1]["input"].shape[0]
+    except (AttributeError, KeyError, IndexError, TypeError):
+        return False
+    return batch_dim is None or batch_dim > 1
+
+
+#在模型目录中查找指定后缀的模型文件，按顺序尝试每个模式；给出variant时跳过文件名中写着其他变体的文件
+def _find_model_file(model_dir, *patterns, variant=None):
+    others = [other for other in MODEL_VARIANTS if other != variant] if variant else []
+    for pattern in patterns:
+        matches = [
+            path
+            for path in sorted(glob.glob(os.path.join(model_dir, pattern)))
+            if not any(other in os.path.basename(path).lower() for other in others)
+        ]
+        if matches:
+            return matches[0]
+    raise FileNotFoundError(f"在 {model_dir} 中找不到 {' / '.join(patterns)} 模型文件")
+
+
+#查找指定精度的tflite文件，本地没有降低精度的模型时从Kaggle下载官方版本
+def _find_tflite_file(model_dir, variant, precision):
+    if precision not in TFLITE_PRECISIONS:
+        raise ValueError(f"未知的模型精度: {precision}，可选: {', '.join(TFLITE_PRECISIONS)}")
+    patterns = TFLITE_PRECISIONS[precision]
+    if precision == "fp32":
+        # 兼容只放了一个未标注精度的 .tflite 文件的目录
+        patterns = patterns + ("*.tflite",)
+    try:
+        return _find_model_file(model_dir, *patterns, variant=variant)
+    except FileNotFoundError:
+        if precision not in _KAGGLE_TFLITE_SUFFIXES or not ALLOW_DOWNLOAD:
+            raise
+    import kagglehub
+
+    path = kagglehub.model_download(
+        f"google/movenet/tfLite/singlepose-{variant}-tflite-{_KAGGLE_TFLITE_SUFFIXES[precision]}"
+    )
+    return _find_model_file(path, "*.tflite")
+
+
+def convert_to_tflite(saved_model_dir, output_path, precision="fp16", representative_frames=None):
+    """
+    将SavedModel转换为降低精度的tflite模型。
+
+    参数:
+        saved_model_dir (str): SavedModel目录
+        output_path (str): 输出的 .tflite 文件路径，建议文件名包含 float16 / int8 以便 load_backend 找到
+        precision (str): "fp32"、"fp16"（float16权重）或 "int8"
+        representative_frames: int8时可选的代表性输入 [N, size, size, 3]，提供时对激活值也做量化，
+            否则只对权重做动态范围量化
+    """
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if precision != "fp32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif precision == "int8" and representative_frames is not None:
+        def representative_dataset():
+            for frame in representative_frames:
+                yield [tf.cast(frame[None, ...], tf.int32)]
+
+        converter.representative_dataset = representative_dataset
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+
+BACKENDS = ("savedmodel", "tflite", "tflite-fp16", "tflite-int8", "onnx")
+
+
+def load_backend(name="savedmodel", model_dir=None, variant="thunder", num_threads=None):
+    """
+    加载指定的推理后端。
+
+    参数:
+        name (str): 后端名称，"savedmodel"、"tflite"、"tflite-fp16"、"tflite-int8" 或 "onnx"
+        model_dir (str): 本地模型目录，默认是这个变体的目录（见 default_model_dir）。目录中有 manifest.json 时
+            先校验文件的sha256和记录的变体，不一致时抛出 ArtifactError
+        variant (str): 模型变体，决定SavedModel的输入尺寸，以及在目录中选择哪个 .tflite / .onnx 文件
+        num_threads (int): TFLite/ONNX使用的CPU线程数，默认使用所有核心
+
+    返回:
+        InferenceBackend: 加载好的推理后端
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"未知的模型变体: {variant}")
+    model_dir = model_dir or default_model_dir(variant)
+    if has_manifest(model_dir):
+        verify_artifact(model_dir, variant)
+    if name == "savedmodel":
+        # 本地目录中有SavedModel时直接加载，不需要联网；否则从TF-Hub下载
+        if model_dir and os.path.exists(os.path.join(model_dir, "saved_model.pb")):
+            return SavedModelBackend.from_directory(model_dir, variant)
+        return SavedModelBackend.from_tfhub(variant)
+    if name == "tflite" or name.startswith("tflite-"):
+        precision = name.partition("-")[2] or "fp32"
+        return TFLiteBackend(
+            _find_tflite_file(model_dir, variant, precision), num_threads=num_threads, precision=precision
+        )
+    if name == "onnx":
+        return ONNXRuntimeBackend(
+            _find_model_file(model_dir, "*.onnx", variant=variant),
+            num_threads=num_threads,
+            input_size=MODEL_VARIANTS[variant],
+        )
+    raise ValueError(f"未知的推理后端: {name}，可选: {', '.join(BACKENDS)}")
+
+
+def as_backend(model):
+    """将旧代码中直接传入的SavedModel签名包装为推理后端，已经是后端则原样返回。"""
+    if isinstance(model, InferenceBackend):
+        return model
+    return SavedModelBackend(model, MODEL_VARIANTS["thunder"])
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from pose_detection.backends import InferenceBackend
+
+# 程序功能：跨请求的动态批处理。多个视频同时推理时，把它们裁剪好的输入合并成一批送入模型
+
+
+class DynamicBatcher(InferenceBackend):
+    """Collects cropped inputs from every in-flight video and runs them as one batch.
+
+    Callers use it like any other backend: infer() enqueues each image and
+    blocks until its keypoints come back. A single background thread flushes
+    the queue to the wrapped backend when max_batch_size images are waiting or
+    when the oldest one has waited max_wait_ms. Only worth it for backends
+    with a real batch dimension (InferenceBackend.batched), see registry.py.
+    """
+
+    def __init__(self, backend, max_batch_size=32, max_wait_ms=5.0):
+        """
+        参数:
+            backend (InferenceBackend): 实际执行推理的后端
+            max_batch_size (int): 每批最多的图像数量
+            max_wait_ms (float): 第一张图像进入队列后最多等待的毫秒数
+        """
+        super().__init__(backend.input_size)
+        self.backend = backend
+        self.name = backend.name
+        self.batched = backend.batched
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._wait_seconds = 0.0
+        self._max_queue_depth = 0
+        self._thread = threading.Thread(target=self._run, name="movenet-batcher", daemon=True)
+        self._thread.start()
+
+    def infer(self, input_images):
+        input_images = np.asarray(input_images)
+        futures = []
+        for image in input_images:
+            future = Future()
+            self._queue.put((image, future, time.perf_counter()))
+            futures.append(future)
+        with self._metrics_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return np.stack([future.result() for future in futures])
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = item[2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            keypoints = self.backend.infer(np.stack([image for image, _, _ in batch]))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), keypoints_with_scores in zip(batch, keypoints):
+            future.set_result(keypoints_with_scores)
+
+        with self._metrics_lock:
+            self._batches += 1
+            self._images += len(batch)
+            self._wait_seconds += sum(started - enqueued for _, _, enqueued in batch)
+
+    def metrics(self):
+        """
+        返回批处理的统计信息。
+
+        返回:
+            dict: queue_depth（当前排队的图像数）、max_queue_depth、batches、images、
+                  mean_batch_size、batch_fill（平均每批占 max_batch_size 的比例）、mean_wait_ms
+        """
+        with self._metrics_lock:
+            batches = self._batches
+            images = self._images
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "images": images,
+                "mean_batch_size": images / batches if batches else 0.0,
+                "batch_fill": images / (batches * self.max_batch_size) if batches else 0.0,
+                "mean_wait_ms": self._wait_seconds / images * 1000 if images else 0.0,
+            }
+
+    def close(self):
+        """Flushes the waiting images and stops the background thread."""
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,522 @@
+"""""" """""" """""" """""" """
+ BENCHMARK 推理性能对比工具
+ 用法: python -m pose_detection.benchmark batch --video uploads/raw.mp4
+       python -m pose_detection.benchmark backends --backends savedmodel,tflite,onnx
+       python -m pose_detection.benchmark strided --stride 4
+       python -m pose_detection.benchmark ingest
+       python -m pose_detection.benchmark decode --workers 2,4,8
+       python -m pose_detection.benchmark angles --frames 10000
+       python -m pose_detection.benchmark online --tracks cache/keypoints
+       python -m pose_detection.benchmark convergence --tracks cache/keypoints
+""" """""" """""" """""" """"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from pose_detection.backends import BACKENDS, LOCAL_MODEL_DIR, load_backend
+from pose_detection.convergence import DEFAULT_MAX_CI_DEG, DEFAULT_MIN_STROKES, ConvergenceMonitor
+from pose_detection.keypoint_store import DEFAULT_STORE_DIR
+from pose_detection.model import DEFAULT_BATCH_SIZE, get_keypoints_from_video, get_keypoints_strided
+from pose_detection.pose_analyzer import get_pose
+from pose_detection.pose_track import PoseTrack
+from pose_detection.postprocessing import (
+    JOINT_ANGLE_TRIPLETS,
+    calculate_angle,
+    calculate_angles,
+    get_highest_pedal_frames,
+    get_joint_angle_triplets,
+    get_lowest_pedal_frames,
+)
+from pose_detection.preprocessing import MAX_SECONDS, iter_video_frames, pre_process_video, read_video_frames
+from pose_detection.segment_decoder import _keyframe_indices, _probe, decode_segments
+from pose_detection.registry import get_model
+from pose_detection.stroke_detector import PedalStrokeDetector
+
+
+#统计一次完整推理所需的时间
+def _time_keypoints(video_tensor, model, input_size, batch_size, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        get_keypoints_from_video(video_tensor, model, input_size, batch_size=batch_size)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def benchmark_batch_sizes(video_tensor, model, input_size, batch_sizes=(1, 4, 8, 16, 32), repeats=3):
+    """
+    对比不同batch_size下get_keypoints_from_video的吞吐量。
+
+    参数:
+        video_tensor: 预处理后的视频张量 (num_frames, height, width, 3)
+        model: 用于关键点检测的模型
+        input_size: 模型输入的尺寸
+        batch_sizes: 需要对比的batch_size，batch_size=1 即逐帧推理
+        repeats: 每个batch_size重复的次数，取最快的一次
+
+    返回:
+        list: 每个batch_size一项，包含 batch_size、seconds、fps 和相对逐帧推理的 speedup
+    """
+    num_frames = video_tensor.shape[0]
+    # 先跑一次，排除图追踪等一次性开销
+    get_keypoints_from_video(video_tensor[:1], model, input_size, batch_size=1)
+
+    results = []
+    baseline = None
+    for batch_size in batch_sizes:
+        seconds = _time_keypoints(video_tensor, model, input_size, batch_size, repeats)
+        if baseline is None or batch_size == 1:
+            baseline = seconds
+        results.append({
+            "batch_size": batch_size,
+            "seconds": seconds,
+            "fps": num_frames / seconds,
+            "speedup": baseline / seconds,
+        })
+    return results
+
+
+def compare_backends(video_tensor, backends, batch_size=8, repeats=3):
+    """
+    对比不同推理后端的延迟以及关键点的一致性。
+
+    参数:
+        video_tensor: 预处理后的视频张量 (num_frames, height, width, 3)
+        backends: InferenceBackend 列表，第一个作为关键点一致性的参考
+        batch_size: get_keypoints_from_video 使用的batch_size
+        repeats: 每个后端重复的次数，取最快的一次
+
+    返回:
+        list: 每个后端一项，包含 backend、ms_per_frame、fps，
+              以及与参考后端相比的 mean_coord_diff、max_coord_diff 和 mean_score_diff
+    """
+    num_frames = video_tensor.shape[0]
+    reference = None
+    results = []
+    for backend in backends:
+        keypoints = np.stack(get_keypoints_from_video(video_tensor, backend, batch_size=batch_size))
+        seconds = _time_keypoints(video_tensor, backend, None, batch_size, repeats)
+        if reference is None:
+            reference = keypoints
+        coord_diff = np.abs(keypoints[:, :, :2] - reference[:, :, :2])
+        results.append({
+            "backend": backend.name,
+            "ms_per_frame": seconds / num_frames * 1000,
+            "fps": num_frames / seconds,
+            "mean_coord_diff": float(coord_diff.mean()),
+            "max_coord_diff": float(coord_diff.max()),
+            "mean_score_diff": float(np.abs(keypoints[:, :, 2] - reference[:, :, 2]).mean()),
+        })
+    return results
+
+
+# 跳帧推理后 get_pose 每一项测量结果允许的最大误差（度）
+STRIDED_TOLERANCE_DEG = 2.0
+
+
+def compare_measurements(reference, candidate):
+    """返回两次 get_pose 结果中每一项测量的绝对误差。"""
+    return {key: abs(float(candidate[key]) - float(reference[key])) for key in reference}
+
+
+def compare_strided(video_tensor, model, input_size, strides=(2, 3, 4, 5), batch_size=8):
+    """
+    对比跳帧推理与逐帧推理的推理次数和 get_pose 测量结果。
+
+    返回:
+        list: 每个stride一项，包含 inferred_frames、reduction（推理次数减少的倍数）、
+              measurement_diff（每项测量的绝对误差）和 within_tolerance
+    """
+    num_frames = video_tensor.shape[0]
+    reference = get_pose(get_keypoints_from_video(video_tensor, model, input_size, batch_size=batch_size))
+    results = []
+    for stride in strides:
+        keypoints, inferred = get_keypoints_strided(video_tensor, model, input_size, batch_size, stride)
+        diff = compare_measurements(reference, get_pose(list(keypoints)))
+        results.append({
+            "stride": stride,
+            "inferred_frames": int(inferred.sum()),
+            "reduction": num_frames / max(int(inferred.sum()), 1),
+            "measurement_diff": diff,
+            "within_tolerance": max(diff.values()) <= STRIDED_TOLERANCE_DEG,
+        })
+    return results
+
+
+def compare_ingest(data, methods=("tempfile", "memory"), repeats=3):
+    """
+    对比上传的视频字节数据经过临时文件和直接从内存解码的延迟。
+
+    参数:
+        data (bytes): 视频文件的字节数据
+        methods: 需要对比的读取方式，见 preprocessing.INGEST_METHODS
+        repeats: 每种方式重复的次数，取最快的一次
+
+    返回:
+        list: 每种方式一项，包含 first_frame_ms（从收到数据到第一帧解码完成）、decode_ms（解码全部帧）、
+              frames 和相对第一种方式的 speedup
+    """
+    results = []
+    baseline = None
+    for ingest in methods:
+        first_frame, total, frames = [], [], 0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            frames = 0
+            for _ in iter_video_frames(data, ingest=ingest):
+                if frames == 0:
+                    first_frame.append(time.perf_counter() - start)
+                frames += 1
+            total.append(time.perf_counter() - start)
+        seconds = min(total)
+        if baseline is None:
+            baseline = seconds
+        results.append({
+            "ingest": ingest,
+            "first_frame_ms": min(first_frame) * 1000 if first_frame else 0.0,
+            "decode_ms": seconds * 1000,
+            "frames": frames,
+            "speedup": baseline / seconds,
+        })
+    return results
+
+
+def compare_decode(path, workers=(2, 4, 8), repeats=3):
+    """
+    对比顺序解码与分段并行解码的速度。
+
+    返回:
+        list: 顺序解码和每个进程数各一项，包含 workers、seconds、fps 和相对顺序解码的 speedup
+    """
+    num_frames, _, _, fps = _probe(path)
+    if num_frames is None:
+        raise ValueError("无法读取视频的帧数，不能分段解码")
+    keyframes = _keyframe_indices(path, fps)
+    # 先跑一次，启动解码进程
+    decode_segments(path, min(num_frames, 60), max(workers))
+
+    def _time(decode):
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode()
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    baseline = _time(lambda: read_video_frames(path, max_seconds=MAX_SECONDS))
+    results = [{"workers": 1, "seconds": baseline, "fps": num_frames / baseline, "speedup": 1.0}]
+    for count in workers:
+        seconds = _time(lambda: decode_segments(path, num_frames, count, keyframes=keyframes))
+        results.append({"workers": count, "seconds": seconds, "fps": num_frames / seconds, "speedup": baseline / seconds})
+    return results
+
+
+# 向量化角度计算与逐帧计算允许的最大误差（度）
+ANGLE_TOLERANCE_DEG = 1e-4
+
+
+def compare_angles(num_frames=10000, repeats=3, seed=0):
+    """
+    在随机生成的关键点轨迹上，对比 calculate_angles 与逐帧调用 calculate_angle 的结果和速度。
+
+    返回:
+        dict: frames、joints、max_abs_diff、within_tolerance、scalar_ms、vectorized_ms 和 speedup
+    """
+    rng = np.random.default_rng(seed)
+    keypoints = rng.random((num_frames, 17, 3), dtype=np.float32)
+    triplets = np.concatenate([get_joint_angle_triplets(side) for side in ("left", "right")])
+
+    def _scalar():
+        return np.array([
+            [calculate_angle(tuple(kp[a, :2]), tuple(kp[b, :2]), tuple(kp[c, :2])) for a, b, c in triplets]
+            for kp in keypoints
+        ])
+
+    def _time(func):
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = func()
+            durations.append(time.perf_counter() - start)
+        return result, min(durations)
+
+    reference, scalar_seconds = _time(_scalar)
+    angles, vectorized_seconds = _time(lambda: calculate_angles(keypoints, triplets))
+    max_abs_diff = float(np.abs(angles - reference).max())
+    return {
+        "frames": num_frames,
+        "joints": len(triplets),
+        "max_abs_diff": max_abs_diff,
+        "within_tolerance": max_abs_diff <= ANGLE_TOLERANCE_DEG,
+        "scalar_ms": scalar_seconds * 1000,
+        "vectorized_ms": vectorized_seconds * 1000,
+        "speedup": scalar_seconds / vectorized_seconds,
+    }
+
+
+#逐帧检测与离线检测的踩踏帧允许相差的帧数
+ONLINE_TOLERANCE_FRAMES = 1
+
+
+#两组帧序号数量相同、且按顺序逐个相差不超过tolerance帧时认为一致
+def _frames_match(online, offline, tolerance):
+    online, offline = np.sort(online), np.sort(offline)
+    return len(online) == len(offline) and bool(np.all(np.abs(online - offline) <= tolerance))
+
+
+def compare_online(track, lookahead=None):
+    """
+    在一段已经推理好的关键点轨迹上，对比 PedalStrokeDetector 逐帧检测的上/下止点
+    与 get_highest_pedal_frames / get_lowest_pedal_frames 的离线结果。
+
+    返回:
+        dict: frames、bdc/tdc（逐帧检测和离线检测的帧数）、match（是否在 ONLINE_TOLERANCE_FRAMES 帧以内一致）、
+              max_lag（事件被确认时已经多读取的帧数）和 us_per_frame
+    """
+    detector = PedalStrokeDetector(track.fps, track.facing_side, lookahead=lookahead)
+    events, lags = [], []
+    start = time.perf_counter()
+    for frame, keypoints in enumerate(track):
+        timestamp = None if track.timestamps is None else float(track.timestamps[frame])
+        for event in detector.update(keypoints, timestamp):
+            events.append(event)
+            lags.append(frame - event.frame)
+    events.extend(detector.flush())
+    seconds = time.perf_counter() - start
+
+    offline = {
+        "bdc": get_highest_pedal_frames(track, track.front_indices),
+        "tdc": get_lowest_pedal_frames(track, track.front_indices),
+    }
+    online = {kind: np.array([event.frame for event in events if event.kind == kind]) for kind in offline}
+    return {
+        "frames": len(track),
+        "bdc": (len(online["bdc"]), len(offline["bdc"])),
+        "tdc": (len(online["tdc"]), len(offline["tdc"])),
+        "match": all(_frames_match(online[kind], offline[kind], ONLINE_TOLERANCE_FRAMES) for kind in offline),
+        "max_lag": max(lags, default=0),
+        "us_per_frame": seconds / len(track) * 1e6,
+    }
+
+
+def compare_convergence(track, min_strokes=DEFAULT_MIN_STROKES, max_ci=DEFAULT_MAX_CI_DEG, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    在一段完整的关键点轨迹上模拟 pose_analyzer 的提前停止：逐批加入帧，测量收敛后停止，
+    对比处理的帧数和停止时的测量与使用全部帧的测量。
+
+    返回:
+        dict: frames、processed_frames、reduction、strokes、converged 和 measurement_diff
+    """
+    detector = PedalStrokeDetector(track.fps, track.facing_side)
+    monitor = ConvergenceMonitor(min_strokes, max_ci)
+    processed = len(track)
+    for start in range(0, len(track), batch_size):
+        for keypoints in track[start : start + batch_size]:
+            events = detector.update(keypoints)
+            monitor.add_frame(keypoints, detector.facing_side)
+            for event in events:
+                monitor.add(event)
+        if monitor.converged:
+            processed = min(start + batch_size, len(track))
+            break
+
+    stopped = PoseTrack(track.keypoints[:processed], None if track.timestamps is None else track.timestamps[:processed])
+    return {
+        "frames": len(track),
+        "processed_frames": processed,
+        "reduction": len(track) / processed,
+        "strokes": monitor.strokes,
+        "converged": monitor.converged,
+        "measurement_diff": compare_measurements(get_pose(track), get_pose(stopped)),
+    }
+
+
+#读取关键点缓存目录中的轨迹，跳过时间戳文件
+def _load_tracks(paths):
+    tracks = []
+    for path in paths:
+        files = [path] if not os.path.isdir(path) else sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.endswith(".npy") and not name.endswith(".ts.npy")
+        )
+        for file in files:
+            timestamps_file = file[: -len(".npy")] + ".ts.npy"
+            timestamps = np.load(timestamps_file) if os.path.exists(timestamps_file) else None
+            tracks.append((os.path.basename(file), PoseTrack(np.load(file), timestamps)))
+    return tracks
+
+
+def _run_batch(args):
+    _, video_tensor = pre_process_video(args.video)
+    model, input_size = get_model()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    print(f"视频帧数: {video_tensor.shape[0]}")
+    print(f"{'batch_size':>10} {'seconds':>10} {'fps':>10} {'speedup':>10}")
+    for row in benchmark_batch_sizes(video_tensor, model, input_size, batch_sizes, args.repeats):
+        print(f"{row['batch_size']:>10} {row['seconds']:>10.3f} {row['fps']:>10.1f} {row['speedup']:>9.2f}x")
+
+
+def _run_backends(args):
+    _, video_tensor = pre_process_video(args.video)
+    backends = [
+        load_backend(name, model_dir=args.model_dir, num_threads=args.threads)
+        for name in args.backends.split(",")
+    ]
+
+    print(f"视频帧数: {video_tensor.shape[0]}，参考后端: {backends[0].name}")
+    print(f"{'backend':>12} {'ms/frame':>10} {'fps':>10} {'mean_diff':>10} {'max_diff':>10} {'score_diff':>10}")
+    for row in compare_backends(video_tensor, backends, args.batch_size, args.repeats):
+        print(
+            f"{row['backend']:>12} {row['ms_per_frame']:>10.2f} {row['fps']:>10.1f} "
+            f"{row['mean_coord_diff']:>10.4f} {row['max_coord_diff']:>10.4f} {row['mean_score_diff']:>10.4f}"
+        )
+
+
+def _run_strided(args):
+    _, video_tensor = pre_process_video(args.video)
+    model, input_size = get_model()
+
+    strides = [int(stride) for stride in args.strides.split(",")]
+    print(f"视频帧数: {video_tensor.shape[0]}，允许误差: {STRIDED_TOLERANCE_DEG}°")
+    for row in compare_strided(video_tensor, model, input_size, strides):
+        status = "✓" if row["within_tolerance"] else "✗"
+        print(
+            f"{status} stride={row['stride']} 推理帧数={row['inferred_frames']} "
+            f"减少={row['reduction']:.2f}x 最大误差={max(row['measurement_diff'].values()):.2f}°"
+        )
+        for key, value in row["measurement_diff"].items():
+            print(f"    - {key}: {value:.2f}°")
+
+
+def _run_ingest(args):
+    with open(args.video, "rb") as f:
+        data = f.read()
+
+    print(f"视频大小: {len(data) / 1024 / 1024:.1f} MB")
+    print(f"{'ingest':>10} {'first_frame_ms':>15} {'decode_ms':>10} {'frames':>8} {'speedup':>10}")
+    for row in compare_ingest(data, args.methods.split(","), args.repeats):
+        print(
+            f"{row['ingest']:>10} {row['first_frame_ms']:>15.1f} {row['decode_ms']:>10.1f} "
+            f"{row['frames']:>8} {row['speedup']:>9.2f}x"
+        )
+
+
+def _run_decode(args):
+    workers = [int(count) for count in args.workers.split(",")]
+    print(f"{'workers':>8} {'seconds':>10} {'fps':>10} {'speedup':>10}")
+    for row in compare_decode(args.video, workers, args.repeats):
+        print(f"{row['workers']:>8} {row['seconds']:>10.3f} {row['fps']:>10.1f} {row['speedup']:>9.2f}x")
+
+
+def _run_angles(args):
+    row = compare_angles(args.frames, args.repeats)
+    status = "✓" if row["within_tolerance"] else "✗"
+    print(f"帧数: {row['frames']}，关节角度: {row['joints']}（{', '.join(JOINT_ANGLE_TRIPLETS)} × 左右）")
+    print(f"{status} 与逐帧计算的最大误差: {row['max_abs_diff']:.2e}°")
+    print(
+        f"逐帧: {row['scalar_ms']:.1f} ms，向量化: {row['vectorized_ms']:.2f} ms，"
+        f"加速: {row['speedup']:.0f}x"
+    )
+
+
+def _run_online(args):
+    tracks = _load_tracks(args.tracks)
+    if not tracks:
+        raise SystemExit("没有找到关键点轨迹，先分析几段视频填充关键点缓存")
+    print(f"轨迹数量: {len(tracks)}，允许误差: ±{ONLINE_TOLERANCE_FRAMES} 帧")
+    print(f"{'':>2}{'track':<20} {'frames':>7} {'bdc':>9} {'tdc':>9} {'max_lag':>8} {'us/frame':>9}")
+    matched = 0
+    for name, track in tracks:
+        row = compare_online(track, args.lookahead)
+        matched += row["match"]
+        status = "✓" if row["match"] else "✗"
+        bdc, tdc = "/".join(map(str, row["bdc"])), "/".join(map(str, row["tdc"]))
+        print(
+            f"{status} {name[:20]:<20} {row['frames']:>7} {bdc:>9} {tdc:>9} "
+            f"{row['max_lag']:>8} {row['us_per_frame']:>9.1f}"
+        )
+    print(f"一致: {matched}/{len(tracks)}（bdc/tdc 列为 逐帧检测/离线检测 的次数）")
+
+
+def _run_convergence(args):
+    tracks = _load_tracks(args.tracks)
+    if not tracks:
+        raise SystemExit("没有找到关键点轨迹，先分析几段视频填充关键点缓存")
+    print(f"轨迹数量: {len(tracks)}，至少 {args.min_strokes} 次踩踏，置信区间半宽 ≤ {args.max_ci}°")
+    print(f"{'':>2}{'track':<20} {'frames':>7} {'processed':>10} {'reduction':>10} {'strokes':>8} {'max_diff':>9}")
+    total, processed = 0, 0
+    for name, track in tracks:
+        row = compare_convergence(track, args.min_strokes, args.max_ci)
+        total += row["frames"]
+        processed += row["processed_frames"]
+        status = "✓" if row["converged"] else "-"
+        print(
+            f"{status} {name[:20]:<20} {row['frames']:>7} {row['processed_frames']:>10} {row['reduction']:>9.2f}x "
+            f"{row['strokes']:>8} {max(row['measurement_diff'].values()):>8.2f}°"
+        )
+    print(f"总帧数: {total}，处理的帧数: {processed}，减少: {total / processed:.2f}x（✓ 为提前停止的轨迹）")
+
+
+def main():
+    default_video = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads", "raw.mp4"
+    )
+    parser = argparse.ArgumentParser(description="MoveNet 推理性能对比")
+    parser.add_argument("--video", default=default_video, help="测试视频路径")
+    parser.add_argument("--repeats", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--gpu", action="store_true", help="允许使用GPU，默认只在CPU上测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser("batch", help="对比不同batch_size与逐帧推理的吞吐量")
+    batch_parser.add_argument("--batch-sizes", default="1,4,8,16,32", help="逗号分隔的batch_size列表")
+    batch_parser.set_defaults(func=_run_batch)
+
+    backends_parser = subparsers.add_parser("backends", help="对比不同推理后端的延迟和关键点一致性")
+    backends_parser.add_argument("--backends", default=",".join(BACKENDS), help="逗号分隔的后端列表，第一个作为参考")
+    backends_parser.add_argument("--model-dir", default=LOCAL_MODEL_DIR, help="本地模型目录")
+    backends_parser.add_argument("--threads", type=int, default=None, help="TFLite/ONNX使用的线程数")
+    backends_parser.add_argument("--batch-size", type=int, default=8, help="推理的batch_size")
+    backends_parser.set_defaults(func=_run_backends)
+
+    strided_parser = subparsers.add_parser("strided", help="对比跳帧推理与逐帧推理的推理次数和测量误差")
+    strided_parser.add_argument("--strides", default="2,3,4,5", help="逗号分隔的stride列表")
+    strided_parser.set_defaults(func=_run_strided)
+
+    ingest_parser = subparsers.add_parser("ingest", help="对比上传视频经过临时文件和直接从内存解码的延迟")
+    ingest_parser.add_argument("--methods", default="tempfile,memory", help="逗号分隔的读取方式，第一个作为参考")
+    ingest_parser.set_defaults(func=_run_ingest)
+
+    decode_parser = subparsers.add_parser("decode", help="对比顺序解码与分段并行解码的速度")
+    decode_parser.add_argument("--workers", default="2,4,8", help="逗号分隔的解码进程数")
+    decode_parser.set_defaults(func=_run_decode)
+
+    angles_parser = subparsers.add_parser("angles", help="检查向量化角度计算的结果并对比速度")
+    angles_parser.add_argument("--frames", type=int, default=10000, help="随机关键点轨迹的帧数")
+    angles_parser.set_defaults(func=_run_angles)
+
+    online_parser = subparsers.add_parser("online", help="对比逐帧检测与离线find_peaks得到的踩踏帧")
+    online_parser.add_argument("--tracks", nargs="+", default=[DEFAULT_STORE_DIR], help="关键点轨迹(.npy)文件或目录")
+    online_parser.add_argument("--lookahead", type=int, default=None, help="最多等待的后续帧数，默认4倍峰值间隔")
+    online_parser.set_defaults(func=_run_online)
+
+    convergence_parser = subparsers.add_parser(
+        "convergence", help="统计测量收敛后提前停止减少的帧数，轨迹需要是完整推理得到的（POSE_CONVERGENCE_MIN_STROKES=0）"
+    )
+    convergence_parser.add_argument("--tracks", nargs="+", default=[DEFAULT_STORE_DIR], help="关键点轨迹(.npy)文件或目录")
+    convergence_parser.add_argument("--min-strokes", type=int, default=max(DEFAULT_MIN_STROKES, 1), help="至少需要的踩踏次数")
+    convergence_parser.add_argument("--max-ci", type=float, default=DEFAULT_MAX_CI_DEG, help="置信区间半宽的上限（度）")
+    convergence_parser.set_defaults(func=_run_convergence)
+
+    args = parser.parse_args()
+    if not args.gpu:
+        tf.config.set_visible_devices([], "GPU")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
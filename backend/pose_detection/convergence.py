@@ -0,0 +1,129 @@
+import math
+import os
+
+import numpy as np
+from scipy.stats import t
+
+from pose_detection.postprocessing import calculate_angles, filter_bad_knee_angles, filter_outliers, get_joint_angle_triplets
+
+# 程序功能：跟踪每一次踩踏的测量值，踩踏次数足够且每项测量的置信区间足够窄时提前停止解码和推理
+
+# 至少需要的完整踩踏次数，0表示不提前停止，总是处理到视频结束（或帧数上限）
+DEFAULT_MIN_STROKES = int(os.getenv("POSE_CONVERGENCE_MIN_STROKES", "4"))
+# 每项测量平均值的置信区间半宽（度）低于该值时认为已经收敛
+DEFAULT_MAX_CI_DEG = float(os.getenv("POSE_CONVERGENCE_MAX_CI_DEG", "2.0"))
+# 置信区间的置信度
+DEFAULT_CONFIDENCE = 0.95
+
+# 每种踩踏事件对应的 get_pose 测量：(事件, StrokeEvent 的字段) -> 测量名
+STROKE_MEASUREMENTS = {
+    ("tdc", "knee_angle"): "knee_angle_lowest",
+    ("tdc", "hip_angle"): "hip_angle_lowest",
+    ("bdc", "knee_angle"): "knee_angle_highest",
+    ("bdc", "hip_angle"): "hip_angle_highest",
+}
+# 对所有帧取平均的 get_pose 测量：测量名 -> JOINT_ANGLE_TRIPLETS 中的关节。
+# 相邻两个下止点事件之间各帧的平均值作为一次踩踏的样本
+FRAME_MEASUREMENTS = {
+    "shoulder_angle": "shoulder",
+    "elbow_angle": "elbow",
+}
+
+STOP_CONVERGED = "converged"
+STOP_END_OF_VIDEO = "end_of_video"
+STOP_CACHED = "cached"
+
+
+class ConvergenceMonitor:
+    """Decides when the per-stroke measurements of get_pose have settled.
+
+    Every StrokeEvent from PedalStrokeDetector adds one value to the
+    measurements of its kind ("tdc" events to the *_lowest measurements,
+    "bdc" events to the *_highest ones). Processing can stop once
+    min_strokes complete strokes were seen and the confidence interval of
+    the mean of every measurement is narrower than max_ci degrees. The
+    shoulder and elbow angles, which get_pose averages over all frames, are
+    fed frame by frame through add_frame; the frames between two "bdc"
+    events are averaged into one sample per stroke. The knee
+    angles at the lowest pedal frames are filtered like get_pose does; the
+    other measurements drop values far from their median, which come from
+    jitter peaks detected in the middle of a stroke.
+    """
+
+    def __init__(self, min_strokes=DEFAULT_MIN_STROKES, max_ci=DEFAULT_MAX_CI_DEG, confidence=DEFAULT_CONFIDENCE):
+        """
+        参数:
+            min_strokes (int): 至少需要的完整踩踏次数，0表示从不收敛
+            max_ci (float): 置信区间半宽的上限（度）
+            confidence (float): 置信区间的置信度
+        """
+        self.min_strokes = min_strokes
+        self.max_ci = max_ci
+        self.confidence = confidence
+        self._counts = {"bdc": 0, "tdc": 0}
+        self._values = {name: [] for name in (*STROKE_MEASUREMENTS.values(), *FRAME_MEASUREMENTS)}
+        self._frame_values = {name: [] for name in FRAME_MEASUREMENTS}
+
+    @property
+    def enabled(self):
+        return self.min_strokes > 0
+
+    @property
+    def strokes(self):
+        """完整踩踏次数：上止点和下止点中较少的一个。"""
+        return min(self._counts.values())
+
+    def add_frame(self, keypoints, facing_side):
+        """
+        加入一帧的关键点，记录这一帧的肩膀和手肘角度，在下一个下止点事件时汇总。
+
+        参数:
+            keypoints: (17,3) 关键点
+            facing_side (str): 拍摄侧，见 find_camera_facing_side
+        """
+        angles = calculate_angles(keypoints[np.newaxis], get_joint_angle_triplets(facing_side, tuple(FRAME_MEASUREMENTS.values())))[0]
+        for angle, name in zip(angles, FRAME_MEASUREMENTS):
+            if not math.isnan(angle):
+                self._frame_values[name].append(float(angle))
+
+    def add(self, event):
+        """加入一个 StrokeEvent，返回加入后是否已经收敛。"""
+        self._counts[event.kind] += 1
+        for (kind, field), name in STROKE_MEASUREMENTS.items():
+            if kind == event.kind:
+                value = getattr(event, field)
+                if not math.isnan(value):
+                    self._values[name].append(value)
+        if event.kind == "bdc":
+            self._close_stroke()
+        return self.converged
+
+    #以下止点事件为界汇总一次踩踏的逐帧角度，第一个下止点之前不是完整的踩踏，不计入
+    def _close_stroke(self):
+        for name, values in self._frame_values.items():
+            if self._counts["bdc"] > 1 and values:
+                self._values[name].append(float(np.mean(values)))
+            self._frame_values[name] = []
+
+    def intervals(self):
+        """返回每项测量平均值的置信区间半宽（度），少于两个值时为 inf。"""
+        intervals = {}
+        for name, values in self._values.items():
+            values = np.asarray(values, dtype=np.float64)
+            if name == "knee_angle_lowest":
+                values, _ = filter_bad_knee_angles(values, np.arange(len(values)))
+            else:
+                values, _ = filter_outliers(values, np.arange(len(values)))
+            if len(values) < 2:
+                intervals[name] = math.inf
+                continue
+            # 样本较少，使用t分布
+            critical = t.ppf((1 + self.confidence) / 2, len(values) - 1)
+            intervals[name] = float(critical * values.std(ddof=1) / math.sqrt(len(values)))
+        return intervals
+
+    @property
+    def converged(self):
+        if not self.enabled or self.strokes < self.min_strokes:
+            return False
+        return all(interval <= self.max_ci for interval in self.intervals().values())
@@ -2,9 +2,16 @@ import numpy as np
 import tensorflow as tf
 from .keypoints import KEYPOINT_DICT
 # 程序功能： 1. 减少输入矩阵的大小。2.输入模型识别的的结果，输出所需要的每个关键点之间的信息
+# 所有函数都基于数组运算：关键点为 (N,17,3) 数组，裁剪框为 (N,4) 数组，每行是归一化的 [y_min, x_min, y_max, x_max]
 # Confidence score to determine whether a keypoint prediction is reliable.
 MIN_CROP_KEYPOINT_SCORE = 0.55#设置最小置信度
 
+_LEFT_HIP = KEYPOINT_DICT["left_hip"]
+_RIGHT_HIP = KEYPOINT_DICT["right_hip"]
+_LEFT_SHOULDER = KEYPOINT_DICT["left_shoulder"]
+_RIGHT_SHOULDER = KEYPOINT_DICT["right_shoulder"]
+_TORSO_INDICES = [_LEFT_SHOULDER, _RIGHT_SHOULDER, _LEFT_HIP, _RIGHT_HIP]
+
 
 # 判断驱赶是否可见，即模型输出置信度是否足够
 def torso_visible(keypoints):
@@ -13,138 +20,85 @@ def torso_visible(keypoints):
     shoulders/hips which is required to determine a good crop region.
 
     Args:
-        keypoints: a [17,3] keypoint numpy array
+        keypoints: a [...,17,3] keypoint numpy array
     Returns:
-        True if there are enough keypoints to accurately predict the position of the torso
-        False if not
+        a boolean array with the leading shape of keypoints, True where there are enough
+        keypoints to accurately predict the position of the torso
     """
+    scores = np.asarray(keypoints)[..., 2]
     return (
-        keypoints[KEYPOINT_DICT["left_hip"], 2] > MIN_CROP_KEYPOINT_SCORE
-        or keypoints[KEYPOINT_DICT["right_hip"], 2] > MIN_CROP_KEYPOINT_SCORE
-    ) and (
-        keypoints[KEYPOINT_DICT["left_shoulder"], 2] > MIN_CROP_KEYPOINT_SCORE
-        or keypoints[KEYPOINT_DICT["right_shoulder"], 2] > MIN_CROP_KEYPOINT_SCORE
+        (scores[..., _LEFT_HIP] > MIN_CROP_KEYPOINT_SCORE)
+        | (scores[..., _RIGHT_HIP] > MIN_CROP_KEYPOINT_SCORE)
+    ) & (
+        (scores[..., _LEFT_SHOULDER] > MIN_CROP_KEYPOINT_SCORE)
+        | (scores[..., _RIGHT_SHOULDER] > MIN_CROP_KEYPOINT_SCORE)
     )
 
-#找到驱赶和身体的最大距离
-def determine_torso_and_body_range(keypoints, position_keypoints, center_y, center_x):
-    """Calculates the maximum distance from each keypoints to the center location.
-
-    Args:
-        keypoints: a [17,3] keypoint numpy array
-        position_keypoints: dictionary of keypointdata for keypoints representing the torso
-        center_y: y-position of the center of the torso
-        center_x: x-position of the center of the torso
-    Returns:
-        The maximum distances from the two sets of keypoints:
-        full 17 keypoints and 4 torso keypoints. The returned information will be
-        used to determine the crop size. See determineCropRegion for more detail.
-    """
-    torso_joints = ["left_shoulder", "right_shoulder", "left_hip", "right_hip"]
-    max_torso_yrange = 0.0
-    max_torso_xrange = 0.0
-    for joint in torso_joints:#遍历驱赶关节位置，找到脚距离肩膀的最大距离
-        dist_y = abs(center_y - position_keypoints[joint][0])
-        dist_x = abs(center_x - position_keypoints[joint][1])
-        if dist_y > max_torso_yrange:
-            max_torso_yrange = dist_y
-        if dist_x > max_torso_xrange:
-            max_torso_xrange = dist_x
-
-    max_body_yrange = 0.0
-    max_body_xrange = 0.0
-    for joint in KEYPOINT_DICT.keys():#key是字典中的索引。该循环遍历所有关节，找到每个关键点距离中心的最远距离
-        if keypoints[KEYPOINT_DICT[joint], 2] < MIN_CROP_KEYPOINT_SCORE:#如果置信度不够将跳过该帧
-            continue
-        dist_y = abs(center_y - position_keypoints[joint][0])
-        dist_x = abs(center_x - position_keypoints[joint][1])
-        if dist_y > max_body_yrange:
-            max_body_yrange = dist_y
-
-        if dist_x > max_body_xrange:
-            max_body_xrange = dist_x
-
-    return [max_torso_yrange, max_torso_xrange, max_body_yrange, max_body_xrange]
-
 #确定图像中人体的裁剪区域，以便模型可以在此区域内进行推理
 #该方法主要是为了增加模型的运算效率，减少计算资源的浪费
-def determine_crop_region(keypoints, image_height, image_width):
-
-    """Determines the region to crop the image for the model to run inference on.
+def determine_crop_boxes(keypoints, image_height, image_width):
+    """Determines the regions to crop the next frames for the model to run inference on.
 
-    The algorithm uses the detected joints from the previous frame to estimate
-    the square region that encloses the full body of the target person and
-    centers at the midpoint of two hip joints. The crop size is determined by
-    the distances between each joints and the center point.
-    When the model is not confident with the four torso joint predictions, the
-    function returns a default crop which is the full image padded to square.
+    The algorithm uses the detected joints of each frame to estimate the square
+    region that encloses the full body of the target person and centers at the
+    midpoint of two hip joints. The crop size is determined by the distances
+    between each joint and the center point: 1.9x the torso range or 1.2x the
+    range of the confident body joints. When the model is not confident with the
+    four torso joint predictions, the default crop (the full image padded to
+    square) is used for that frame.
 
     Args:
-        keypoints: a [17,3] keypoint numpy array
+        keypoints: a [N,17,3] keypoint numpy array
         image_height: the height of the image in pixels
         image_width: the width of the image in pixels
     Returns:
-        Dictionary {y_min, x_min, y_max, x_max, height, width} representing the bounding box around the person.
+        a [N,4] float32 array of normalised {y_min, x_min, y_max, x_max} boxes.
     """
-    position_keypoints = {}
-    for joint in KEYPOINT_DICT.keys():#遍历17个关节，将关节位置存储在target_keypoints中
-        position_keypoints[joint] = [
-            keypoints[KEYPOINT_DICT[joint], 0] * image_height,
-            keypoints[KEYPOINT_DICT[joint], 1] * image_width,
-        ]
-
-
-    if torso_visible(keypoints):#判断驱赶是否可见，如果可见返回计算的裁切区域
-        center_y = (
-            position_keypoints["left_hip"][0] + position_keypoints["right_hip"][0]
-        ) / 2
-        center_x = (
-            position_keypoints["left_hip"][1] + position_keypoints["right_hip"][1]
-        ) / 2
-
-        (
-            max_torso_yrange,
-            max_torso_xrange,
-            max_body_yrange,
-            max_body_xrange,
-        ) = determine_torso_and_body_range(
-            keypoints, position_keypoints, center_y, center_x
-        )
-
-        crop_length_half = np.amax(
-            [
-                max_torso_xrange * 1.9,
-                max_torso_yrange * 1.9,
-                max_body_yrange * 1.2,
-                max_body_xrange * 1.2,
-            ]
-        )
-
-        tmp = np.array(
-            [center_x, image_width - center_x, center_y, image_height - center_y]
-        )
-        crop_length_half = np.amin([crop_length_half, np.amax(tmp)])
-
-        crop_corner = [center_y - crop_length_half, center_x - crop_length_half]
-
-        if crop_length_half > max(image_width, image_height) / 2:
-            return init_crop_region(image_height, image_width)
-        else:
-            crop_length = crop_length_half * 2
-            return {
-                "y_min": crop_corner[0] / image_height,
-                "x_min": crop_corner[1] / image_width,
-                "y_max": (crop_corner[0] + crop_length) / image_height,
-                "x_max": (crop_corner[1] + crop_length) / image_width,
-                "height": (crop_corner[0] + crop_length) / image_height
-                - crop_corner[0] / image_height,
-                "width": (crop_corner[1] + crop_length) / image_width
-                - crop_corner[1] / image_width,
-            }
-    else:
-        return init_crop_region(image_height, image_width)
+    keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, 17, 3)
+    position_y = keypoints[:, :, 0] * image_height
+    position_x = keypoints[:, :, 1] * image_width
+
+    center_y = (position_y[:, _LEFT_HIP] + position_y[:, _RIGHT_HIP]) / 2
+    center_x = (position_x[:, _LEFT_HIP] + position_x[:, _RIGHT_HIP]) / 2
+
+    # 每个关节到中心点的距离 (N,17)
+    dist_y = np.abs(center_y[:, None] - position_y)
+    dist_x = np.abs(center_x[:, None] - position_x)
+
+    # 躯干的最大距离，以及置信度足够的关节的最大距离
+    body_mask = keypoints[:, :, 2] >= MIN_CROP_KEYPOINT_SCORE
+    crop_length_half = np.maximum.reduce([
+        dist_x[:, _TORSO_INDICES].max(axis=1) * 1.9,
+        dist_y[:, _TORSO_INDICES].max(axis=1) * 1.9,
+        np.where(body_mask, dist_y, 0.0).max(axis=1) * 1.2,
+        np.where(body_mask, dist_x, 0.0).max(axis=1) * 1.2,
+    ])
+    crop_length_half = np.minimum(
+        crop_length_half,
+        np.maximum.reduce([center_x, image_width - center_x, center_y, image_height - center_y]),
+    )
+
+    crop_y_min = center_y - crop_length_half
+    crop_x_min = center_x - crop_length_half
+    boxes = np.stack(
+        [
+            crop_y_min / image_height,
+            crop_x_min / image_width,
+            (crop_y_min + crop_length_half * 2) / image_height,
+            (crop_x_min + crop_length_half * 2) / image_width,
+        ],
+        axis=1,
+    ).astype(np.float32)
+
+    # 躯干不可见或者裁剪框超出图像时使用默认裁切区域
+    use_default = ~torso_visible(keypoints) | (
+        crop_length_half > max(image_width, image_height) / 2
+    )
+    boxes[use_default] = init_crop_box(image_height, image_width)
+    return boxes
+
 #默认裁切区域
-def init_crop_region(image_height, image_width):#默认裁切区域
+def init_crop_box(image_height, image_width):#默认裁切区域
     """Defines the default crop region.
 
     The function provides the initial crop region (pads the full image from both
@@ -155,7 +109,7 @@ def init_crop_region(image_height, image_width):#默认裁切区域
         image_height: the height of the image in pixels
         image_width: the width of the image in pixels
     Returns:
-        Dictionary {y_min, x_min, y_max, x_max, height, width} representing the bounding box around the person.
+        a [4] float32 array {y_min, x_min, y_max, x_max} representing the bounding box around the person.
     """
     if image_width > image_height:
         box_height = image_width / image_height
@@ -168,33 +122,93 @@ def init_crop_region(image_height, image_width):#默认裁切区域
         y_min = 0.0
         x_min = (image_width / 2 - image_height / 2) / image_width
 
+    return np.array([y_min, x_min, y_min + box_height, x_min + box_width], dtype=np.float32)
+
+#将模型在裁剪框内输出的坐标转换回原始图像的坐标系
+def unproject_keypoints(keypoints, boxes):
+    """Maps keypoints predicted inside crop boxes back to the full image.
+
+    Args:
+        keypoints: a [N,17,3] array of keypoints relative to each crop
+        boxes: a [N,4] array of the crop boxes used for each frame
+    Returns:
+        the [N,17,3] keypoints in normalised full image coordinates, updated in place
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    box_min = boxes[:, None, 0:2]
+    box_size = boxes[:, None, 2:4] - box_min
+    keypoints[:, :, 0:2] = box_min + box_size * keypoints[:, :, 0:2]
+    return keypoints
+
+#调整图像的大小，使其完全适配模型输入的需要
+def crop_and_resize_boxes(images, boxes, crop_size):
+    """Crops and resizes a batch of frames, each with its own box, in a single call.
+
+    Args:
+        images: the frames as a [N,H,W,3] tensor
+        boxes: a [N,4] array of normalised crop boxes, one per frame
+        crop_size: the size of the model input
+    Returns:
+        the crops as a [N, 256, 256, 3] tensor, resized to the correct input size"""
+    boxes = np.asarray(boxes, dtype=np.float32)
+    return tf.image.crop_and_resize(
+        images, boxes=boxes, box_indices=tf.range(boxes.shape[0]), crop_size=crop_size
+    )
+
+
+class CropTracker:
+    """Tracks the crop box of a video from batch to batch.
+
+    Every frame of a batch is cropped with the box determined from the last
+    inferred frame of the previous batch.
+    """
+
+    def __init__(self, image_height, image_width):
+        self.image_height = image_height
+        self.image_width = image_width
+        self.box = init_crop_box(image_height, image_width)
+
+    def boxes(self, num_frames):
+        """Returns the [num_frames,4] boxes to crop the next batch with."""
+        return np.repeat(self.box[None, :], num_frames, axis=0)
+
+    def update(self, keypoints):
+        """Updates the box from the [17,3] keypoints of the last inferred frame."""
+        self.box = determine_crop_boxes(keypoints, self.image_height, self.image_width)[0]
+
+
+# 以下函数保留原来的字典格式 {y_min, x_min, y_max, x_max, height, width}，内部都基于数组实现
+def _box_to_region(box):
+    y_min, x_min, y_max, x_max = (float(value) for value in box)
     return {
         "y_min": y_min,
         "x_min": x_min,
-        "y_max": y_min + box_height,
-        "x_max": x_min + box_width,
-        "height": box_height,
-        "width": box_width,
+        "y_max": y_max,
+        "x_max": x_max,
+        "height": y_max - y_min,
+        "width": x_max - x_min,
     }
-#调整图像的大小，使其完全适配模型输入的需要
-def crop_and_resize(image, crop_region, crop_size):
-    """Crops and resize the image to prepare for the model input.
 
-    Args:
-        image: the image as a [H,W,3] tensor
-        crop_region: the dictionary representing the bounding box used to crop the image around the cyclist
-        crop_size: the size of the bounding box
-    Returns:
-        an image as a [256, 256, 3] tensor, cropped around the cyclist and resized to the correct input size"""
-    boxes = [
-        [
-            crop_region["y_min"],
-            crop_region["x_min"],
-            crop_region["y_max"],
-            crop_region["x_max"],
-        ]
-    ]
-    output_image = tf.image.crop_and_resize(
-        image, box_indices=[0], boxes=boxes, crop_size=crop_size
+
+def region_to_box(crop_region):
+    """Converts a crop region dictionary to a [4] box array."""
+    return np.array(
+        [crop_region["y_min"], crop_region["x_min"], crop_region["y_max"], crop_region["x_max"]],
+        dtype=np.float32,
     )
-    return output_image
+
+
+def determine_crop_region(keypoints, image_height, image_width):
+    """Dictionary version of determine_crop_boxes for a single [17,3] keypoint array."""
+    return _box_to_region(determine_crop_boxes(keypoints, image_height, image_width)[0])
+
+
+def init_crop_region(image_height, image_width):
+    """Dictionary version of init_crop_box."""
+    return _box_to_region(init_crop_box(image_height, image_width))
+
+
+def crop_and_resize(image, crop_region, crop_size):
+    """Crops and resizes a [B,H,W,3] tensor, every image with the same crop region dictionary."""
+    boxes = np.repeat(region_to_box(crop_region)[None, :], image.shape[0], axis=0)
+    return crop_and_resize_boxes(image, boxes, crop_size)
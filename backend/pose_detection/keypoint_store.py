@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from pose_detection.preprocessing import DEFAULT_TARGET_FPS, MAX_SECONDS, TARGET_SIZE
+
+# 程序功能：按上传视频内容缓存推理得到的关键点，同一段视频再次分析时不需要重新解码和推理
+
+# 预处理流程的版本号，修改 pre_process_video 的处理方式时需要递增
+PREPROCESS_VERSION = "2"
+
+
+#缓存键使用的预处理版本：PREPROCESS_VERSION 和决定解码输出的参数（包括 POSE_TARGET_FPS 设置的帧率）一起计算哈希，参数改变后不会读到旧的关键点
+def _preprocess_key():
+    params = (PREPROCESS_VERSION, DEFAULT_TARGET_FPS, MAX_SECONDS, TARGET_SIZE)
+    return hashlib.sha256(repr(params).encode()).hexdigest()[:16]
+
+
+PREPROCESS_KEY = _preprocess_key()
+
+DEFAULT_STORE_DIR = os.getenv(
+    "KEYPOINT_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "keypoints"),
+)
+DEFAULT_MAX_BYTES = int(os.getenv("KEYPOINT_STORE_MAX_MB", "512")) * 1024 * 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class KeypointStore:
+    """Content-addressed on-disk store of (N,17,3) float32 keypoint arrays.
+
+    Every entry is a .npy file named after the hash of the video bytes, the
+    model version and the preprocessing version, so it can be memory-mapped
+    on read. The frame timestamps are kept in a `.ts.npy` file next to it.
+    The file modification time records the last access and the least
+    recently used entries are evicted once the store grows past max_bytes.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, file, model_version, preprocess_version=PREPROCESS_KEY):
+        """
+        计算视频对应的缓存键。
+
+        参数:
+            file (str | bytes): 视频文件路径或字节数据
+            model_version (str): 模型版本，见 model_version()
+            preprocess_version (str): 预处理版本，默认是由 PREPROCESS_VERSION 和解码参数得到的 PREPROCESS_KEY
+
+        返回:
+            str: 十六进制的sha256
+        """
+        digest = hashlib.sha256()
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(file)
+        digest.update(f"|{model_version}|{preprocess_version}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.npy")
+
+    def _timestamps_path(self, key):
+        return os.path.join(self.root, f"{key}.ts.npy")
+
+    def get(self, key):
+        """Returns the memory-mapped (N,17,3) keypoints of a key, or None on a miss."""
+        path = self._path(key)
+        try:
+            keypoints = np.load(path, mmap_mode="r")
+            # 更新访问时间，用于LRU淘汰
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return keypoints
+
+    def get_timestamps(self, key):
+        """Returns the (N,) frame timestamps in seconds of a key, or None if they were not stored."""
+        try:
+            return np.load(self._timestamps_path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, keypoints, timestamps=None):
+        """Stores the keypoints (and optionally the frame timestamps) of a key and evicts old entries if the store is too large."""
+        keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, 17, 3)
+        # 时间戳先写，读到关键点时时间戳一定已经存在
+        if timestamps is not None:
+            self._save(self._timestamps_path(key), np.asarray(timestamps, dtype=np.float64))
+        self._save(self._path(key), keypoints)
+        self._evict()
+
+    @staticmethod
+    def _save(path, array):
+        # 先写临时文件再重命名，其他进程不会读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            timestamp_sizes = {}
+            for name in os.listdir(self.root):
+                if not name.endswith(".npy"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".ts.npy"):
+                    # 时间戳文件跟随对应的关键点文件一起淘汰
+                    timestamp_sizes[name[: -len(".ts.npy")]] = stat.st_size
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, name[: -len(".npy")]))
+
+            total = sum(size for _, size, _ in entries) + sum(timestamp_sizes.values())
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in (self._timestamps_path(key), self._path(key)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size + timestamp_sizes.get(key, 0)
+
+
+def model_version(model, stride=1):
+    """返回推理后端的版本标识，不同后端、输入尺寸或跳帧推理间隔的关键点分开缓存。"""
+    version = f"{model.name}-{model.input_size}"
+    return version if stride <= 1 else f"{version}-stride{stride}"
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_keypoint_store():
+    """返回进程内共享的关键点缓存。"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = KeypointStore()
+    return _store
@@ -1,26 +1,33 @@
+import itertools
+import time
 import tensorflow as tf
-import tensorflow_hub as hub
 import numpy as np
-import kagglehub
-from pose_detection.cropping import init_crop_region, determine_crop_region, crop_and_resize
+from pose_detection.backends import MODEL_VARIANTS, SavedModelBackend, as_backend
+from pose_detection.cropping import (
+    CropTracker,
+    crop_and_resize_boxes,
+    determine_crop_boxes,
+    region_to_box,
+    unproject_keypoints,
+)
+from pose_detection.postprocessing import find_camera_facing_side, get_front_keypoint_indices
+from telemetry import INFERENCE_MS_PER_FRAME, observe
 
 #加载模型
-def load_model_from_tfhub():
-    input_size = 256
+def load_model_from_tfhub(variant="thunder"):
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"未知的模型变体: {variant}")
+    backend = SavedModelBackend.from_tfhub(variant)
+    return backend.signature, backend.input_size
+# 批量推理时每批默认的帧数，batch_size=1 等价于逐帧推理
+DEFAULT_BATCH_SIZE = 8
 
-    path = kagglehub.model_download("google/movenet/tensorFlow2/singlepose-thunder")
-    module = hub.load(path)
-
-    model = module.signatures["serving_default"]
-    # this prevents the python 3.8.x garbage collector from
-    # deleting variable references if the model is stored in memory for a long time
-    model._backref_to_saved_model = module
-    return model, input_size
 #模型推理函数
 def _movenet(model, input_image):
     """Runs detection on an input image.
 
     Args:
+      model: an InferenceBackend, or a raw SavedModel signature
       input_image: A [1, height, width, 3] tensor represents the input image
         pixels. Note that the height/width should already be resized and match the
         expected input resolution of the model before passing into this function.
@@ -29,11 +36,21 @@ def _movenet(model, input_image):
       coordinates and scores. The keypoint-order is shown in KEYPOINT_DICT.
       The 3 results are {y, x, confidence}.
     """
-    # SavedModel format expects tensor type of int32.
-    outputs = model(input=tf.cast(input_image, dtype=tf.int32))
-    # output_0 is a [1,1,17, 3] array
-    keypoint_with_scores = outputs["output_0"].numpy()
-    return keypoint_with_scores.squeeze()
+    return _movenet_batch(model, input_image)[0]
+
+#批量模型推理函数
+def _movenet_batch(model, input_images):
+    """Runs detection on a batch of input images.
+
+    Args:
+      model: an InferenceBackend, or a raw SavedModel signature
+      input_images: A [B, height, width, 3] tensor represents the input images.
+        The height/width should already match the expected input resolution of the model.
+    Returns:
+      A [B, 17, 3] float numpy array with the {y, x, confidence} of every keypoint
+      in every image.
+    """
+    return as_backend(model).infer(input_images)
 
 #通过模型计算找到每个关键点的位置和置信度。格式：x,y,置信度
 def _run_inference(model, image, crop_region, crop_size):
@@ -41,71 +58,249 @@ def _run_inference(model, image, crop_region, crop_size):
     model output to the original image coordinate system.
 
     Args:
-      model: the model to use
+      model: the inference backend to use
       image: the image to run inference on
       crop_region: the region of the image to crop the image to
       crop_size: the size
     Returns:
       (17,3) array of the keypoints
     """
-    #
-    image_height, image_width, _ = image.shape
-    input_image = crop_and_resize(
-        tf.expand_dims(image, axis=0), crop_region, crop_size=crop_size
-    )#裁切原始图像
+    return _run_inference_batch(
+        model, tf.expand_dims(image, axis=0), region_to_box(crop_region)[None, :], crop_size
+    )[0]
+
+#对一批帧进行推理，每一帧使用自己的裁剪框
+def _run_inference_batch(model, images, crop_boxes, crop_size):
+    """Runs model inference on a batch of frames, each cropped with its own box.
+
+    Args:
+      model: the inference backend to use
+      images: a [B,H,W,3] tensor of frames
+      crop_boxes: a [B,4] array of normalised {y_min, x_min, y_max, x_max} crop boxes
+      crop_size: the size
+    Returns:
+      (B,17,3) array of the keypoints in the original image coordinate system
+    """
+    model = as_backend(model)
+    start = time.perf_counter()
+    input_images = crop_and_resize_boxes(images, crop_boxes, crop_size=crop_size)#裁切原始图像
     # Run model inference.
-    keypoints_with_scores = _movenet(model, input_image)
-    # Update the coordinates.
-    for idx in range(17):#遍历每个关键点，根据裁剪区域的参数将其坐标转换回原始图像的坐标系
-        keypoints_with_scores[idx, 0] = (
-            crop_region["y_min"] * image_height
-            + crop_region["height"] * image_height * keypoints_with_scores[idx, 0]
-        ) / image_height
-        keypoints_with_scores[idx, 1] = (
-            crop_region["x_min"] * image_width
-            + crop_region["width"] * image_width * keypoints_with_scores[idx, 1]
-        ) / image_width
-    return keypoints_with_scores# 返回包含17个关键点坐标的数组，每个关键点包含y坐标、x坐标和置信度
+    keypoints_with_scores = _movenet_batch(model, input_images)
+    # 根据裁剪框将坐标转换回原始图像的坐标系
+    keypoints_with_scores = unproject_keypoints(keypoints_with_scores, crop_boxes)
+    # 每帧的推理耗时（毫秒），包括裁剪
+    observe(
+        INFERENCE_MS_PER_FRAME, (time.perf_counter() - start) * 1000 / max(len(keypoints_with_scores), 1),
+        backend=model.name,
+    )
+    return keypoints_with_scores# 返回包含每帧17个关键点坐标的数组，每个关键点包含y坐标、x坐标和置信度
 #找到每一帧的关键点数据
-def get_keypoints_from_video(video_tensor, model, input_size):
+def get_keypoints_from_video(video_tensor, model, input_size=None, batch_size=DEFAULT_BATCH_SIZE, stride=1,
+                             progress=None, on_keypoints=None, stop=None):
     """
     从视频中提取关键点。
 
     参数：
-    - video_tensor：一个包含视频数据的张量，其shape为(num_frames, height, width, channels)。
-    - model：用于关键点检测的模型。
-    - input_size：模型输入的尺寸。
+    - video_tensor：一个包含视频数据的张量，其shape为(num_frames, height, width, channels)；
+      也可以是任意逐帧产出 (height, width, channels) 图像的迭代器，例如 stream_video_frames，
+      此时边读取边推理，内存中只保留当前这一批帧。
+    - model：用于关键点检测的推理后端（InferenceBackend），也兼容直接传入SavedModel签名。
+    - input_size：模型输入的尺寸，为None时使用后端的输入尺寸。
+    - batch_size：每次送入模型的帧数。同一批内的帧共用上一批最后一帧确定的裁剪区域，
+      batch_size=1 时与逐帧推理完全一致。
+    - stride：大于1时只对每stride帧推理一次，中间的帧插值得到，见 get_keypoints_strided。
+      跳帧推理需要回头补算，传入迭代器时会先读取全部帧。
+    - progress：可选的回调函数 progress(done, total)，每推理完一批帧调用一次，
+      传入迭代器时 total 为 None。
+    - on_keypoints：可选的回调函数 on_keypoints(keypoints)，每推理完一批帧按顺序传入这一批的关键点，
+      用于边推理边检测踩踏（见 PedalStrokeDetector）。
+    - stop：可选的函数 stop()，每推理完一批帧调用一次，返回True时不再读取后面的帧，
+      只返回已经推理的帧（见 ConvergenceMonitor）。跳帧推理需要全部帧，不检查stop。
 
     返回值：
     - all_keypoints_with_scores：一个列表，包含每一帧的关键点及其分数。
     """
+    if batch_size < 1:
+        raise ValueError("batch_size 必须大于等于1")
+    if stride > 1:
+        if not hasattr(video_tensor, "shape"):
+            video_tensor = np.stack(list(video_tensor))
+        keypoints, _ = get_keypoints_strided(video_tensor, model, input_size, batch_size, stride)
+        if on_keypoints is not None:
+            on_keypoints(keypoints)
+        if progress is not None:
+            progress(len(keypoints), len(keypoints))
+        return list(keypoints)
+    model = as_backend(model)
+    if input_size is None:
+        input_size = model.input_size
 
-    # 获取视频张量的形状信息
-    num_frames, video_height, video_width, _ = video_tensor.shape
+    # 总帧数，迭代器无法提前知道
+    num_frames = video_tensor.shape[0] if hasattr(video_tensor, "shape") else None
 
     # 初始化一个列表来存储所有帧的关键点及其分数
     all_keypoints_with_scores = []
 
-    # 初始化裁剪区域，覆盖整个视频帧
-    crop_region = init_crop_region(video_height, video_width)
-
-    # 遍历每一帧
-    for frame_idx in range(num_frames):
-        # 对当前帧运行推理，获取关键点及其分数，并添加到列表中
-        all_keypoints_with_scores.append(
-            _run_inference(
-                model,
-                video_tensor[frame_idx, :, :, :],
-                crop_region,
-                crop_size=[input_size, input_size],
-            )
-        )
+    # 裁剪区域在读到第一批帧、知道帧尺寸后初始化，覆盖整个视频帧
+    tracker = None
 
-        # 根据当前帧的关键点，确定下一帧的裁剪区域。这个操作可以使模型的越来越聚焦，提高运算效率
-        crop_region = determine_crop_region(
-            all_keypoints_with_scores[frame_idx], video_height, video_width
+    # 按批遍历所有帧
+    for frames in _iter_batches(video_tensor, batch_size):
+        if tracker is None:
+            tracker = CropTracker(frames.shape[1], frames.shape[2])
+        keypoints_with_scores = _run_inference_batch(
+            model,
+            frames,
+            tracker.boxes(frames.shape[0]),
+            crop_size=[input_size, input_size],
         )
+        all_keypoints_with_scores.extend(keypoints_with_scores)
+        if on_keypoints is not None:
+            on_keypoints(keypoints_with_scores)
+        if progress is not None:
+            progress(len(all_keypoints_with_scores), num_frames)
+
+        if stop is not None and stop():
+            break
+
+        # 根据这一批最后一帧的关键点，确定下一批的裁剪区域。这个操作可以使模型的越来越聚焦，提高运算效率
+        tracker.update(keypoints_with_scores[-1])
 
     # 返回所有帧的关键点及其分数
     return all_keypoints_with_scores
 
+#将视频张量或帧迭代器切分为每批batch_size帧
+def _iter_batches(video, batch_size):
+    if hasattr(video, "shape"):
+        for start in range(0, video.shape[0], batch_size):
+            yield video[start : start + batch_size]
+        return
+    frames = iter(video)
+    while True:
+        batch = list(itertools.islice(frames, batch_size))
+        if not batch:
+            return
+        yield np.stack(batch)
+
+#取出指定的帧，numpy数组直接索引，避免把整个视频转换为张量
+def _take_frames(video, indices):
+    if isinstance(video, np.ndarray):
+        return video[indices]
+    return tf.gather(video, indices)
+
+# 跳帧推理时，关键关节的置信度低于该值就补算中间被跳过的帧
+MIN_INTERPOLATION_SCORE = 0.3
+# 相邻锚点之间脚踝y坐标（相对画面高度）的变化小于该值时视为没有方向，关键点的抖动不会被当成踏板的极值
+EXTREMUM_DEADBAND = 0.005
+
+#找出脚踝y坐标的极值所在的锚点区间，返回每个区间 [anchors[k], anchors[k+1]] 是否需要补算
+def _extremum_intervals(anchors, ankle_y, deadband=EXTREMUM_DEADBAND):
+    diff = np.diff(ankle_y)
+    slope = np.where(np.abs(diff) > deadband, np.sign(diff), 0)
+    # 死区内的斜率沿用前一段的方向，平顶的极值只在方向真正改变的地方被识别一次
+    for k in range(1, len(slope)):
+        if slope[k] == 0:
+            slope[k] = slope[k - 1]
+
+    intervals = np.zeros(len(anchors) - 1, dtype=bool)
+    # 斜率在锚点k处变号，极值在k两侧的区间内。用三个锚点拟合抛物线估计极值的位置，只补算极值所在的一侧；
+    # 顶点正好在锚点上时锚点本身就是极值，不需要补算
+    for k in np.flatnonzero(slope[:-1] * slope[1:] < 0) + 1:
+        x = anchors[k - 1 : k + 2].astype(np.float64)
+        y = ankle_y[k - 1 : k + 2].astype(np.float64)
+        a, b, _ = np.polyfit(x, y, 2)
+        if a == 0:
+            intervals[k - 1] = intervals[k] = True
+            continue
+        vertex = -b / (2 * a)
+        if vertex < x[1]:
+            intervals[k - 1] = True
+        elif vertex > x[1]:
+            intervals[k] = True
+    return intervals
+
+#跳帧推理：每stride帧推理一次，其余帧插值，置信度低或脚踝接近极值时补算
+def get_keypoints_strided(video_tensor, model, input_size=None, batch_size=DEFAULT_BATCH_SIZE, stride=4,
+                          min_score=MIN_INTERPOLATION_SCORE, deadband=EXTREMUM_DEADBAND):
+    """
+    跳帧提取关键点。
+
+    先对每stride帧（以及最后一帧）推理，得到锚点帧；相邻锚点之间的帧用线性插值得到。
+    以下两种情况会回头对两个锚点之间被跳过的帧逐帧推理：
+    1. 任一锚点上拍摄侧的髋、膝、踝、肩、肘、腕的置信度低于min_score；
+    2. 拍摄侧脚踝的y坐标在两个锚点之间出现极值，说明踏板的最高点/最低点就在这个区间内，
+       get_lowest_pedal_frames/get_highest_pedal_frames 会选中这些帧，不能用插值代替。
+       变化小于 deadband 的斜率不算作方向改变，极值由三个锚点的抛物线定位到一侧的区间。
+
+    参数：
+    - video_tensor：视频张量 (num_frames, height, width, channels)
+    - model：推理后端
+    - input_size：模型输入的尺寸，为None时使用后端的输入尺寸
+    - batch_size：每次送入模型的帧数
+    - stride：锚点之间的帧间隔
+    - min_score：触发补算的置信度阈值
+    - deadband：判断脚踝极值时忽略的y坐标变化（相对画面高度）
+
+    返回值：
+    - keypoints：(num_frames, 17, 3) 数组
+    - inferred：(num_frames,) 布尔数组，标记哪些帧经过了模型推理，其余帧为插值结果
+    """
+    if stride < 1:
+        raise ValueError("stride 必须大于等于1")
+    model = as_backend(model)
+    if input_size is None:
+        input_size = model.input_size
+    crop_size = [input_size, input_size]
+
+    num_frames, video_height, video_width, _ = video_tensor.shape
+    keypoints = np.zeros((num_frames, 17, 3), dtype=np.float32)
+    inferred = np.zeros(num_frames, dtype=bool)
+    if num_frames == 0:
+        return keypoints, inferred
+
+    # 1. 锚点帧推理，裁剪框在锚点之间传递
+    anchors = np.arange(0, num_frames, stride)
+    if anchors[-1] != num_frames - 1:
+        anchors = np.append(anchors, num_frames - 1)
+    tracker = CropTracker(video_height, video_width)
+    for start in range(0, len(anchors), batch_size):
+        indices = anchors[start : start + batch_size]
+        keypoints[indices] = _run_inference_batch(
+            model, _take_frames(video_tensor, indices), tracker.boxes(len(indices)), crop_size
+        )
+        tracker.update(keypoints[indices[-1]])
+    inferred[anchors] = True
+
+    # 2. 锚点之间线性插值
+    for left, right in zip(anchors[:-1], anchors[1:]):
+        if right - left > 1:
+            weights = np.linspace(0, 1, right - left + 1, dtype=np.float32)[1:-1, None, None]
+            keypoints[left + 1 : right] = (1 - weights) * keypoints[left] + weights * keypoints[right]
+
+    # 3. 找出需要补算的锚点区间
+    front_indices = list(get_front_keypoint_indices(find_camera_facing_side(keypoints[anchors[0]])))
+    ankle_y = keypoints[anchors, front_indices[2], 0]
+    low_confidence = keypoints[anchors][:, front_indices, 2].min(axis=1) < min_score
+    extremum = _extremum_intervals(anchors, ankle_y, deadband)
+
+    refine = []
+    for k in range(len(anchors) - 1):
+        left, right = anchors[k], anchors[k + 1]
+        if right - left <= 1:
+            continue
+        if low_confidence[k] or low_confidence[k + 1] or extremum[k]:
+            refine.extend(range(left + 1, right))
+
+    # 4. 对被选中的帧推理，裁剪框由该区间左侧锚点的关键点确定
+    refine = np.array(refine, dtype=np.int64)
+    if len(refine):
+        left_anchors = anchors[np.searchsorted(anchors, refine, side="right") - 1]
+        boxes = determine_crop_boxes(keypoints[left_anchors], video_height, video_width)
+        for start in range(0, len(refine), batch_size):
+            indices = refine[start : start + batch_size]
+            keypoints[indices] = _run_inference_batch(
+                model, _take_frames(video_tensor, indices), boxes[start : start + batch_size], crop_size
+            )
+        inferred[refine] = True
+
+    return keypoints, inferred
@@ -1,21 +1,23 @@
-from flask import Flask, request, jsonify
 import os
-import tempfile
-import tensorflow as tf
-import tensorflow_hub as hub
 import numpy as np
-import cv2
-import kagglehub
 
 from .model import load_model_from_tfhub, get_keypoints_from_video
+from .registry import get_model
+from .keypoint_store import get_keypoint_store, model_version
+from .pose_track import PoseTrack
 from .preprocessing import pre_process_video
+from .segment_decoder import open_video_frames, read_video_frames_parallel
+from .stroke_detector import PedalStrokeDetector
+from .convergence import ConvergenceMonitor, STOP_CACHED, STOP_CONVERGED, STOP_END_OF_VIDEO
+from telemetry import span
 from .postprocessing import (find_camera_facing_side,
                           get_front_keypoint_indices,
                           get_lowest_pedal_frames,
                           get_highest_pedal_frames,
                           filter_bad_knee_angles,
                           get_hip_knee_ankle_angle,
-                          calculate_angle)
+                          calculate_angles,
+                          get_frame_rate)
 
 """
     初始化函数，用于加载MoveNet Thunder模型。
@@ -27,35 +29,44 @@ def init():
     """
     初始化函数，用于加载MoveNet Thunder模型。
 
-    该函数通过调用load_model_from_tfhub函数来加载模型。
+    模型由进程内共享的注册表加载，只有第一次调用会真正加载模型，之后直接复用。
     并且初始化两个全局变量：model和input_size，分别用于存储加载的模型和模型输入的大小。
     """
     global model, input_size
-    model, input_size = load_model_from_tfhub()
+    model, input_size = get_model()
 
 def upload_video(file: str|bytes):
-    init()
+    model, input_size = get_model()
 
-    tensors = pre_process_video(file)
+    buffer = read_video_frames_parallel(file)
 
-    all_keypoints = get_keypoints_from_video(tensors, model, input_size)
+    all_keypoints = get_keypoints_from_video(buffer.frames, model, input_size)
 
-    result = get_pose(all_keypoints)
+    result = get_pose(PoseTrack(all_keypoints, buffer.timestamps))
 
     return result
 
 #获取髋，膝盖，肩膀，手肘的角度
-def get_pose(all_keypoints):
-    facing_direction = find_camera_facing_side(all_keypoints[0])
-    front_indices = get_front_keypoint_indices(facing_direction)
+def get_pose(all_keypoints, fps=None):
+    """
+    参数:
+        all_keypoints: PoseTrack，或每一帧 (17,3) 关键点的列表/数组
+        fps: 关键点的帧率，用于把踏板最高点/最低点之间的最小间隔从时间换算为帧数，
+            默认使用PoseTrack时间戳得到的帧率，都没有时使用10帧
+    """
+    # 所有测量共用同一个轨迹，脚踝y坐标和关节角度只计算一次
+    all_keypoints = PoseTrack.from_keypoints(all_keypoints)
+    if fps is None:
+        fps = all_keypoints.fps
+    front_indices = all_keypoints.front_indices
     hip_knee_ankle_indices = front_indices[:4]
 
     # 预先计算最低点和最高点的帧索引
     lowest_pedal_point_indices = get_lowest_pedal_frames(
-        all_keypoints, hip_knee_ankle_indices
+        all_keypoints, hip_knee_ankle_indices, fps
     )
     highest_pedal_point_indices = get_highest_pedal_frames(
-        all_keypoints, hip_knee_ankle_indices
+        all_keypoints, hip_knee_ankle_indices, fps
     )
 
     # 获取膝盖最低点角度的平均数
@@ -97,15 +108,10 @@ def get_pose(all_keypoints):
 #获取膝盖最大角度的平均数
 def get_knee_angle_at_lowest_pedal_points_avg(all_keypoints, hip_knee_ankle_indices, lowest_pedal_point_indices):
     # 获取所有帧的膝盖角度
-    knee_angles = [
-        get_hip_knee_ankle_angle(kp, hip_knee_ankle_indices)
-        for kp in all_keypoints
-    ]
+    knee_angles = calculate_angles(all_keypoints, [hip_knee_ankle_indices[:3]])[:, 0]
 
     # 从所有踏板角度中找到最位置最低的帧的膝盖角度
-    angles_at_lowest_pedal_points = [
-        knee_angles[i] for i in lowest_pedal_point_indices
-    ]
+    angles_at_lowest_pedal_points = knee_angles[np.asarray(lowest_pedal_point_indices, dtype=np.intp)]
 
     # 排除不正常的角度和帧，进一步增加稳定性
     filtered_angles, filtered_indices = filter_bad_knee_angles(
@@ -125,15 +131,10 @@ def get_knee_angle_at_lowest_pedal_points_avg(all_keypoints, hip_knee_ankle_indi
 #获取膝盖最小角度的平均数
 def get_knee_angle_at_highest_pedal_points_avg(all_keypoints, hip_knee_ankle_indices, highest_pedal_point_indices):
     # 获取所有帧的膝盖角度
-    knee_angles = [
-        get_hip_knee_ankle_angle(kp, hip_knee_ankle_indices)
-        for kp in all_keypoints
-    ]
+    knee_angles = calculate_angles(all_keypoints, [hip_knee_ankle_indices[:3]])[:, 0]
 
     # 从所有踏板角度中找到最位置最高的帧的膝盖角度
-    angles_at_highest_pedal_points = [
-        knee_angles[i] for i in highest_pedal_point_indices
-    ]
+    angles_at_highest_pedal_points = knee_angles[np.asarray(highest_pedal_point_indices, dtype=np.intp)]
 
     # 取最小膝盖角度的平均数和方差
     if len(angles_at_highest_pedal_points) > 0:
@@ -149,17 +150,8 @@ def get_shoulder_angle_avg(all_keypoints, front_indices):
     elbow_index = front_indices[4]  # 手肘索引
     hip_index = front_indices[0]  # 髋关节索引
 
-    # 计算所有帧的肩膀角度
-    shoulder_angles = []
-    for kp in all_keypoints:
-        # 获取三个点的坐标
-        [shoulder_y, shoulder_x] = kp[shoulder_index][0:-1]
-        [elbow_y, elbow_x] = kp[elbow_index][0:-1]
-        [hip_y, hip_x] = kp[hip_index][0:-1]
-        
-        # 计算角度：手肘-肩膀-髋部的夹角
-        angle = calculate_angle((elbow_y, elbow_x), (shoulder_y, shoulder_x), (hip_y, hip_x))
-        shoulder_angles.append(angle)
+    # 计算所有帧的肩膀角度：手肘-肩膀-髋部的夹角
+    shoulder_angles = calculate_angles(all_keypoints, [(elbow_index, shoulder_index, hip_index)])[:, 0]
 
     # 取所有肩膀角度的平均值
     if len(shoulder_angles) > 0:
@@ -176,16 +168,7 @@ def get_elbow_angle_avg(all_keypoints, front_indices):
     wrist_index = front_indices[5]  # 手腕索引
 
     # 计算所有帧的手肘角度
-    elbow_angles = []
-    for kp in all_keypoints:
-        # 获取三个点的坐标
-        [shoulder_y, shoulder_x] = kp[shoulder_index][0:-1]
-        [elbow_y, elbow_x] = kp[elbow_index][0:-1]
-        [wrist_y, wrist_x] = kp[wrist_index][0:-1]
-        
-        # 计算角度
-        angle = calculate_angle((shoulder_y, shoulder_x), (elbow_y, elbow_x), (wrist_y, wrist_x))
-        elbow_angles.append(angle)
+    elbow_angles = calculate_angles(all_keypoints, [(shoulder_index, elbow_index, wrist_index)])[:, 0]
 
     # 取所有手肘角度的平均值
     if len(elbow_angles) > 0:
@@ -195,22 +178,19 @@ def get_elbow_angle_avg(all_keypoints, front_indices):
 
     return elbow_angle_avg
 
-#获取髋关节最低点角度的平均数
-def get_hip_angle_at_lowest_pedal_points_avg(all_keypoints, front_indices, lowest_pedal_point_indices):
+#计算指定帧的髋关节角度：肩膀-髋-膝盖的夹角
+def _hip_angles_at(all_keypoints, front_indices, frame_indices):
     shoulder_index = front_indices[3]  # 肩膀索引
     hip_index = front_indices[0]  # 髋关节索引
     knee_index = front_indices[1]  # 膝盖索引
 
+    hip_angles = calculate_angles(all_keypoints, [(shoulder_index, hip_index, knee_index)])[:, 0]
+    return hip_angles[np.asarray(frame_indices, dtype=np.intp)]
+
+#获取髋关节最低点角度的平均数
+def get_hip_angle_at_lowest_pedal_points_avg(all_keypoints, front_indices, lowest_pedal_point_indices):
     # 计算最低点帧的髋关节角度
-    hip_angles = []
-    for idx in lowest_pedal_point_indices:
-        kp = all_keypoints[idx]
-        [shoulder_y, shoulder_x] = kp[shoulder_index][0:-1]
-        [hip_y, hip_x] = kp[hip_index][0:-1]
-        [knee_y, knee_x] = kp[knee_index][0:-1]
-        
-        angle = calculate_angle((shoulder_y, shoulder_x), (hip_y, hip_x), (knee_y, knee_x))
-        hip_angles.append(angle)
+    hip_angles = _hip_angles_at(all_keypoints, front_indices, lowest_pedal_point_indices)
 
     # 取平均值
     if len(hip_angles) > 0:
@@ -222,20 +202,8 @@ def get_hip_angle_at_lowest_pedal_points_avg(all_keypoints, front_indices, lowes
 
 #获取髋关节最高点角度的平均数
 def get_hip_angle_at_highest_pedal_points_avg(all_keypoints, front_indices, highest_pedal_point_indices):
-    shoulder_index = front_indices[3]  # 肩膀索引
-    hip_index = front_indices[0]  # 髋关节索引
-    knee_index = front_indices[1]  # 膝盖索引
-
     # 计算最高点帧的髋关节角度
-    hip_angles = []
-    for idx in highest_pedal_point_indices:
-        kp = all_keypoints[idx]
-        [shoulder_y, shoulder_x] = kp[shoulder_index][0:-1]
-        [hip_y, hip_x] = kp[hip_index][0:-1]
-        [knee_y, knee_x] = kp[knee_index][0:-1]
-        
-        angle = calculate_angle((shoulder_y, shoulder_x), (hip_y, hip_x), (knee_y, knee_x))
-        hip_angles.append(angle)
+    hip_angles = _hip_angles_at(all_keypoints, front_indices, highest_pedal_point_indices)
 
     # 取平均值
     if len(hip_angles) > 0:
@@ -274,7 +242,7 @@ def test_pose_analyzer():
         print(f"  - 处理的视频帧数: {len(frames)}")
         print(f"  - 张量形状: {tensors.shape}")
         print(f"  - 张量数据类型: {tensors.dtype}")
-        print(f"  - 张量值范围: [{tf.reduce_min(tensors):.2f}, {tf.reduce_max(tensors):.2f}]")
+        print(f"  - 张量值范围: [{tensors.min()}, {tensors.max()}]")
         print("✓ 视频预处理成功")
     except Exception as e:
         print(f"✗ 视频预处理失败: {str(e)}")
@@ -335,57 +303,165 @@ import os
 import tempfile
 from typing import Union
 
-def pose_analyzer(file: Union[str, bytes]) -> dict:
+# 跳帧推理的帧间隔，POSE_INFERENCE_STRIDE 大于1时只对每stride帧推理，中间的帧插值得到（见 get_keypoints_strided）。
+# 跳帧推理需要先读取全部帧，不会因为测量收敛而提前停止
+INFERENCE_STRIDE = int(os.getenv("POSE_INFERENCE_STRIDE", "1"))
+
+#统计已解码的帧数，每解码every帧报告一次进度
+def _report_decoded(frames, progress, every=8):
+    count = 0
+    for frame in frames:
+        count += 1
+        if count % every == 0:
+            progress("decoded", frames=count)
+        yield frame
+    progress("decoded", frames=count)
+
+#边推理边检测踩踏，每确认一次上/下止点就报告这一帧的膝盖和髋关节角度，并和逐帧的肩膀、手肘角度一起交给monitor判断测量是否已经收敛
+def _report_strokes(timestamps, progress, monitor):
+    detector = None
+
+    def on_keypoints(keypoints):
+        nonlocal detector
+        if detector is None:
+            # 帧率由已经解码的帧的时间戳估计，决定相邻两次踩踏之间的最小间隔
+            detector = PedalStrokeDetector(get_frame_rate(timestamps))
+        for keypoints_frame in keypoints:
+            frame = detector.count
+            timestamp = timestamps[frame] if frame < len(timestamps) else None
+            events = detector.update(keypoints_frame, timestamp)
+            monitor.add_frame(keypoints_frame, detector.facing_side)
+            for event in events:
+                _report_stroke(event, progress)
+                monitor.add(event)
+
+    def flush():
+        if detector is not None:
+            for event in detector.flush():
+                _report_stroke(event, progress)
+
+    return on_keypoints, flush
+
+def _report_stroke(event, progress):
+    progress(
+        "stroke", kind=event.kind, frame=event.frame, timestamp=event.timestamp,
+        knee_angle=event.knee_angle, hip_angle=event.hip_angle,
+    )
+
+def _infer_keypoints(file, model, input_size, progress):
+    """
+    边解码视频边推理每一帧的关键点，返回 (关键点列表, 每帧的时间戳, 停止的原因)，出错时返回包含error的字典。
+    每次踩踏的测量收敛后（见 ConvergenceMonitor）停止解码和推理，停止的原因为 "converged"，否则为 "end_of_video"。
+    INFERENCE_STRIDE 大于1时跳帧推理全部帧。
+    """
+    # 解码线程和姿态检测同时进行，内存中只保留有限的帧；长的高分辨率视频先分段并行解码
+    print("\n2. 解码视频并检测姿态...")
+    try:
+        with span("pose.infer") as attrs:
+            frames, timestamps = open_video_frames(file)
+            if isinstance(frames, np.ndarray):
+                progress("decoded", frames=len(frames))
+            else:
+                frames = _report_decoded(frames, progress)
+            monitor = ConvergenceMonitor()
+            on_keypoints, flush_strokes = _report_strokes(timestamps, progress, monitor)
+            all_keypoints = get_keypoints_from_video(
+                frames, model, input_size, stride=INFERENCE_STRIDE,
+                progress=lambda done, total: progress("inferring", done=done, total=total),
+                on_keypoints=on_keypoints,
+                stop=lambda: monitor.converged,
+            )
+            # 跳帧推理总是处理全部帧
+            stop_reason = STOP_CONVERGED if INFERENCE_STRIDE <= 1 and monitor.converged else STOP_END_OF_VIDEO
+            if hasattr(frames, "close"):
+                # 提前停止时结束后台解码线程
+                frames.close()
+            flush_strokes()
+            attrs.update(frames=len(all_keypoints), stop_reason=stop_reason)
+    except Exception as e:
+        return {"error": f"视频处理失败: {str(e)}"}
+    if not all_keypoints:
+        return {"error": "视频预处理失败: 视频中没有可以读取的帧"}
+
+    print(f"  - 处理的视频帧数: {len(all_keypoints)}")
+    print(f"  - 单帧关键点形状: {all_keypoints[0].shape}")
+    if stop_reason == STOP_CONVERGED:
+        print(f"  - {monitor.strokes} 次踩踏后测量已收敛，提前停止解码和推理")
+    print("✓ 姿态检测成功")
+    # 解码可能领先于推理，只保留已推理的帧的时间戳
+    return all_keypoints, timestamps[:len(all_keypoints)], stop_reason
+
+def _ignore_progress(stage, **data):
+    pass
+
+def pose_analyzer(file: Union[str, bytes], progress=None) -> dict:
     """
     姿态分析器的主函数，接收文件路径或字节数据，处理后返回姿态分析结果。
 
     参数:
         file (str | bytes): 文件路径或字节数据。
+        progress: 可选的回调函数 progress(stage, **data)，依次报告
+            "decoded"（frames）、"inferring"（done, total）和 "measurements"（measurements, analysis）。
+            推理过程中每确认一次踏板的上/下止点报告一次 "stroke"（kind 为 "bdc" 或 "tdc"，
+            frame, timestamp, knee_angle, hip_angle）；命中关键点缓存时不报告。
 
     返回:
-        dict: 包含姿态分析结果的字典。
+        dict: 包含姿态分析结果的字典。分析过程的信息放在 analysis 键下，不是测量值，生成建议前需要去掉：
+            stop_reason（"converged" 测量已收敛提前停止、"end_of_video" 处理到视频结束或帧数上限、
+            "cached" 使用缓存的关键点）和 frames_processed。
     """
+    progress = progress or _ignore_progress
     # 初始化模型
     print("1. 初始化模型...")
     try:
-        init()
+        with span("pose.model"):
+            model, input_size = get_model()
         print("✓ 模型初始化成功")
     except Exception as e:
         return {"error": f"模型初始化失败: {str(e)}"}
     
-    # 预处理视频
-    print("\n2. 预处理视频...")
-    try:
-        frames, tensors = pre_process_video(file)
-        print(f"  - 处理的视频帧数: {len(frames)}")
-        print(f"  - 张量形状: {tensors.shape}")
-        print(f"  - 张量数据类型: {tensors.dtype}")
-        print(f"  - 张量值范围: [{tf.reduce_min(tensors):.2f}, {tf.reduce_max(tensors):.2f}]")
-        print("✓ 视频预处理成功")
-    except Exception as e:
-        return {"error": f"视频预处理失败: {str(e)}"}
-
-    # 姿态检测
-    print("\n3. 姿态检测...")
+    # 查询关键点缓存，同一段视频不需要重新解码和推理
     try:
-        all_keypoints = get_keypoints_from_video(tensors, model, input_size)
-        print(f"  - 关键点数量: {len(all_keypoints)}")
-        print(f"  - 单帧关键点形状: {all_keypoints[0].shape}")
-        print("✓ 姿态检测成功")
-    except Exception as e:
-        return {"error": f"姿态检测失败: {str(e)}"}
+        with span("pose.cache_lookup") as attrs:
+            store = get_keypoint_store()
+            store_key = store.key(file, model_version(model, INFERENCE_STRIDE))
+            all_keypoints = store.get(store_key)
+            timestamps = store.get_timestamps(store_key) if all_keypoints is not None else None
+            attrs["hit"] = all_keypoints is not None
+    except OSError as e:
+        print(f"  - 关键点缓存不可用: {str(e)}")
+        store_key, all_keypoints, timestamps = None, None, None
+
+    if all_keypoints is not None:
+        print(f"\n✓ 命中关键点缓存（{len(all_keypoints)} 帧），跳过视频预处理和姿态检测")
+        progress("decoded", frames=len(all_keypoints), cached=True)
+        progress("inferring", done=len(all_keypoints), total=len(all_keypoints))
+        stop_reason = STOP_CACHED
+    else:
+        inferred = _infer_keypoints(file, model, input_size, progress)
+        if isinstance(inferred, dict):
+            return inferred
+        all_keypoints, timestamps, stop_reason = inferred
+        # 提前停止时只有视频开头的一部分帧，不能作为整段视频的关键点缓存；收敛本身很快，下次重新推理即可
+        if store_key is not None and stop_reason == STOP_END_OF_VIDEO:
+            try:
+                store.put(store_key, all_keypoints, timestamps)
+            except OSError as e:
+                print(f"  - 关键点缓存写入失败: {str(e)}")
 
     # 姿态分析
     print("\n4. 姿态分析...")
     try:
         # 获取朝向和关键点索引
-        facing_direction = find_camera_facing_side(all_keypoints[0])
-        front_indices = get_front_keypoint_indices(facing_direction)
-        print(f"  - 检测到的朝向: {facing_direction}")
-        print(f"  - 关键点索引: {front_indices}")
+        track = PoseTrack(all_keypoints, timestamps)
+        print(f"  - 检测到的朝向: {track.facing_side}")
+        print(f"  - 关键点索引: {track.front_indices}")
+        print(f"  - 帧率: {f'{track.fps:.1f}' if track.fps else '未知'}")
 
         # 获取完整结果
-        result = get_pose(all_keypoints)
+        with span("pose.measure", frames=len(track)):
+            result = get_pose(track)
+        analysis = {"stop_reason": stop_reason, "frames_processed": len(track)}
         print("\n姿态分析结果:")
         print(f"  - 最低点膝盖角度: {result['knee_angle_lowest']:.2f}°")
         print(f"  - 最高点膝盖角度: {result['knee_angle_highest']:.2f}°")
@@ -393,12 +469,15 @@ def pose_analyzer(file: Union[str, bytes]) -> dict:
         print(f"  - 手肘角度: {result['elbow_angle']:.2f}°")
         print(f"  - 最低点髋关节角度: {result['hip_angle_lowest']:.2f}°")
         print(f"  - 最高点髋关节角度: {result['hip_angle_highest']:.2f}°")
+        print(f"  - 停止原因: {stop_reason}（{len(track)} 帧）")
         print("✓ 姿态分析成功")
-
-        # 返回结果
-        return result
     except Exception as e:
-        return {"error": f"姿态分析失败: {str(e)}", "traceback": e.traceback.format_exc()}
+        import traceback
+        return {"error": f"姿态分析失败: {str(e)}", "traceback": traceback.format_exc()}
+
+    progress("measurements", measurements=result, analysis=analysis)
+    # 返回结果
+    return {**result, "analysis": analysis}
 
 if __name__ == "__main__":
     test_pose_analyzer()
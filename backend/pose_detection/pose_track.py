@@ -0,0 +1,108 @@
+import numpy as np
+
+from pose_detection.postprocessing import (
+    JOINT_ANGLE_TRIPLETS,
+    calculate_angles,
+    find_camera_facing_side,
+    get_frame_rate,
+    get_front_keypoint_indices,
+    get_joint_angle_triplets,
+)
+
+# 程序功能：整段视频的关键点轨迹，所有测量共用同一份关键点数组和按需计算、缓存的派生列
+
+
+class PoseTrack:
+    """Columnar keypoint track of one video with memoised derived columns.
+
+    The keypoints live in one contiguous (N,17,3) float32 array. Derived
+    columns (a keypoint's y series, the confidences, joint angles) are
+    computed on first use and cached, so every metric of get_pose reads the
+    same precomputed column. A PoseTrack also behaves like the list of
+    (17,3) frames used elsewhere: it supports len(), indexing, iteration
+    and np.asarray().
+    """
+
+    __slots__ = ("keypoints", "timestamps", "facing_side", "_series", "_angles", "_fps")
+
+    def __init__(self, keypoints, timestamps=None, facing_side=None):
+        """
+        参数:
+            keypoints: (N,17,3) 数组，或每帧 (17,3) 关键点的列表
+            timestamps: 可选的每帧时间戳（秒）
+            facing_side: 拍摄侧 'left' / 'right'，默认由第一帧判断
+        """
+        self.keypoints = np.ascontiguousarray(np.asarray(keypoints, dtype=np.float32).reshape(-1, 17, 3))
+        if len(self.keypoints) == 0:
+            raise ValueError("关键点轨迹不能为空")
+        self.timestamps = None if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        self.facing_side = facing_side or find_camera_facing_side(self.keypoints[0])
+        self._series = {}
+        self._angles = {}
+        self._fps = False
+
+    @classmethod
+    def from_keypoints(cls, keypoints, timestamps=None):
+        """Returns keypoints unchanged if it already is a PoseTrack, otherwise wraps it."""
+        if isinstance(keypoints, cls):
+            return keypoints
+        return cls(keypoints, timestamps)
+
+    def __len__(self):
+        return len(self.keypoints)
+
+    def __getitem__(self, index):
+        return self.keypoints[index]
+
+    def __iter__(self):
+        return iter(self.keypoints)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.keypoints if dtype is None else self.keypoints.astype(dtype)
+
+    @property
+    def fps(self):
+        """Frame rate estimated from the timestamps, None without timestamps."""
+        if self._fps is False:
+            self._fps = get_frame_rate(self.timestamps) if self.timestamps is not None else None
+        return self._fps
+
+    @property
+    def front_indices(self):
+        """(hip, knee, ankle, shoulder, elbow, wrist) keypoint indices of the camera-facing side."""
+        return get_front_keypoint_indices(self.facing_side)
+
+    def keypoint_series(self, index, channel):
+        """Returns the (N,) column of one keypoint's y (0), x (1) or confidence (2)."""
+        key = (int(index), int(channel))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = np.ascontiguousarray(self.keypoints[:, key[0], key[1]])
+        return series
+
+    @property
+    def ankle_y(self):
+        """(N,) y coordinate of the camera-facing ankle."""
+        return self.keypoint_series(self.front_indices[2], 0)
+
+    @property
+    def confidences(self):
+        """(N,17) confidence of every keypoint."""
+        return self.keypoints[:, :, 2]
+
+    def triplet_angles(self, triplets):
+        """Returns the (N,T) angles of keypoint triplets, computing only the ones not cached yet."""
+        rows = [tuple(int(i) for i in row) for row in np.asarray(triplets, dtype=np.intp).reshape(-1, 3)]
+        missing = [row for row in dict.fromkeys(rows) if row not in self._angles]
+        if missing:
+            # 缺少的角度在一次广播计算中得到
+            angles = calculate_angles(self.keypoints, missing)
+            for column, row in enumerate(missing):
+                self._angles[row] = angles[:, column]
+        return np.stack([self._angles[row] for row in rows], axis=1)
+
+    def joint_angle(self, joint):
+        """(N,) angle of a joint from JOINT_ANGLE_TRIPLETS on the camera-facing side."""
+        if joint not in JOINT_ANGLE_TRIPLETS:
+            raise ValueError(f"未知的关节: {joint}，可选: {', '.join(JOINT_ANGLE_TRIPLETS)}")
+        return self.triplet_angles(get_joint_angle_triplets(self.facing_side, (joint,)))[:, 0]
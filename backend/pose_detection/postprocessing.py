@@ -7,6 +7,35 @@ import numpy as np
 from scipy.signal import find_peaks
 from pose_detection.keypoints import KEYPOINT_DICT
 
+# 相邻两次踏板最高点（或最低点）之间的最短时间由最高踏频决定：180rpm 对应 1/3 秒，即30fps下的10帧
+MAX_CADENCE_RPM = 180
+# 不知道帧率时，相邻峰值之间至少间隔的帧数
+DEFAULT_PEAK_DISTANCE = 10
+# 踏板最低点（画面中脚踝y最小，即曲柄上止点）时合理的膝盖角度范围，超出范围的多是关键点识别错误
+# 正常骑行的膝盖角度在上止点约65-75度，下止点约140-150度
+TDC_KNEE_ANGLE_RANGE = (40, 120)
+
+#根据帧率和最高踏频计算find_peaks的最小峰值间隔（帧）
+def get_peak_distance(fps=None, max_cadence=MAX_CADENCE_RPM):
+    """Returns the minimum number of frames between two pedal strokes.
+
+    Args:
+        fps: frame rate of the keypoints, None keeps the historical 10 frames
+        max_cadence: the highest expected cadence in revolutions per minute
+    """
+    if not fps:
+        return DEFAULT_PEAK_DISTANCE
+    return max(1, int(round(fps * 60 / max_cadence)))
+
+#根据每帧的时间戳估计帧率，时间戳不足或无效时返回None
+def get_frame_rate(timestamps):
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) < 2 or np.isnan(timestamps).any():
+        return None
+    # 使用帧间隔的中位数，不受可变帧率视频中个别长间隔的影响
+    interval = np.median(np.diff(timestamps))
+    return 1 / interval if interval > 0 else None
+
 #分析视频的拍摄朝向
 def find_camera_facing_side(keypoints):
     """Returns whether the cyclist is facing the camera with his left or right side
@@ -30,22 +59,28 @@ def get_front_keypoint_indices(facing_dir):
     wrist_index = KEYPOINT_DICT[f"{facing_dir}_wrist"]
     return hip_index, knee_index, ankle_index, shoulder_index, elbow_index, wrist_index
 
+#读取所有帧中某个关键点的一个分量（0:y，1:x，2:置信度），PoseTrack直接返回缓存的列
+def get_keypoint_series(all_keypoints, index, channel):
+    if hasattr(all_keypoints, "keypoint_series"):
+        return all_keypoints.keypoint_series(index, channel)
+    # Iterate through all frames to collect the coordinate of the keypoint
+    return np.array([all_keypoints[frame_idx][index][channel] for frame_idx in range(len(all_keypoints))])
+
 #分析每帧中脚踝点的y坐标，找出踏板位置最高的帧
-def get_highest_pedal_frames(all_keypoints, hip_knee_ankle_indices):
+def get_highest_pedal_frames(all_keypoints, hip_knee_ankle_indices, fps=None, max_cadence=MAX_CADENCE_RPM):
     ankle_index = hip_knee_ankle_indices[2]  # 获取脚踝位置的索引
-    ankle_y_values = []
-    # Iterate through all frames to collect the y-coordinates of the ankle points
-    for frame_idx in range(len(all_keypoints)):  # 遍历所有帧，收集所有脚踝y坐标
-        ankle_y_values.append(all_keypoints[frame_idx][ankle_index][0])#找到最高点
+    ankle_y_values = get_keypoint_series(all_keypoints, ankle_index, 0)  # 收集所有脚踝y坐标，找到最高点
+    if fps is None:
+        fps = getattr(all_keypoints, "fps", None)
     # the distance variable lets you to easily pick only the highest peak values and ignore local jitters in a pedal rotation
     peak_indices = (
-        find_peaks(ankle_y_values, distance=10)
+        find_peaks(ankle_y_values, distance=get_peak_distance(fps, max_cadence))
     )[0]  # 找到最高点的坐标索引
-    # distance=10 参数确保了相邻的峰值之间至少有 20 个数据点的距离，从而过滤掉局部抖动，只保留明显的峰值。
+    # distance 参数确保了相邻的峰值之间至少间隔一次踩踏的时间，从而过滤掉局部抖动，只保留明显的峰值。
     return peak_indices
 
 #分析每帧中脚踝点的y坐标，找出踏板位置最低的帧
-def get_lowest_pedal_frames(all_keypoints, hip_knee_ankle_indices):
+def get_lowest_pedal_frames(all_keypoints, hip_knee_ankle_indices, fps=None, max_cadence=MAX_CADENCE_RPM):
     """
     Find the frames with the lowest pedal position.
 
@@ -55,21 +90,24 @@ def get_lowest_pedal_frames(all_keypoints, hip_knee_ankle_indices):
 
     Parameters:
     all_keypoints (list of list of tuple): A list containing keypoint information for each frame, each keypoint is represented
-                                          as a tuple, and each frame's keypoints are stored in a list.
+                                          as a tuple, and each frame's keypoints are stored in a list. A PoseTrack is
+                                          also accepted and provides its cached ankle column and frame rate.
     hipkneeankleindices (list): A list containing the indices of the hip, knee, and ankle keypoints in the keypoints list.
+    fps (float): The frame rate of the keypoints, defaults to the PoseTrack's. The minimum distance between two peaks is one stroke at
+                 max_cadence; without a frame rate it is 10 frames.
+    max_cadence (float): The highest expected cadence in revolutions per minute.
 
     Returns:
     list: A list of indices representing the frames with the lowest pedal positions.
     """
     # Get the ankle index to track changes in the y-coordinate of the ankle point
     ankle_index = hip_knee_ankle_indices[2]#获取脚踝位置的索引
-    ankle_y_values = []
-    # Iterate through all frames to collect the y-coordinates of the ankle points
-    for frame_idx in range(len(all_keypoints)):#遍历所有帧，收集所有脚踝y坐标
-        ankle_y_values.append(-1 * all_keypoints[frame_idx][ankle_index][0])#将所有元素取反
+    ankle_y_values = -get_keypoint_series(all_keypoints, ankle_index, 0)#收集所有脚踝y坐标，将所有元素取反
+    if fps is None:
+        fps = getattr(all_keypoints, "fps", None)
     # the distance variable lets you to easily pick only the highest peak values and ignore local jitters in a pedal rotation
-    peak_indices = find_peaks(ankle_y_values, distance=10)[0]#找到所有的峰值。
-    # distance=10 参数确保了相邻的峰值之间至少有 10 个数据点的距离，从而过滤掉局部抖动，只保留明显的峰值。
+    peak_indices = find_peaks(ankle_y_values, distance=get_peak_distance(fps, max_cadence))[0]#找到所有的峰值。
+    # distance 参数确保了相邻的峰值之间至少间隔一次踩踏的时间，从而过滤掉局部抖动，只保留明显的峰值。
     return peak_indices
 
 #获取膝盖的角度
@@ -87,7 +125,7 @@ def calculate_angle(coords1, coordsmid, coords2):
     [coords2_x, coords2_y] = coords2
     # 计算向量
     vector1 = (coords1_x - coordsmid_x, coords1_y - coordsmid_y)  # 从肩膀到肘部
-    vector2 = (coords2_x - coordsmid_x, coords1_y - coordsmid_x)  # 从肩膀到髋部
+    vector2 = (coords2_x - coordsmid_x, coords2_y - coordsmid_y)  # 从肩膀到髋部
 
     # 计算向量的模长
     length_shoulder_elbow = math.sqrt(vector1[0] ** 2 + vector1[1] ** 2)
@@ -109,27 +147,92 @@ def calculate_angle(coords1, coordsmid, coords2):
 
     return angle
 
+# 各关节角度由哪三个关键点确定，中间的点是角的顶点，按拍摄侧加上 left_/right_ 前缀
+JOINT_ANGLE_TRIPLETS = {
+    "knee": ("hip", "knee", "ankle"),
+    "hip": ("shoulder", "hip", "knee"),
+    "shoulder": ("elbow", "shoulder", "hip"),
+    "elbow": ("shoulder", "elbow", "wrist"),
+}
+
+#得到拍摄侧每个关节角度对应的关键点索引
+def get_joint_angle_triplets(facing_dir, joints=tuple(JOINT_ANGLE_TRIPLETS)):
+    """Returns a (T,3) int array with the keypoint indices of every joint angle of one side.
+
+    Args:
+        facing_dir: 'left' or 'right', see find_camera_facing_side
+        joints: names from JOINT_ANGLE_TRIPLETS, one row per name in this order
+    """
+    return np.array(
+        [[KEYPOINT_DICT[f"{facing_dir}_{name}"] for name in JOINT_ANGLE_TRIPLETS[joint]] for joint in joints],
+        dtype=np.intp,
+    )
+
+#一次计算所有帧的多个关节角度
+def calculate_angles(keypoints, triplets):
+    """Computes joint angles over a whole keypoint track in one broadcast pass.
+
+    Same result as calling calculate_angle on every frame and triplet, except
+    that a zero-length vector gives NaN instead of raising.
+
+    Args:
+        keypoints: (N,17,3) array of {y, x, score}, a list of (17,3) arrays, or
+            a PoseTrack, which returns its cached angles
+        triplets: (T,3) keypoint indices, the middle one is the vertex
+    Returns:
+        (N,T) float64 array of angles in degrees
+    """
+    if hasattr(keypoints, "triplet_angles"):
+        return keypoints.triplet_angles(triplets)
+    coords = np.asarray(keypoints, dtype=np.float64)[..., :2]
+    triplets = np.asarray(triplets, dtype=np.intp).reshape(-1, 3)
+    # (N,T,2)
+    vertex = coords[:, triplets[:, 1]]
+    vector1 = coords[:, triplets[:, 0]] - vertex
+    vector2 = coords[:, triplets[:, 2]] - vertex
+
+    lengths = np.linalg.norm(vector1, axis=-1) * np.linalg.norm(vector2, axis=-1)
+    dot_product = np.einsum("ntc,ntc->nt", vector1, vector2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_theta = np.where(lengths > 0, dot_product / lengths, np.nan)
+    return np.degrees(np.arccos(np.clip(cos_theta, -1.0, 1.0)))
+
 #筛选不合理的膝盖角度
-def filter_bad_knee_angles(angles, indices, m=2.0):
+def filter_bad_knee_angles(angles, indices, m=2.0, angle_range=TDC_KNEE_ANGLE_RANGE):
     """Filters out outliers from the passed list.
     Args:
         angles: 需要筛选的角度
         indices: 需要筛选的帧
         m: the maximum distance
+        angle_range: (最小, 最大) 合理角度，默认为上止点的膝盖角度范围
     """
     indices = np.array(indices)
     angles = np.array(angles)
-    mask = (90 < angles) & (angles < 170)
+    mask = (angle_range[0] < angles) & (angles < angle_range[1])
     angles = angles[mask]
     indices = indices[mask]
+    return filter_outliers(angles, indices, m)
+
+#排除离中位数过远的值
+def filter_outliers(values, indices, m=2.0):
+    """Filters out values further than m median deviations from the median.
+    Args:
+        values: 需要筛选的值
+        indices: 与values对应的帧
+        m: the maximum distance
+    """
+    indices = np.array(indices)
+    values = np.array(values, dtype=np.float64)
+    if len(values) == 0:
+        return values, indices
     # calc dist to median (median is more robust to outliers than mean)
-    dist = np.abs(angles - np.median(angles))
+    dist = np.abs(values - np.median(values))
     # get median of distances
     mdev = np.median(dist)
-    # scale the distances based on median of distances
-    s = dist / mdev if mdev else 0.0
+    # scale the distances based on median of distances，超过一半的值相同时全部保留
+    s = dist / mdev if mdev else np.zeros_like(dist)
     mask = s < m
-    return angles[mask], indices[mask]
+    return values[mask], indices[mask]
 
 #根据膝盖张角提出建议，此函数已不需要
 """
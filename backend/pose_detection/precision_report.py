@@ -0,0 +1,154 @@
+"""""" """""" """""" """""" """
+ PRECISION REPORT 降低精度模型的精度与速度对比
+ 用法: python -m pose_detection.precision_report --videos uploads --candidates tflite-fp16,tflite-int8
+""" """""" """""" """""" """"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from pose_detection.backends import LOCAL_MODEL_DIR, load_backend
+from pose_detection.keypoints import KEYPOINT_DICT
+from pose_detection.model import get_keypoints_from_video
+from pose_detection.pose_analyzer import get_pose
+from pose_detection.preprocessing import pre_process_video
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm", ".avi")
+
+
+#收集目录中的视频文件
+def _collect_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(
+                sorted(
+                    file for file in glob.glob(os.path.join(path, "*"))
+                    if file.lower().endswith(VIDEO_EXTENSIONS)
+                )
+            )
+        else:
+            videos.append(path)
+    return videos
+
+
+def _run_backend(video_tensor, backend, batch_size):
+    start = time.perf_counter()
+    keypoints = np.stack(get_keypoints_from_video(video_tensor, backend, batch_size=batch_size))
+    return keypoints, time.perf_counter() - start
+
+
+def precision_report(videos, reference, candidates, batch_size=8):
+    """
+    对比参考模型（一般为fp32）和降低精度模型在一组视频上的结果。
+
+    参数:
+        videos: 视频文件路径列表
+        reference (InferenceBackend): 参考后端
+        candidates: 需要对比的后端列表
+        batch_size: 推理的batch_size
+
+    返回:
+        dict: 每个后端一项，包含 fps、joint_error（每个关节在所有帧上的平均欧氏距离，归一化坐标）
+              和 measurement_diff（每项 get_pose 测量的平均绝对误差，度）
+    """
+    backends = [reference] + list(candidates)
+    frames = {backend.name: 0 for backend in backends}
+    seconds = {backend.name: 0.0 for backend in backends}
+    joint_errors = {backend.name: [] for backend in candidates}
+    measurement_diffs = {backend.name: [] for backend in candidates}
+
+    for video in videos:
+        _, video_tensor = pre_process_video(video)
+        # 先跑一次，排除首次调用的开销
+        for backend in backends:
+            get_keypoints_from_video(video_tensor[:1], backend, batch_size=1)
+
+        reference_keypoints, elapsed = _run_backend(video_tensor, reference, batch_size)
+        frames[reference.name] += len(reference_keypoints)
+        seconds[reference.name] += elapsed
+        reference_pose = get_pose(list(reference_keypoints))
+
+        for backend in candidates:
+            keypoints, elapsed = _run_backend(video_tensor, backend, batch_size)
+            frames[backend.name] += len(keypoints)
+            seconds[backend.name] += elapsed
+            # (N,17) 每帧每个关节的欧氏距离
+            joint_errors[backend.name].append(
+                np.linalg.norm(keypoints[:, :, :2] - reference_keypoints[:, :, :2], axis=2)
+            )
+            pose = get_pose(list(keypoints))
+            measurement_diffs[backend.name].append(
+                {key: abs(float(pose[key]) - float(reference_pose[key])) for key in reference_pose}
+            )
+
+    report = {}
+    for backend in backends:
+        row = {"fps": frames[backend.name] / seconds[backend.name] if seconds[backend.name] else 0.0}
+        if backend is not reference:
+            errors = np.concatenate(joint_errors[backend.name]).mean(axis=0)
+            row["joint_error"] = {joint: float(errors[index]) for joint, index in KEYPOINT_DICT.items()}
+            diffs = measurement_diffs[backend.name]
+            row["measurement_diff"] = {key: float(np.mean([diff[key] for diff in diffs])) for key in diffs[0]}
+        report[backend.name] = row
+    return report
+
+
+def _print_report(report, reference_name):
+    print(f"\n{'backend':>14} {'fps':>8} {'speedup':>8}")
+    reference_fps = report[reference_name]["fps"]
+    for name, row in report.items():
+        speedup = row["fps"] / reference_fps if reference_fps else 0.0
+        print(f"{name:>14} {row['fps']:>8.1f} {speedup:>7.2f}x")
+
+    for name, row in report.items():
+        if name == reference_name:
+            continue
+        print(f"\n[{name}] 每个关节的平均误差（归一化坐标）:")
+        for joint, error in row["joint_error"].items():
+            print(f"  - {joint:<15} {error:.4f}")
+        print(f"[{name}] get_pose 测量的平均绝对误差:")
+        for key, diff in row["measurement_diff"].items():
+            print(f"  - {key:<20} {diff:.2f}°")
+
+
+def main():
+    default_videos = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+    parser = argparse.ArgumentParser(description="降低精度的MoveNet模型与fp32模型的精度和速度对比")
+    parser.add_argument("--videos", nargs="+", default=[default_videos], help="视频文件或目录")
+    parser.add_argument("--reference", default="savedmodel", help="参考后端，一般为fp32模型")
+    parser.add_argument("--candidates", default="tflite-fp16,tflite-int8", help="逗号分隔的待对比后端")
+    parser.add_argument("--model-dir", default=LOCAL_MODEL_DIR, help="本地模型目录")
+    parser.add_argument("--threads", type=int, default=None, help="TFLite/ONNX使用的线程数")
+    parser.add_argument("--batch-size", type=int, default=8, help="推理的batch_size")
+    parser.add_argument("--output", default=None, help="将报告保存为JSON文件")
+    parser.add_argument("--gpu", action="store_true", help="允许使用GPU，默认只在CPU上测试")
+    args = parser.parse_args()
+
+    if not args.gpu:
+        tf.config.set_visible_devices([], "GPU")
+
+    videos = _collect_videos(args.videos)
+    if not videos:
+        raise SystemExit("没有找到视频文件")
+    reference = load_backend(args.reference, model_dir=args.model_dir, num_threads=args.threads)
+    candidates = [
+        load_backend(name, model_dir=args.model_dir, num_threads=args.threads)
+        for name in args.candidates.split(",")
+    ]
+
+    print(f"视频数量: {len(videos)}，参考后端: {reference.name}")
+    report = precision_report(videos, reference, candidates, args.batch_size)
+    _print_report(report, reference.name)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
-import tensorflow as tf
 import numpy as np
-from moviepy import VideoFileClip
 import cv2
+import io
+import itertools
+import os
+import queue
+import shutil
 import tempfile
+import threading
+import time
+
+from telemetry import DECODE_FPS, observe
 
 #压缩视频质量
 def reduce_video_quality(video_path, max_pixels, max_fps, max_duration):
+    # moviepy和TensorFlow导入较慢，只在使用这两个旧函数时导入
+    from moviepy import VideoFileClip
 
     clip = VideoFileClip(video_path, audio=False)
 
@@ -31,69 +40,435 @@ def reduce_video_quality(video_path, max_pixels, max_fps, max_duration):
     return clip
 #将视频帧图像转换为张量
 def load_tensors_from_clip(videofileclip):
+    import tensorflow as tf
+
     # convert to uint8 array of frames
     video = tf.convert_to_tensor(
         np.array(list(videofileclip.iter_frames())), dtype=tf.uint8
     )
     return video
 
-def pre_process_video(file:str|bytes)->tuple:
+# 预处理后的帧尺寸和最多处理的视频时长
+TARGET_SIZE = (256, 256)
+MAX_SECONDS = 10
+# 解码时重采样到的帧率，POSE_TARGET_FPS=0 时保留所有帧。
+# 120fps的视频和30fps的视频包含同样的踩踏信息，却要多推理3倍的帧
+DEFAULT_TARGET_FPS = float(os.getenv("POSE_TARGET_FPS", "30"))
+# 解码线程和推理之间的帧队列长度，决定了流式处理时的内存上限
+DEFAULT_QUEUE_SIZE = 64
+
+# 字节数据的读取方式：auto 优先从内存解码，不支持时退回临时文件；memory 只从内存解码；tempfile 写入临时文件
+INGEST_METHODS = ("auto", "memory", "tempfile")
+# 临时文件优先放在内存文件系统中
+_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class _AVCapture:
+    """用PyAV从内存缓冲区解码视频，接口与 cv2.VideoCapture 相同（isOpened/get/grab/retrieve/read/release）。"""
+
+    def __init__(self, source):
+        import av
+
+        try:
+            self._container = av.open(source)
+        except (av.FFmpegError, ValueError) as e:
+            raise ValueError(f"无法打开视频文件: {e}") from e
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self._frames = self._container.decode(self._stream)
+        self._frame = None
+        self._position = 0.0  # 最近一次grab的帧的时间戳（秒）
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        fps = float(self._stream.average_rate or 0)
+        if prop == cv2.CAP_PROP_FPS:
+            return fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            if self._stream.frames:
+                return self._stream.frames
+            if self._stream.duration and self._stream.time_base:
+                return float(self._stream.duration * self._stream.time_base) * fps
+            return 0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._stream.codec_context.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._stream.codec_context.height
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._position * 1000
+        return 0
+
+    def grab(self):
+        try:
+            self._frame = next(self._frames)
+        except StopIteration:
+            self._frame = None
+            return False
+        if self._frame.time is not None:
+            self._position = self._frame.time
+        return True
+
+    def retrieve(self):
+        if self._frame is None:
+            return False, None
+        return True, self._frame.to_ndarray(format="bgr24")
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self._container.close()
+
+
+#从内存缓冲区打开视频，返回 (cap, cleanup)，当前环境不支持时返回None
+def _open_in_memory(file):
+    # BytesIO 直接引用 bytes 的内存，不会复制数据
+    buffer = file if hasattr(file, "read") else io.BytesIO(file)
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        cap = _AVCapture(buffer)
+        return cap, cap.release
+
+    # OpenCV 4.11 起 FFmpeg 后端可以直接读取 Python 的文件对象
+    if hasattr(cv2, "videoio_registry") and hasattr(cv2.videoio_registry, "getStreamBufferedBackends"):
+        try:
+            cap = cv2.VideoCapture(buffer, cv2.CAP_FFMPEG, [])
+        except (cv2.error, TypeError):
+            cap = None
+        if cap is not None and cap.isOpened():
+            # VideoCapture 不持有缓冲区的引用，缓冲区被回收后读取或释放会导致进程崩溃，
+            # cleanup 引用缓冲区，保证它在释放 cap 之后才被回收
+            def cleanup():
+                cap.release()
+                buffer.seek(0)
+
+            return cap, cleanup
+        buffer.seek(0)
+    return None
+
+#将视频写入临时文件再打开，文件要在读取完所有帧之后才能删除
+def _open_temp_file(file):
+    temp_video = tempfile.NamedTemporaryFile(delete=True, suffix=".mp4", dir=_TEMP_DIR)
+    if hasattr(file, "read"):
+        shutil.copyfileobj(file, temp_video)
+    else:
+        temp_video.write(file)  # 写入视频数据
+    temp_video.flush()  # 确保数据写入文件
+    cap = cv2.VideoCapture(temp_video.name)  # 读取临时文件
+
+    def cleanup():
+        cap.release()
+        temp_video.close()
+
+    return cap, cleanup
+
+#打开视频文件
+def _open_capture(file, ingest="auto"):
+    """返回 (cap, cleanup)，cleanup 在读取完成后释放资源。"""
+    if isinstance(file, str):
+        # 如果是文件路径，直接打开视频文件
+        cap = cv2.VideoCapture(file)
+        return cap, cap.release
+    if not isinstance(file, (bytes, bytearray, memoryview)) and not hasattr(file, "read"):
+        raise ValueError("file 参数必须是字符串路径、字节数据或文件对象")
+    if ingest not in INGEST_METHODS:
+        raise ValueError(f"未知的读取方式: {ingest}，可选: {', '.join(INGEST_METHODS)}")
+
+    if ingest != "tempfile":
+        opened = _open_in_memory(file)
+        if opened is not None:
+            return opened
+        if ingest == "memory":
+            raise ValueError("当前环境不支持从内存解码视频，请安装 av (PyAV) 或 OpenCV>=4.11")
+    return _open_temp_file(file)
+
+def iter_video_frames(file, target_size=TARGET_SIZE, max_seconds=MAX_SECONDS, ingest="auto",
+                      target_fps=DEFAULT_TARGET_FPS, timestamps=False):
     """
-    使用OpenCV预处理视频文件。
-    
+    逐帧解码视频，每次产出一帧调整大小后的RGB图像。
+
+    帧率高于 target_fps 的视频在解码时按时间重采样：每 1/target_fps 秒只保留一帧，
+    其余帧只解码不做颜色转换和缩放。
+
     参数:
-    file (str): 视频文件的路径
-    file (bytes): 视频文件的字节数据
+        file (str | bytes | file-like): 视频文件的路径、字节数据或文件对象，
+            支持手机拍摄的 mp4 / mov / webm 格式
+        target_size (tuple): 输出帧的 (宽, 高)
+        max_seconds (float): 最多处理的视频时长
+        ingest (str): 字节数据的读取方式，见 INGEST_METHODS
+        target_fps (float): 重采样的目标帧率，None或0时保留所有帧
+        timestamps (bool): 为True时产出 (帧, 时间戳秒) 元组
 
-    
     返回:
-    tuple: 包含处理后的视频帧和张量数据
+        generator: 每次产出一个 (高, 宽, 3) 的 uint8 数组
     """
-    # 打开视频文件
-    # 检查输入参数的类型
-    if isinstance(file, str):
-        # 如果是文件路径，直接打开视频文件
-        cap = cv2.VideoCapture(file)
-    elif isinstance(file, bytes):
-        # 使用临时文件保存视频
-        with tempfile.NamedTemporaryFile(delete=True, suffix=".mp4") as temp_video:
-            temp_video.write(file)  # 写入视频数据
-            temp_video.flush()  # 确保数据写入文件
-            cap = cv2.VideoCapture(temp_video.name)  # 读取临时文件
-    else:
-        raise ValueError("file 参数必须是字符串路径或字节数据")
+    cap, cleanup = _open_capture(file, ingest)
+    try:
+        for frame, timestamp in _decode_frames(cap, _frame_limit(cap, max_seconds), target_size, target_fps):
+            yield (frame, timestamp) if timestamps else frame
+    finally:
+        cleanup()
 
+def probe_video(file, ingest="auto"):
+    """
+    只读取视频的元数据，不解码。
+
+    参数:
+        file (str | bytes | file-like): 视频文件的路径、字节数据或文件对象
+        ingest (str): 字节数据的读取方式，见 INGEST_METHODS
+
+    返回:
+        dict: fps、frame_count、width、height 和 duration（秒），读不到的值为0
+    """
+    cap, cleanup = _open_capture(file, ingest)
+    try:
+        if not cap.isOpened():
+            raise ValueError("无法打开视频文件")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        info = {
+            "fps": fps,
+            "frame_count": frame_count,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "duration": frame_count / fps if fps > 0 and frame_count > 0 else 0.0,
+        }
+    finally:
+        cleanup()
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return info
+
+#根据视频属性计算最多处理的帧数，webm等格式可能读不到总帧数或帧率，此时返回None
+def _frame_limit(cap, max_seconds):
     if not cap.isOpened():
         raise ValueError("无法打开视频文件")
-    
+
     # 获取视频属性
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
+
     # 限制处理帧数
-    max_frames = min(total_frames, fps * 10)  # 最多处理10秒的视频
-    target_size = (256, 256)  # 目标尺寸
-    
-    frames = []
-    tensors = []
-    
-    for _ in range(max_frames):
-        ret, frame = cap.read()
+    max_frames = int(fps * max_seconds) if fps > 0 else None  # 最多处理10秒的视频
+    if total_frames > 0:
+        max_frames = min(total_frames, max_frames) if max_frames is not None else total_frames
+    return max_frames
+
+#估计重采样后的帧数，用于预先分配缓冲区
+def _resampled_frame_count(max_frames, fps, target_fps):
+    if max_frames is None or not target_fps or fps <= target_fps:
+        return max_frames
+    return int(np.ceil(max_frames * target_fps / fps)) + 1
+
+#逐帧读取、按时间重采样、调整大小并转换为RGB，产出 (帧, 时间戳秒)
+def _decode_frames(cap, max_frames, target_size, target_fps=None, first_index=0):
+    """
+    first_index 是第一帧在视频中的序号，分段解码时用于推算时间戳。
+
+    时间戳优先使用容器中记录的时间（手机拍摄的可变帧率视频帧间隔并不均匀），读不到时按 序号/fps 推算。
+    重采样按绝对时间划分区间，每个 1/target_fps 秒的区间只保留第一帧，因此分段解码和顺序解码保留的帧相同。
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    period = 1 / target_fps if target_fps else 0
+    previous = None
+    for i in (range(max_frames) if max_frames is not None else itertools.count()):
+        # grab只解码不转换，被重采样跳过的帧不需要retrieve
+        if not cap.grab():
+            break
+        index = first_index + i
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if fps > 0 and index > 0 and timestamp <= (previous if previous is not None else 0):
+            timestamp = index / fps
+        if previous is None:
+            previous = timestamp - 1 / fps if fps > 0 and index > 0 else -np.inf
+        keep = not period or np.floor(timestamp / period + 1e-6) > np.floor(previous / period + 1e-6)
+        previous = timestamp
+        if not keep:
+            continue
+
+        ret, frame = cap.retrieve()
         if not ret:
             break
-            
         # 调整帧大小
         frame = cv2.resize(frame, target_size)
         # 转换颜色空间从BGR到RGB
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        frames.append(frame)
-        # 转换为张量
-        tensor = tf.convert_to_tensor(frame)
-        tensor = tf.expand_dims(tensor, axis=0)
-        tensor = tf.cast(tensor, dtype=tf.int32)
-        tensors.append(tensor)
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), timestamp
+
+#记录解码的吞吐量（帧/秒），mode 区分顺序解码到缓冲区、边解码边推理和分段并行解码
+def observe_decode_fps(frames, seconds, mode):
+    if frames and seconds > 0:
+        observe(DECODE_FPS, frames / seconds, mode=mode)
+
+def stream_video_frames(file, max_queue=DEFAULT_QUEUE_SIZE, **kwargs):
+    """
+    在后台线程中解码视频，通过有界队列把帧交给调用者，使解码和推理同时进行。
+
+    内存中最多同时存在 max_queue 帧，与视频长度无关。调用者提前停止读取时，解码线程也会停止。
+
+    参数:
+        file (str | bytes): 视频文件的路径或字节数据
+        max_queue (int): 队列中最多缓存的帧数
+        kwargs: 传给 iter_video_frames 的其他参数
+
+    返回:
+        generator: 与 iter_video_frames 相同，解码出错时在调用者线程中抛出异常
+    """
+    frames = queue.Queue(maxsize=max_queue)
+    stop = threading.Event()
+    done = object()
+
+    def _put(item):
+        # 消费者停止读取后不再阻塞
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode():
+        # 只统计解码的时间，不包括等待推理取走帧的时间
+        decoded, seconds = 0, 0.0
+        try:
+            start = time.perf_counter()
+            for frame in iter_video_frames(file, **kwargs):
+                seconds += time.perf_counter() - start
+                decoded += 1
+                if not _put(frame):
+                    return
+                start = time.perf_counter()
+            _put(done)
+        except Exception as e:
+            _put(e)
+        finally:
+            observe_decode_fps(decoded, seconds, "stream")
+
+    decoder = threading.Thread(target=_decode, name="video-decoder", daemon=True)
+    decoder.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        decoder.join()
+
+class FrameBuffer:
+    """Preallocated, contiguous uint8 buffer of decoded frames.
+
+    Frames are written in place into one (capacity, H, W, 3) array, and
+    `frames` is a view of the filled part, so inference reads batches straight
+    from the buffer and casts only the batch it feeds to the model. When the
+    frame count is unknown up front the capacity doubles as needed. The
+    timestamp of every frame, in seconds, is kept alongside.
+    """
+
+    # 旧的预处理同时保存uint8帧列表和int32张量，每帧占用 1 + 4 倍的uint8大小
+    LEGACY_BYTES_PER_VALUE = 1 + 4
+
+    def __init__(self, frame_shape, capacity=None):
+        self.frame_shape = tuple(frame_shape)
+        self._data = np.empty((max(capacity or 64, 1),) + self.frame_shape, dtype=np.uint8)
+        self._timestamps = np.empty(len(self._data), dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, frame, timestamp=np.nan):
+        if self._size == len(self._data):
+            grown = np.empty((2 * len(self._data),) + self.frame_shape, dtype=np.uint8)
+            grown[: self._size] = self._data
+            self._data = grown
+            self._timestamps = np.resize(self._timestamps, len(grown))
+        self._data[self._size] = frame
+        self._timestamps[self._size] = timestamp
+        self._size += 1
+
+    @property
+    def frames(self):
+        """(N, H, W, 3) uint8 view of the decoded frames, no copy."""
+        return self._data[: self._size]
+
+    @property
+    def timestamps(self):
+        """(N,) float64 timestamps of the frames in seconds."""
+        return self._timestamps[: self._size]
+
+    def memory_report(self):
+        """
+        返回帧缓冲区占用的内存，以及与旧的 uint8列表 + int32张量 相比节省的内存。
+
+        返回:
+            dict: buffer_bytes（缓冲区实际分配的字节数）、legacy_bytes、saved_bytes
+        """
+        legacy_bytes = self.frames.nbytes * self.LEGACY_BYTES_PER_VALUE
+        return {
+            "buffer_bytes": self._data.nbytes,
+            "legacy_bytes": legacy_bytes,
+            "saved_bytes": legacy_bytes - self._data.nbytes,
+        }
+
+
+def read_video_frames(file, target_size=TARGET_SIZE, max_seconds=MAX_SECONDS, ingest="auto",
+                      target_fps=DEFAULT_TARGET_FPS):
+    """
+    将视频解码到一个预先分配的 FrameBuffer 中。
+
+    参数与 iter_video_frames 相同。
+
+    返回:
+        FrameBuffer: 已解码的帧，frames 属性是 (N, 高, 宽, 3) 的 uint8 数组
+    """
+    start = time.perf_counter()
+    cap, cleanup = _open_capture(file, ingest)
+    try:
+        max_frames = _frame_limit(cap, max_seconds)
+        capacity = _resampled_frame_count(max_frames, cap.get(cv2.CAP_PROP_FPS), target_fps)
+        buffer = FrameBuffer((target_size[1], target_size[0], 3), capacity)
+        for frame, timestamp in _decode_frames(cap, max_frames, target_size, target_fps):
+            buffer.append(frame, timestamp)
+    finally:
+        cleanup()
+    observe_decode_fps(len(buffer), time.perf_counter() - start, "sequential")
+    return buffer
+
+def pre_process_video(file:str|bytes)->tuple:
+    """
+    使用OpenCV预处理视频文件。
     
-    cap.release()
+    参数:
+    file (str): 视频文件的路径
+    file (bytes): 视频文件的字节数据，直接从内存解码
+
     
-    return frames, tf.concat(tensors, axis=0)
\ No newline at end of file
+    返回:
+    tuple: (frames, video)，都是同一个 (N, 高, 宽, 3) 的 uint8 数组，已重采样到 DEFAULT_TARGET_FPS。
+    video 可以直接传给 get_keypoints_from_video，推理时只把送入模型的那一批转换为int32。
+    """
+    from pose_detection.segment_decoder import read_video_frames_parallel
+
+    # 长的高分辨率视频分段并行解码，短视频顺序解码
+    buffer = read_video_frames_parallel(file)
+    if not len(buffer):
+        raise ValueError("视频中没有可以读取的帧")
+
+    report = buffer.memory_report()
+    print(
+        f"  - 帧缓冲区: {report['buffer_bytes'] / 1024 / 1024:.1f} MB，"
+        f"比 uint8列表+int32张量 节省 {report['saved_bytes'] / 1024 / 1024:.1f} MB"
+    )
+    frames = buffer.frames
+    return frames, frames
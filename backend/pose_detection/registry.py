@@ -0,0 +1,97 @@
+import os
+import threading
+
+# 程序功能：在进程内缓存已加载的MoveNet模型，避免每个请求都重新下载和加载模型
+# TensorFlow和推理后端在第一次加载模型时才导入，只查询模型状态时不需要导入
+
+# 默认推理后端，可通过环境变量 POSE_BACKEND 选择 savedmodel / tflite / onnx
+DEFAULT_BACKEND = os.getenv("POSE_BACKEND", "savedmodel")
+
+# 跨请求动态批处理，POSE_MICRO_BATCH_SIZE 大于0时开启。
+# 只对同一进程内并发的请求有效，即服务器设置 POSE_WORKERS=0 在线程中运行分析时；
+# 并且只用于有batch维度的后端（ONNX，以及batch维度不固定的SavedModel）。TFLite的MoveNet模型batch固定为1，
+# 合并后仍然逐张推理，只会增加排队等待，此时不开启
+MICRO_BATCH_SIZE = int(os.getenv("POSE_MICRO_BATCH_SIZE", "0"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("POSE_MICRO_BATCH_WAIT_MS", "5"))
+
+
+class ModelRegistry:
+    """Thread-safe, lazily initialised cache of MoveNet inference backends.
+
+    Each (backend, variant) pair is loaded at most once per process. The first
+    caller loads the model and runs a warm-up pass; concurrent callers of the
+    same pair block until that load finishes and then share the same backend.
+    """
+
+    def __init__(self, loader=None):
+        """
+        参数:
+            loader: 加载模型的函数，接收后端名称和 variant 关键字参数，返回 InferenceBackend，默认为 load_backend
+        """
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._models = {}
+
+    def get(self, variant="thunder", backend=None):
+        """Returns the (model, input_size) pair of a variant, loading it on first use."""
+        key = (backend or DEFAULT_BACKEND, variant)
+        entry = self._models.get(key)
+        if entry is not None:
+            return entry
+
+        # 每个模型一把锁，加载thunder时不会阻塞lightning
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            entry = self._models.get(key)
+            if entry is None:
+                loader = self._loader
+                if loader is None:
+                    from pose_detection.backends import load_backend as loader
+                model = loader(key[0], variant=variant)
+                _warm_up(model)
+                if MICRO_BATCH_SIZE > 0 and model.batched:
+                    from pose_detection.batcher import DynamicBatcher
+
+                    model = DynamicBatcher(model, MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS)
+                elif MICRO_BATCH_SIZE > 0:
+                    print(f"  - {model.name} 后端没有batch维度，不开启动态批处理")
+                entry = (model, model.input_size)
+                self._models[key] = entry
+        return entry
+
+    def is_ready(self, variant="thunder", backend=None):
+        """Returns True once the model is loaded and warmed up."""
+        return (backend or DEFAULT_BACKEND, variant) in self._models
+
+
+#预热模型：第一次推理会触发图追踪和内存分配，提前在空白帧上完成
+def _warm_up(model):
+    import tensorflow as tf
+
+    dummy_frame = tf.zeros((1, model.input_size, model.input_size, 3), dtype=tf.int32)
+    model.infer(dummy_frame)
+
+
+_registry = ModelRegistry()
+
+
+def get_model(variant="thunder", backend=None):
+    """
+    获取进程内共享的模型，首次调用时加载并预热。
+
+    参数:
+        variant (str): 模型变体，"thunder" 或 "lightning"
+        backend (str): 推理后端名称，默认使用 DEFAULT_BACKEND
+
+    返回:
+        tuple: (model, input_size)，model 是 InferenceBackend
+    """
+    return _registry.get(variant, backend)
+
+
+def is_model_ready(variant="thunder", backend=None):
+    """返回模型是否已经加载并预热完成。"""
+    return _registry.is_ready(variant, backend)
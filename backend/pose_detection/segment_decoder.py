@@ -0,0 +1,260 @@
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from pose_detection.preprocessing import (
+    DEFAULT_TARGET_FPS,
+    MAX_SECONDS,
+    TARGET_SIZE,
+    _TEMP_DIR,
+    FrameBuffer,
+    _decode_frames,
+    observe_decode_fps,
+    probe_video,
+    read_video_frames,
+    stream_video_frames,
+)
+
+# 程序功能：把长视频按关键帧切分成若干段，在多个进程中并行解码到共享内存，再按顺序拼接
+# 4K等高分辨率视频的解码只能用到一个核心，是整个流程中最慢的一步
+
+# 并行解码使用的进程数，POSE_DECODE_WORKERS=0 时关闭并行解码
+DEFAULT_DECODE_WORKERS = int(os.getenv("POSE_DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+# 待解码的像素总量（帧数 × 原始宽 × 高）低于该值时顺序解码，启动进程和定位关键帧的开销会超过并行带来的收益
+# 默认约为240帧4K或1000帧1080p
+PARALLEL_MIN_MEGAPIXELS = float(os.getenv("POSE_PARALLEL_DECODE_MIN_MP", "2000"))
+# 每段至少包含的帧数
+MIN_SEGMENT_FRAMES = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+#解码进程池在第一次并行解码时创建，之后一直复用
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers < workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def _probe(file):
+    """读取视频属性，返回 (需要解码的帧数或None, 原始宽, 原始高, fps)。"""
+    info = probe_video(file)
+    max_frames = int(info["fps"] * MAX_SECONDS) if info["fps"] > 0 else None
+    if info["frame_count"] > 0:
+        max_frames = min(info["frame_count"], max_frames) if max_frames is not None else info["frame_count"]
+    return max_frames, info["width"], info["height"], info["fps"]
+
+
+def _keyframe_indices(path, fps):
+    """
+    返回视频中关键帧的帧序号。只读取数据包而不解码，需要安装 PyAV；
+    没有 PyAV 时返回None，按帧数等分，由 OpenCV 的精确定位从前一个关键帧解码到分段起点。
+    """
+    try:
+        import av
+    except ImportError:
+        return None
+    try:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            # pts 从流的起始时间开始计数，减去起始时间才是从第0帧开始的时间
+            start = stream.start_time or 0
+            keyframes = [
+                int(round(float((packet.pts - start) * stream.time_base) * fps))
+                for packet in container.demux(stream)
+                if packet.is_keyframe and packet.pts is not None
+            ]
+    except av.FFmpegError:
+        return None
+    return sorted(set(keyframes))
+
+
+def plan_segments(num_frames, workers, keyframes=None):
+    """
+    将 [0, num_frames) 切分为最多 workers 段。
+
+    有关键帧信息时，每个分段的起点移到离等分点最近的关键帧上，这样每个进程都从关键帧开始解码，
+    不需要先解码前一段的帧。
+
+    返回:
+        list: [(start, end), ...]，按顺序覆盖全部帧
+    """
+    workers = max(1, min(workers, num_frames // MIN_SEGMENT_FRAMES))
+    bounds = [round(num_frames * i / workers) for i in range(workers)]
+    if keyframes:
+        candidates = np.array([k for k in keyframes if 0 < k < num_frames])
+        if len(candidates):
+            bounds = [0] + [int(candidates[np.abs(candidates - b).argmin()]) for b in bounds[1:]]
+    bounds = sorted(set(bounds)) + [num_frames]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+#解码一段视频，直接写入frames中对应的位置，返回保留下来的每一帧的时间戳
+def _decode_segment_into(path, frames, start, end, target_size, target_fps):
+    cap = cv2.VideoCapture(path)
+    timestamps = []
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for frame, timestamp in _decode_frames(cap, end - start, target_size, target_fps, first_index=start):
+            frames[start + len(timestamps)] = frame
+            timestamps.append(timestamp)
+    finally:
+        cap.release()
+    return timestamps
+
+#在工作进程中解码一段视频到共享内存
+def _decode_segment(path, shm_name, shape, start, end, target_size, target_fps):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        timestamps = _decode_segment_into(path, frames, start, end, target_size, target_fps)
+        del frames
+        return timestamps
+    finally:
+        shm.close()
+
+
+#按顺序拼接每段实际解码出的帧，重采样或帧数信息不准确时每段的帧数少于分段长度，后面的段向前补齐
+def _reassemble(frames, segments, segment_timestamps):
+    buffer = FrameBuffer(frames.shape[1:], sum(len(timestamps) for timestamps in segment_timestamps))
+    for (start, _), timestamps in zip(segments, segment_timestamps):
+        for frame, timestamp in zip(frames[start : start + len(timestamps)], timestamps):
+            buffer.append(frame, timestamp)
+    return buffer
+
+
+def decode_segments(path, num_frames, workers, target_size=TARGET_SIZE, keyframes=None,
+                    target_fps=DEFAULT_TARGET_FPS):
+    """
+    并行解码视频的前 num_frames 帧。
+
+    每段在一个解码进程中解码到共享内存。工作进程池（PoseWorkerPool）中的进程是守护进程，不能再创建子进程，
+    此时改为在线程中解码到普通数组，OpenCV解码时会释放GIL，同样可以用到多个核心。
+
+    参数:
+        path (str): 视频文件路径，每个进程独立打开
+        num_frames (int): 需要解码的帧数
+        workers (int): 进程数
+        target_size (tuple): 输出帧的 (宽, 高)
+        keyframes: 可选的关键帧序号列表，见 plan_segments
+        target_fps (float): 重采样的目标帧率，见 iter_video_frames
+
+    返回:
+        FrameBuffer: 按原始顺序拼接的帧和时间戳
+    """
+    started = time.perf_counter()
+    shape = (num_frames, target_size[1], target_size[0], 3)
+    segments = plan_segments(num_frames, workers, keyframes)
+
+    if multiprocessing.current_process().daemon:
+        frames = np.empty(shape, dtype=np.uint8)
+        with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="segment-decoder") as pool:
+            futures = [
+                pool.submit(_decode_segment_into, path, frames, start, end, target_size, target_fps)
+                for start, end in segments
+            ]
+            timestamps = [future.result() for future in futures]
+        buffer = _reassemble(frames, segments, timestamps)
+        observe_decode_fps(len(buffer), time.perf_counter() - started, "parallel")
+        return buffer
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    try:
+        pool = _get_pool(len(segments))
+        futures = [
+            pool.submit(_decode_segment, path, shm.name, shape, start, end, target_size, target_fps)
+            for start, end in segments
+        ]
+        timestamps = [future.result() for future in futures]
+
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        buffer = _reassemble(frames, segments, timestamps)
+        del frames
+    finally:
+        shm.close()
+        shm.unlink()
+    observe_decode_fps(len(buffer), time.perf_counter() - started, "parallel")
+    return buffer
+
+
+def should_decode_in_parallel(max_frames, width, height, workers):
+    """只有足够长、分辨率足够高的视频才值得并行解码。"""
+    if workers < 2 or max_frames is None or max_frames < 2 * MIN_SEGMENT_FRAMES:
+        return False
+    return max_frames * width * height / 1e6 >= PARALLEL_MIN_MEGAPIXELS
+
+
+def read_video_frames_parallel(file, target_size=TARGET_SIZE, workers=DEFAULT_DECODE_WORKERS,
+                               target_fps=DEFAULT_TARGET_FPS):
+    """
+    解码视频，长的高分辨率视频按关键帧分段并行解码，短视频顺序解码。
+
+    参数:
+        file (str | bytes): 视频文件的路径或字节数据。并行解码时字节数据会先写入一个临时文件，供各进程读取
+        target_size (tuple): 输出帧的 (宽, 高)
+        workers (int): 并行解码的进程数
+        target_fps (float): 重采样的目标帧率
+
+    返回:
+        FrameBuffer: 与 read_video_frames 相同
+    """
+    max_frames, width, height, fps = _probe(file)
+    if not should_decode_in_parallel(max_frames, width, height, workers):
+        return read_video_frames(file, target_size, target_fps=target_fps)
+
+    if isinstance(file, str):
+        return decode_segments(
+            file, max_frames, workers, target_size, _keyframe_indices(file, fps), target_fps
+        )
+    with tempfile.NamedTemporaryFile(suffix=".mp4", dir=_TEMP_DIR) as temp_video:
+        temp_video.write(file)
+        temp_video.flush()
+        return decode_segments(
+            temp_video.name, max_frames, workers, target_size, _keyframe_indices(temp_video.name, fps), target_fps
+        )
+
+
+def open_video_frames(file, workers=DEFAULT_DECODE_WORKERS, target_fps=DEFAULT_TARGET_FPS, **kwargs):
+    """
+    为推理准备视频帧：值得并行解码时返回并行解码好的 (N, 高, 宽, 3) uint8 数组，
+    否则返回 stream_video_frames 的帧迭代器，边解码边推理。
+
+    参数:
+        file (str | bytes): 视频文件的路径或字节数据
+        workers (int): 并行解码的进程数
+        target_fps (float): 重采样的目标帧率
+        kwargs: 顺序解码时传给 stream_video_frames 的其他参数
+
+    返回:
+        tuple: (frames, timestamps)。frames 是数组或帧迭代器，两者都可以直接传给 get_keypoints_from_video；
+            timestamps 是每帧的时间戳（秒）列表，使用迭代器时随着帧被读取逐步填充
+    """
+    if isinstance(file, (str, bytes)):
+        max_frames, width, height, _ = _probe(file)
+        if should_decode_in_parallel(max_frames, width, height, workers):
+            buffer = read_video_frames_parallel(file, workers=workers, target_fps=target_fps)
+            return buffer.frames, list(buffer.timestamps)
+
+    timestamps = []
+
+    def _frames():
+        for frame, timestamp in stream_video_frames(file, target_fps=target_fps, timestamps=True, **kwargs):
+            timestamps.append(timestamp)
+            yield frame
+
+    return _frames(), timestamps
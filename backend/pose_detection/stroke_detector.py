@@ -0,0 +1,196 @@
+from collections import namedtuple
+
+import numpy as np
+
+from pose_detection.postprocessing import (
+    MAX_CADENCE_RPM,
+    calculate_angles,
+    find_camera_facing_side,
+    get_front_keypoint_indices,
+    get_joint_angle_triplets,
+    get_peak_distance,
+)
+
+# 程序功能：逐帧检测踏板的上下止点，不需要等整段视频推理完成，就能逐次更新每一次踩踏的膝盖和髋关节角度
+
+
+class OnlinePeakDetector:
+    """Incremental version of scipy.signal.find_peaks(x, distance=distance).
+
+    Samples are pushed one at a time. Local maxima are found with the same
+    rules as find_peaks (the first and last samples are never peaks, a flat
+    peak is reported at its middle sample), and the minimum distance is
+    resolved like find_peaks does, highest peak first.
+
+    Peaks of exactly the same height closer than `distance` are the one
+    difference: here the later peak wins, while find_peaks orders them with
+    the unstable np.argsort of all peak heights, so its choice depends on the
+    whole signal and the numpy build. For [2,3,1,2,3,1,1,1,2,0,2,2,1] and
+    distance 3 this returns [1, 4, 10] where find_peaks returns [1, 4, 8].
+    Ties need quantized values; model keypoints are floats and practically
+    never tie.
+
+    A candidate is confirmed or dropped as soon as samples that have not
+    arrived yet can no longer change its outcome, whatever peaks they
+    contain. Noisy signals can chain that dependency far back, so after
+    `lookahead` newer samples a candidate is decided with what has been seen
+    so far. Results lag the input by at most `lookahead` samples and may be
+    confirmed slightly out of order.
+    """
+
+    def __init__(self, distance, lookahead=None):
+        """
+        参数:
+            distance (int): 相邻峰值之间的最小间隔（样本数），与 find_peaks 的 distance 相同
+            lookahead (int): 最多等待的后续样本数，默认 4*distance
+        """
+        self.distance = max(1, int(distance))
+        self.lookahead = lookahead if lookahead is not None else 4 * self.distance
+        self.count = 0
+        self._previous = None
+        self._plateau_start = None
+        self._candidates = []  # [(index, value)]，尚未确定的局部极大值，按index排列
+        self._confirmed = []  # 最近确认的峰值，用于压制 distance 以内的候选
+
+    def push(self, value):
+        """Adds one sample and returns the indices of the peaks confirmed by it."""
+        index = self.count
+        self.count += 1
+        previous, self._previous = self._previous, value
+        if previous is not None:
+            if value > previous:
+                self._plateau_start = index
+            elif value < previous and self._plateau_start is not None:
+                # 上升沿之后的下降沿：平顶区间 [plateau_start, index-1] 的中点是峰值
+                self._candidates.append(((self._plateau_start + index - 1) // 2, previous))
+                self._plateau_start = None
+        return self._resolve(final=False)
+
+    def flush(self):
+        """Confirms the remaining peaks once the input has ended."""
+        # 最后一个样本不会是峰值，未结束的平顶也不是
+        self._plateau_start = None
+        return self._resolve(final=True)
+
+    def oldest_pending(self):
+        """Returns the oldest sample index that may still become a peak."""
+        pending = [index for index, _ in self._candidates[:1]]
+        if self._plateau_start is not None:
+            pending.append(self._plateau_start)
+        return min(pending, default=self.count)
+
+    def _resolve(self, final):
+        if not self._candidates:
+            return []
+        # 之后的峰值最早出现的位置，只有这个位置 distance 以内的候选会被之后的峰值直接压制
+        if final:
+            frontier = np.inf
+        else:
+            frontier = self._plateau_start if self._plateau_start is not None else self.count
+        forced_before = self.count - self.lookahead
+
+        # 与 find_peaks 相同：按高度从高到低（高度相同时靠后的优先，find_peaks 的顺序不确定，见类的说明），保留与已保留的峰值间隔不小于 distance 的峰值。
+        # 同时判断每个结果是否已经确定："keep"/"drop" 是确定的结果，None 表示还取决于之后的样本：
+        # 比它高的邻近候选中有确定保留的，则确定去掉；有未确定的，则也未确定；
+        # 都确定去掉时保留它，但离 frontier 不到 distance 的候选还可能被之后更高的峰值压制
+        state = {peak: "keep" for peak in self._confirmed}
+        greedy = set(self._confirmed)  # 只按已有样本选择的结果，超过 lookahead 时使用
+        for index, _ in sorted(self._candidates, key=lambda candidate: (-candidate[1], -candidate[0])):
+            neighbours = [peak for peak in state if abs(index - peak) < self.distance]
+            suppressed = any(peak in greedy for peak in neighbours)
+            if not suppressed:
+                greedy.add(index)
+            if any(state[peak] == "keep" for peak in neighbours):
+                state[index] = "drop"
+            elif index < forced_before:
+                state[index] = "drop" if suppressed else "keep"
+            elif any(state[peak] is None for peak in neighbours) or index > frontier - self.distance:
+                state[index] = None
+            else:
+                state[index] = "keep"
+
+        confirmed = [index for index, _ in self._candidates if state[index] == "keep"]
+        self._candidates = [candidate for candidate in self._candidates if state[candidate[0]] is None]
+        oldest = min([index for index, _ in self._candidates[:1]] + [min(frontier, self.count)])
+        self._confirmed = [peak for peak in self._confirmed + confirmed if peak > oldest - self.distance]
+        return confirmed
+
+
+StrokeEvent = namedtuple("StrokeEvent", ["kind", "frame", "timestamp", "knee_angle", "hip_angle"])
+
+
+class PedalStrokeDetector:
+    """Detects pedal strokes frame by frame from the camera-facing ankle.
+
+    "bdc" events are the peaks of the ankle y coordinate, i.e. the frames
+    get_highest_pedal_frames returns; "tdc" events are the peaks of -y, the
+    frames of get_lowest_pedal_frames. Every event carries the knee and hip
+    angles of its frame so the measurements can be updated stroke by stroke.
+    """
+
+    def __init__(self, fps=None, facing_side=None, max_cadence=MAX_CADENCE_RPM, lookahead=None):
+        """
+        参数:
+            fps (float): 帧率，决定峰值之间的最小间隔，见 get_peak_distance
+            facing_side (str): 拍摄侧，默认由第一帧判断
+            max_cadence (float): 最高踏频（rpm）
+            lookahead (int): 见 OnlinePeakDetector
+        """
+        distance = get_peak_distance(fps, max_cadence)
+        self.facing_side = facing_side
+        self._bdc = OnlinePeakDetector(distance, lookahead)
+        self._tdc = OnlinePeakDetector(distance, lookahead)
+        self._frames = {}  # 尚未确认的帧：frame -> (keypoints, timestamp)
+
+    @property
+    def count(self):
+        return self._bdc.count
+
+    def update(self, keypoints, timestamp=None):
+        """
+        加入一帧 (17,3) 关键点。
+
+        返回:
+            list: 这一帧确认的 StrokeEvent，按帧序号排列
+        """
+        if self.facing_side is None:
+            self.facing_side = find_camera_facing_side(keypoints)
+        frame = self._bdc.count
+        self._frames[frame] = (np.asarray(keypoints, dtype=np.float32), timestamp)
+        ankle_y = float(keypoints[get_front_keypoint_indices(self.facing_side)[2]][0])
+        events = self._events("bdc", self._bdc.push(ankle_y)) + self._events("tdc", self._tdc.push(-ankle_y))
+        # 只保留还可能成为峰值的帧
+        oldest = min(self._bdc.oldest_pending(), self._tdc.oldest_pending())
+        for old in [old for old in self._frames if old < oldest]:
+            del self._frames[old]
+        return sorted(events, key=lambda event: event.frame)
+
+    def flush(self):
+        """Returns the events still pending once the last frame has been added."""
+        events = self._events("bdc", self._bdc.flush()) + self._events("tdc", self._tdc.flush())
+        self._frames.clear()
+        return sorted(events, key=lambda event: event.frame)
+
+    def _events(self, kind, frames):
+        if not frames:
+            return []
+        keypoints = np.stack([self._frames[frame][0] for frame in frames])
+        angles = calculate_angles(keypoints, get_joint_angle_triplets(self.facing_side, ("knee", "hip")))
+        return [
+            StrokeEvent(kind, frame, self._frames[frame][1], float(knee), float(hip))
+            for frame, (knee, hip) in zip(frames, angles)
+        ]
+
+
+def detect_strokes(all_keypoints, fps=None, timestamps=None, lookahead=None):
+    """
+    对一段关键点轨迹逐帧运行 PedalStrokeDetector，返回 (bdc帧序号, tdc帧序号)，用于与离线结果对比。
+    """
+    detector = PedalStrokeDetector(fps, lookahead=lookahead)
+    events = []
+    for frame, keypoints in enumerate(all_keypoints):
+        events.extend(detector.update(keypoints, None if timestamps is None else timestamps[frame]))
+    events.extend(detector.flush())
+    bdc = np.array([event.frame for event in events if event.kind == "bdc"], dtype=np.intp)
+    tdc = np.array([event.frame for event in events if event.kind == "tdc"], dtype=np.intp)
+    return bdc, tdc
@@ -0,0 +1,187 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+
+import telemetry
+
+# 程序功能：在独立的工作进程中运行视频解码和姿态推理，避免阻塞服务器的事件循环
+# 每个工作进程启动时就加载并预热模型，并绑定到一部分CPU核心上；处理一定数量的任务后自动重启以限制内存增长
+
+DEFAULT_POOL_SIZE = int(os.getenv("POSE_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+DEFAULT_MAX_JOBS_PER_WORKER = int(os.getenv("POSE_WORKER_MAX_JOBS", "50"))
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+#为当前工作进程分配一个空闲的核心槽位
+def _claim_slot(slots):
+    with slots.get_lock():
+        for i, pid in enumerate(slots):
+            if pid == 0 or not _process_alive(pid):
+                slots[i] = os.getpid()
+                return i
+    return os.getpid() % len(slots)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+#工作进程初始化：绑定CPU核心，限制TensorFlow线程数，加载并预热模型，完成后在ready中记录自己的pid
+def _init_worker(slots, ready, cores, cores_per_worker, variant):
+    slot = _claim_slot(slots)
+    ready[slot] = 0
+    worker_cores = [cores[(slot * cores_per_worker + i) % len(cores)] for i in range(cores_per_worker)]
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, worker_cores)
+
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(cores_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from pose_detection.registry import get_model
+
+    get_model(variant)
+    ready[slot] = os.getpid()
+
+
+#返回 (姿态分析结果, 耗时记录)，耗时记录在主进程中合并到指标和请求的trace
+def _analyze(file, events=None):
+    from pose_detection.pose_analyzer import pose_analyzer
+
+    progress = None
+    if events is not None:
+        # 进度事件通过Manager队列发送回主进程
+        def progress(stage, **data):
+            events.put((stage, data))
+
+    with telemetry.collect() as records:
+        result = pose_analyzer(file, progress)
+    return result, records
+
+
+#在主进程中把工作进程发来的进度事件转交给回调函数，收到None时结束
+def _relay_events(events, progress):
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        stage, data = event
+        progress(stage, **data)
+
+
+class PoseWorkerPool:
+    """A pool of pre-warmed pose analysis worker processes.
+
+    Workers are started with the spawn method (TensorFlow is not fork-safe),
+    each one pinned to its own slice of cores with the model already loaded.
+    A worker exits after max_jobs_per_worker jobs and is replaced by a fresh one.
+    Workers report themselves once their model is loaded, see ready_workers.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER,
+                 cores_per_worker=None, variant="thunder"):
+        """
+        参数:
+            size (int): 工作进程数量
+            max_jobs_per_worker (int): 每个工作进程处理多少个任务后重启，0表示不重启
+            cores_per_worker (int): 每个工作进程绑定的核心数，默认平分所有可用核心
+            variant (str): 预加载的模型变体
+        """
+        if size < 1:
+            raise ValueError("工作进程数量必须大于等于1")
+        cores = _available_cores()
+        cores_per_worker = cores_per_worker or max(1, len(cores) // size)
+        context = multiprocessing.get_context("spawn")
+        slots = context.Array("i", size)
+        # 每个槽位中已经加载好模型的工作进程的pid，0表示还在启动
+        self._ready = context.Array("i", size)
+        self.size = size
+        self._context = context
+        self._manager = None
+        self._manager_lock = threading.Lock()
+        self._pool = context.Pool(
+            processes=size,
+            initializer=_init_worker,
+            initargs=(slots, self._ready, cores, cores_per_worker, variant),
+            maxtasksperchild=max_jobs_per_worker or None,
+        )
+
+    @property
+    def ready_workers(self):
+        """已经加载好模型、可以处理任务的工作进程数量，退出后正在重启的进程不计入。"""
+        with self._ready.get_lock():
+            pids = list(self._ready)
+        return sum(1 for pid in pids if pid and _process_alive(pid))
+
+    def submit(self, func, *args):
+        """Runs func(*args) in a worker and returns an asyncio future with its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _set_result(result):
+            loop.call_soon_threadsafe(_resolve, future, result, None)
+
+        def _set_error(error):
+            loop.call_soon_threadsafe(_resolve, future, None, error)
+
+        self._pool.apply_async(func, args, callback=_set_result, error_callback=_set_error)
+        return future
+
+    async def analyze(self, file, progress=None):
+        """
+        在工作进程中运行 pose_analyzer，返回姿态分析结果。
+
+        参数:
+            file (str | bytes): 视频文件路径或字节数据
+            progress: 可选的回调函数 progress(stage, **data)，在主进程的转发线程中调用
+        """
+        if progress is None:
+            result, records = await self.submit(_analyze, file)
+            telemetry.merge(records)
+            return result
+
+        events = self._get_manager().Queue()
+        relay = threading.Thread(target=_relay_events, args=(events, progress), daemon=True)
+        relay.start()
+        try:
+            result, records = await self.submit(_analyze, file, events)
+            telemetry.merge(records)
+            return result
+        finally:
+            # 工作进程的事件都在返回结果前写入队列，None排在它们之后；等转发完再返回
+            events.put(None)
+            await asyncio.to_thread(relay.join)
+
+    def _get_manager(self):
+        with self._manager_lock:
+            if self._manager is None:
+                self._manager = self._context.Manager()
+        return self._manager
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
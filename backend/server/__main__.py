@@ -2,19 +2,29 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, File, UploadFile
+# 启动耗时从这里开始计算
+from server.startup import StartupReport, WARM_UP, start_warm_up
+startup = StartupReport()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List
-from pose_detection import pose_analyzer
-from bike_fit_advisor import BikeFitAdvisor
+from pose_detection import get_model, is_model_ready
+from pose_detection.worker_pool import PoseWorkerPool, DEFAULT_POOL_SIZE
+from bike_fit_advisor import BikeFitAdvisor, PROMPT_VERSION
+from api_model import API_ERROR_PREFIX
+from server.advice_cache import AdviceCache, knowledge_base_version
+from server.admission import AdmissionController, AdmissionRejected, DEFAULT_MAX_CONCURRENT, client_id
+from server.jobs import JobTable, JobTableFull
+from server.uploads import UploadError, receive_video_upload
+import telemetry
 import os
+import asyncio
 import dotenv
 import json
 
-from local_rag.chat import get_model_response
-
 dotenv.load_dotenv()
 
 app = FastAPI(root_path="/api")
@@ -32,40 +42,313 @@ print("API_KEY:", os.getenv("DASHSCOPE_API_KEY"))
 bike_advisor = BikeFitAdvisor(use_api=True, api_key=os.getenv("DASHSCOPE_API_KEY"))
 
 if_useRAG = True
+
+# 姿态分析工作进程池，POSE_WORKERS=0 时在本进程的线程中运行
+pose_pool = None
+
+startup.mark("import")
+
+@app.on_event("startup")
+async def start_pose_pool():
+    global pose_pool
+    if DEFAULT_POOL_SIZE > 0:
+        with startup.stage("pose_workers"):
+            pose_pool = PoseWorkerPool(DEFAULT_POOL_SIZE)
+    if WARM_UP:
+        start_warm_up(startup, *warm_up_plan())
+
+def warm_up_plan():
+    """返回后台预热需要导入的模块和需要运行的阶段，按依赖顺序导入，每个模块只统计自己新增的耗时。"""
+    # 接收上传时用OpenCV读取视频时长
+    modules = ["numpy", "cv2", "pose_detection.preprocessing"]
+    stages = []
+    if pose_pool is None:
+        # 在本进程中分析时才需要TensorFlow，工作进程启动时自己加载模型
+        modules += ["tensorflow", "tensorflow_hub", "pose_detection.pose_analyzer"]
+        stages.append(("model", get_model))
+    if if_useRAG:
+        modules += ["llama_index.core", "local_rag.chat"]
+    return modules, stages
+
+@app.get("/startup")
+async def startup_report():
+    return startup.to_dict()
+
+@app.on_event("shutdown")
+async def stop_pose_pool():
+    if pose_pool is not None:
+        pose_pool.close()
+
+@app.get("/ready")
+async def ready():
+    # 模型首次加载完成并预热后才算就绪，使用工作进程池时模型在工作进程启动时加载，至少一个工作进程加载完成后才算就绪
+    if pose_pool is not None:
+        ready_workers = pose_pool.ready_workers
+        return {
+            "model_ready": ready_workers > 0, "workers": pose_pool.size, "ready_workers": ready_workers,
+            "warmed_up": startup.ready.is_set(),
+        }
+    return {"model_ready": is_model_ready(), "warmed_up": startup.ready.is_set()}
+
+# 姿态分析的准入控制：同时运行的分析数默认与工作进程数相同，其余请求排队，队列满时返回429
+admission = AdmissionController(DEFAULT_MAX_CONCURRENT or max(DEFAULT_POOL_SIZE, 1))
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.stats()
+
+def admit(request):
+    """在接收视频之前预留排队位置，服务器繁忙或该客户端的请求过多时返回429。"""
+    try:
+        return admission.admit(client_id(request))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+#姿态分析结果中的 analysis 是分析过程的信息（停止原因、处理的帧数），不是测量值，不能放进提示词
+def split_analysis(result):
+    """返回 (测量值, 分析信息)，分析信息不存在时为None。"""
+    measurements = dict(result)
+    return measurements, measurements.pop("analysis", None)
+
+async def run_pose_analyzer(file, progress=None):
+    """在工作进程（或线程）中运行姿态分析，不阻塞事件循环。"""
+    if pose_pool is not None:
+        return await pose_pool.analyze(file, progress)
+    from pose_detection.pose_analyzer import pose_analyzer
+
+    return await asyncio.to_thread(pose_analyzer, file, progress)
+
+# 建议缓存：测量值几乎相同时重放之前生成的建议
+advice_cache = AdviceCache()
+# RAG使用的模型和知识库，与 get_model_response 的参数一致
+RAG_MODEL = "qwen-max"
+RAG_DB_NAME = "bike-fit"
+
+@app.get("/advice/cache")
+async def advice_cache_stats():
+    return advice_cache.stats()
+
+#导出准入队列、建议缓存和批处理的统计，与耗时直方图一起出现在 /metrics 中
+def _collect_server_metrics():
+    queue = admission.stats()
+    cache = advice_cache.stats()
+    families = [
+        ("bikefit_admission_running", "gauge", "Pose analyses currently running", [({}, queue["running"])]),
+        ("bikefit_admission_queued", "gauge", "Pose analyses waiting for a slot", [({}, queue["queued"])]),
+        ("bikefit_admission_admitted_total", "counter", "Pose analyses admitted", [({}, queue["admitted"])]),
+        ("bikefit_admission_rejected_total", "counter", "Pose analyses rejected",
+         [({"reason": reason}, count) for reason, count in queue["rejected"].items()]),
+        ("bikefit_advice_cache_hits_total", "counter", "Advice cache hits", [({}, cache["hits"])]),
+        ("bikefit_advice_cache_misses_total", "counter", "Advice cache misses", [({}, cache["misses"])]),
+        ("bikefit_advice_cache_entries", "gauge", "Advice cache entries", [({}, cache["entries"])]),
+    ]
+    # 在本进程中推理且模型已经加载时，导出动态批处理的统计
+    if pose_pool is None and is_model_ready():
+        model, _ = get_model()
+        if hasattr(model, "metrics"):
+            batcher = model.metrics()
+            families += [
+                ("bikefit_batcher_queue_depth", "gauge", "Images waiting for the batcher", [({}, batcher["queue_depth"])]),
+                ("bikefit_batcher_batches_total", "counter", "Batches run by the batcher", [({}, batcher["batches"])]),
+                ("bikefit_batcher_images_total", "counter", "Images run by the batcher", [({}, batcher["images"])]),
+            ]
+    return families
+
+telemetry.register_collector(_collect_server_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus文本格式：各阶段耗时、每帧推理耗时、解码帧率、大模型首字延迟和生成速度
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def advice_cache_key(result):
+    """建议的缓存键：取整后的测量值、模型、提示词版本和知识库版本。"""
+    if if_useRAG:
+        model = f"rag:{RAG_MODEL}"
+        # 与 local_rag.chat 相同，知识库目录相对于当前工作目录
+        kb_version = knowledge_base_version(os.path.join("VectorStore", RAG_DB_NAME))
+    else:
+        model = getattr(bike_advisor.model, "model_name", type(bike_advisor.model).__name__)
+        kb_version = None
+    return advice_cache.key(result, model, PROMPT_VERSION, kb_version)
+
+#回答中包含API调用失败的信息时不缓存
+def _advice_succeeded(messages):
+    for message in messages:
+        text = message if isinstance(message, str) else message.get("message")
+        if isinstance(text, str) and API_ERROR_PREFIX in text:
+            return False
+    return True
+
+def generate_advice(result):
+    """
+    根据测量结果生成建议，使用RAG时每次产出累积的完整回答字符串，否则产出stream_advisor的消息字典。
+    命中建议缓存时按同样的格式重放缓存的回答。
+    """
+    key = advice_cache_key(result)
+    cached = advice_cache.get(key)
+    if cached is not None:
+        print("Using cached advice")
+        for message in cached:
+            # info消息中的测量值换成这一次的
+            if isinstance(message, dict) and message.get("type") == "info":
+                message = {**message, "message": result}
+            yield message
+        return
+    yield from advice_cache.record(key, _generate_advice(result), should_store=_advice_succeeded)
+
+def _generate_advice(result):
+    if if_useRAG:
+        print("Using RAG")
+        # Convert measurements to text format for RAG
+        measurement_text = bike_advisor.generate_prompt(result)
+
+        # Create a mock history with just the current question
+        history = [[measurement_text, None]]
+
+        # Use local_rag's get_model_response，llama_index等依赖在第一次使用（或后台预热）时导入
+        from local_rag.chat import get_model_response
+
+        for response in get_model_response(
+            {'text': measurement_text, 'files': []},
+            history,
+            model=RAG_MODEL,
+            temperature=0.7,
+            max_tokens=1024,
+            history_round=1,
+            db_name=RAG_DB_NAME,
+            similarity_threshold=0.2,
+            chunk_cnt=5
+        ):
+            yield response[0][-1][-1]
+    else:
+        yield from bike_advisor.stream_advisor(measurements=result)
+
+async def receive_video(request):
+    """分块接收请求中的 video 字段，超过大小或时长限制时返回413。"""
+    try:
+        return await receive_video_upload(request)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
 @app.post("/analyze/video")
-async def analyze_video(video: UploadFile = File(...)):
-    video_bytes = await video.read()
-    result = pose_analyzer.pose_analyzer(video_bytes)
+async def analyze_video(request: Request):
+    ticket = admit(request)
+    with telemetry.trace("analyze_video") as trace:
+        try:
+            # 不使用 UploadFile，视频边接收边检查大小，大文件直接写入磁盘
+            with telemetry.span("upload"):
+                upload = await receive_video(request)
+            try:
+                with telemetry.span("queue"):
+                    await ticket.start()
+                result, analysis = split_analysis(await run_pose_analyzer(upload.source))
+            finally:
+                upload.close()
+        finally:
+            # 只有姿态分析占用名额，生成建议时已经释放
+            ticket.finish()
     def generate_streaming_response():
-        if if_useRAG:
-            print("Using RAG")
-            # Convert measurements to text format for RAG
-            measurement_text = bike_advisor.generate_prompt(result)
-            
-            # Create a mock history with just the current question
-            history = [[measurement_text, None]]
-            
-            # Use local_rag's get_model_response
-            for response in get_model_response(
-                {'text': measurement_text, 'files': []},
-                history,
-                model='qwen-max',
-                temperature=0.7,
-                max_tokens=1024,
-                history_round=1,
-                db_name='bike-fit',
-                similarity_threshold=0.2,
-                chunk_cnt=5
-            ):
-                yield json.dumps(response[0][-1][-1]) + "\n"
+        # 建议在响应中流式生成，作为单独的trace记录，通过 request 关联到姿态分析的trace
+        for message in telemetry.trace_stream(generate_advice(result), "advice", request=trace["id"]):
+            yield json.dumps(message) + "\n"
+
+    # 排队时间和分析时间分别在响应头中返回，分析信息（停止原因、处理的帧数）也放在响应头中
+    headers = {
+        "X-Queue-Seconds": f"{ticket.queue_seconds:.3f}",
+        "X-Processing-Seconds": f"{ticket.processing_seconds:.3f}",
+    }
+    if analysis is not None:
+        headers["X-Stop-Reason"] = str(analysis["stop_reason"])
+        headers["X-Frames-Processed"] = str(analysis["frames_processed"])
+    return StreamingResponse(generate_streaming_response(), media_type="application/json", headers=headers)
+
+# 异步分析任务：提交后立即返回任务id，通过状态接口或SSE获取进度
+jobs = JobTable()
+# 保存后台任务的引用，防止任务在完成前被垃圾回收
+running_jobs = set()
+
+#将建议的增量文本作为advice事件写入任务
+def stream_advice_to_job(job, result):
+    previous = ""
+    for message in generate_advice(result):
+        if isinstance(message, str):
+            # RAG每次返回的是累积的完整回答，只发送新增的部分
+            text, previous = message[len(previous):], message
+        elif message.get("type") in ("reasoning", "response"):
+            text = message["message"]
         else:
-            for message in bike_advisor.stream_advisor(measurements=result):
-                yield json.dumps(message) + "\n"
-            
-    return StreamingResponse(generate_streaming_response(), media_type="application/json")
+            continue
+        if text:
+            job.emit_threadsafe("advice", text=text)
+
+async def run_job(job, upload, ticket):
+    with telemetry.trace("job", job_id=job.id):
+        await _run_job(job, upload, ticket)
+
+async def _run_job(job, upload, ticket):
+    try:
+        try:
+            with telemetry.span("queue"):
+                await ticket.start()
+            job.queue_seconds = ticket.queue_seconds
+            job.emit("started", queue_seconds=ticket.queue_seconds)
+            result, _ = split_analysis(await run_pose_analyzer(upload.source, progress=job.emit_threadsafe))
+        finally:
+            ticket.finish()
+            job.processing_seconds = ticket.processing_seconds
+            upload.close()
+        if "error" in result:
+            job.emit("error", message=result["error"])
+            return
+        await asyncio.to_thread(stream_advice_to_job, job, result)
+        job.emit("done")
+    except Exception as e:
+        job.emit("error", message=str(e))
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: Request):
+    ticket = admit(request)
+    # 先占用任务表中的位置，任务表已满时在读取上传的视频之前拒绝
+    try:
+        job = jobs.create()
+    except JobTableFull as e:
+        ticket.finish()
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        upload = await receive_video(request)
+    except BaseException:
+        ticket.finish()
+        jobs.remove(job.id)
+        raise
+    task = asyncio.create_task(run_job(job, upload, ticket))
+    running_jobs.add(task)
+    task.add_done_callback(running_jobs.discard)
+    return {"job_id": job.id, "status": job.status}
+
+def get_job_or_404(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/measurements")
+async def job_measurements(job_id: str):
+    # get_pose完成后即可获取，不需要等待大模型的建议
+    job = get_job_or_404(job_id)
+    if job.measurements is None:
+        return JSONResponse(status_code=202, content={"status": job.status, "stage": job.stage, "error": job.error})
+    return job.measurements
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = get_job_or_404(job_id)
+    return StreamingResponse(job.stream(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
-
-
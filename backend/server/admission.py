@@ -0,0 +1,204 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+
+# 程序功能：姿态分析的准入控制。同时运行的分析数量有上限，其余请求按顺序排队；
+# 队列已满或同一客户端的请求过多时立即返回429，并根据当前的吞吐量估计多久之后可以重试
+
+# 同时运行的姿态分析数，0表示与姿态分析工作进程数相同
+DEFAULT_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0"))
+# 排队等待的请求数上限
+DEFAULT_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+# 每个客户端同时排队和运行的请求数上限，0表示不限制
+DEFAULT_MAX_PER_CLIENT = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "2"))
+# 还没有完成过分析时，估计的单次分析耗时（秒）
+DEFAULT_SERVICE_SECONDS = float(os.getenv("ADMISSION_DEFAULT_SERVICE_SECONDS", "10"))
+# 指数加权移动平均的权重，越大越偏向最近的请求
+EWMA_ALPHA = 0.2
+# 可信的反向代理的IP，逗号分隔。只有连接来自这些地址时才使用代理转发的客户端标识，
+# 否则调用方可以随意设置 X-Client-Id 请求头绕过每个客户端的限制
+TRUSTED_PROXIES = frozenset(ip.strip() for ip in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if ip.strip())
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be queued; retry_after is the suggested wait in seconds."""
+
+    def __init__(self, message, retry_after, status_code=429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class Ticket:
+    """One admitted request: holds a queue place until it starts and a slot until it finishes."""
+
+    def __init__(self, controller, client):
+        self.client = client
+        self.admitted_at = time.monotonic()
+        self.queued_at = None
+        self.started_at = None
+        self.finished_at = None
+        self._controller = controller
+
+    @property
+    def queue_seconds(self):
+        """排队等待的时间，从调用 start() 到开始运行。"""
+        if self.queued_at is None:
+            return 0.0
+        return (self.started_at or time.monotonic()) - self.queued_at
+
+    @property
+    def processing_seconds(self):
+        """开始运行到 finish() 的时间。"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    async def start(self):
+        """排队等待一个运行名额，按调用顺序依次开始。"""
+        await self._controller._start(self)
+
+    def finish(self):
+        """释放名额，可以重复调用；没有开始运行时只释放排队位置。"""
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+            self._controller._finish(self)
+
+
+class AdmissionController:
+    """Bounded admission queue in front of the pose pipeline.
+
+    admit() reserves a queue place right away or raises AdmissionRejected,
+    so an overloaded server refuses a video before receiving it. Once the
+    upload has arrived, Ticket.start() waits for one of max_concurrent
+    slots in FIFO order. Queue wait and processing time are tracked apart,
+    and the moving average of the processing time gives the throughput
+    that the Retry-After estimate is based on.
+
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, max_concurrent=1, max_queue=DEFAULT_MAX_QUEUE, max_per_client=DEFAULT_MAX_PER_CLIENT,
+                 default_service_seconds=DEFAULT_SERVICE_SECONDS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.running = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = Counter()  # 拒绝原因 -> 次数
+        self.avg_queue_seconds = 0.0
+        self.avg_processing_seconds = default_service_seconds
+        self._waiting = 0  # 已准入、还没有开始运行的请求数
+        self._waiters = deque()  # 正在等待名额的 (ticket, future)
+        self._clients = Counter()
+
+    @property
+    def queued(self):
+        return self._waiting
+
+    @property
+    def throughput(self):
+        """当前每秒可以完成的分析数。"""
+        return self.max_concurrent / max(self.avg_processing_seconds, 1e-3)
+
+    def retry_after(self, backlog=None):
+        """估计 backlog 个请求（默认是当前排队的请求）处理完所需的秒数，向上取整，至少1秒。"""
+        if backlog is None:
+            backlog = self._waiting
+        return max(1, math.ceil(backlog / self.throughput))
+
+    def admit(self, client=None):
+        """
+        为一个请求预留排队位置。
+
+        异常:
+            AdmissionRejected: 该客户端的请求数已达上限，或排队的请求数已达上限
+        """
+        if self.max_per_client and client is not None and self._clients[client] >= self.max_per_client:
+            self.rejected["client"] += 1
+            # 该客户端最早的请求大约还需要一次分析的时间
+            raise AdmissionRejected(
+                f"同一客户端最多同时提交 {self.max_per_client} 个视频，请稍后再试",
+                max(1, math.ceil(self.avg_processing_seconds)),
+            )
+        if self._waiting >= self.max_queue and self.running + self._waiting >= self.max_concurrent:
+            self.rejected["queue"] += 1
+            raise AdmissionRejected("服务器繁忙，请稍后再试", self.retry_after())
+        self.admitted += 1
+        self._waiting += 1
+        self._clients[client] += 1
+        return Ticket(self, client)
+
+    async def _start(self, ticket):
+        ticket.queued_at = time.monotonic()
+        if self.running < self.max_concurrent and not self._waiters:
+            self._run(ticket)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((ticket, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 客户端断开时不再等待；已经分配到的名额由调用者的 finish() 释放
+            if (ticket, future) in self._waiters:
+                self._waiters.remove((ticket, future))
+            raise
+
+    def _run(self, ticket):
+        self._waiting -= 1
+        self.running += 1
+        ticket.started_at = time.monotonic()
+        self.avg_queue_seconds += EWMA_ALPHA * (ticket.queue_seconds - self.avg_queue_seconds)
+
+    def _finish(self, ticket):
+        self._clients[ticket.client] -= 1
+        if self._clients[ticket.client] <= 0:
+            del self._clients[ticket.client]
+        if ticket.started_at is None:
+            self._waiting -= 1
+            return
+        self.running -= 1
+        self.completed += 1
+        self.avg_processing_seconds += EWMA_ALPHA * (ticket.processing_seconds - self.avg_processing_seconds)
+        # 名额交给最早排队、仍在等待的请求
+        while self._waiters and self.running < self.max_concurrent:
+            waiter, future = self._waiters.popleft()
+            if not future.done():
+                self._run(waiter)
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_per_client": self.max_per_client,
+            "running": self.running,
+            "queued": self._waiting,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": dict(self.rejected),
+            "avg_queue_seconds": self.avg_queue_seconds,
+            "avg_processing_seconds": self.avg_processing_seconds,
+            "throughput_per_minute": self.throughput * 60,
+        }
+
+
+def client_id(request, trusted_proxies=TRUSTED_PROXIES):
+    """
+    客户端标识：连接的对端IP。连接来自可信的代理（ADMISSION_TRUSTED_PROXIES）时，使用代理设置的 X-Client-Id，
+    没有时使用 X-Forwarded-For 中从右往左第一个不是可信代理的地址。
+    """
+    peer = request.client.host if request.client else None
+    if peer is None or peer not in trusted_proxies:
+        return peer
+    client = request.headers.get("x-client-id")
+    if client:
+        return client
+    forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+    for ip in reversed(forwarded):
+        if ip not in trusted_proxies:
+            return ip
+    return peer
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 程序功能：缓存大模型生成的建议。测量值按区间取整后作为键，与模型、提示词版本和知识库版本一起，
+# 角度几乎相同的两次分析直接重放缓存的回答，不需要再检索知识库和调用大模型
+
+# 缓存的有效期（秒）
+DEFAULT_TTL = float(os.getenv("ADVICE_CACHE_TTL", "3600"))
+# 最多缓存的回答数，超过时淘汰最久没有使用的，0表示不缓存
+DEFAULT_MAX_ENTRIES = int(os.getenv("ADVICE_CACHE_MAX_ENTRIES", "256"))
+# 测量值取整的区间（度），例如2表示 71.2° 和 72.9° 都落在 72° 的区间中
+DEFAULT_BUCKET = float(os.getenv("ADVICE_CACHE_BUCKET_DEG", "2"))
+
+
+#解析每项测量单独的区间，格式为 "knee_angle_lowest=1,shoulder_angle=5"
+def _parse_buckets(spec):
+    buckets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        buckets[name.strip()] = float(value)
+    return buckets
+
+
+DEFAULT_BUCKETS = _parse_buckets(os.getenv("ADVICE_CACHE_BUCKETS", ""))
+
+
+def quantize_measurements(measurements, bucket=DEFAULT_BUCKET, buckets=None):
+    """
+    把测量值取整到区间中心，只保留数值型的测量。
+
+    参数:
+        measurements (dict): get_pose / pose_analyzer 的结果
+        bucket (float): 默认的区间大小（度）
+        buckets (dict): 每项测量单独的区间大小，默认使用 ADVICE_CACHE_BUCKETS
+
+    返回:
+        dict: 测量名 -> 取整后的值，没有可用的测量时为空
+    """
+    buckets = DEFAULT_BUCKETS if buckets is None else buckets
+    quantized = {}
+    for name, value in measurements.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        value = float(value)
+        if not math.isfinite(value):
+            continue
+        size = buckets.get(name, bucket)
+        quantized[name] = round(value / size) * size if size > 0 else value
+    return quantized
+
+
+def knowledge_base_version(path):
+    """知识库目录中所有文件的路径、大小和修改时间的摘要，重建知识库后版本随之变化；目录不存在时为None。"""
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.sha256()
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{os.path.relpath(os.path.join(root, name), path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class AdviceCache:
+    """TTL + LRU cache of streamed advice, keyed by quantised measurements.
+
+    An entry stores the messages of one complete advice stream so a hit
+    replays exactly what the model produced. Cumulative string messages (the
+    RAG answer grows with every chunk) are kept as increments and rebuilt on
+    replay. Entries expire ttl seconds after they were stored; beyond
+    max_entries the least recently used one is evicted. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, bucket=DEFAULT_BUCKET, buckets=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket = bucket
+        self.buckets = buckets
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = {"ttl": 0, "lru": 0}
+        self._entries = OrderedDict()  # key -> (存入时间, 消息列表)
+        self._lock = threading.Lock()
+
+    def key(self, measurements, model, prompt_version, kb_version=None):
+        """返回缓存键；结果包含错误或没有数值型的测量时返回None，不缓存。"""
+        if self.max_entries <= 0 or "error" in measurements:
+            return None
+        quantized = quantize_measurements(measurements, self.bucket, self.buckets)
+        if not quantized:
+            return None
+        payload = {
+            "measurements": quantized,
+            "model": model,
+            "prompt_version": prompt_version,
+            "kb_version": kb_version,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        """命中时返回重放缓存回答的生成器，否则返回None。"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.evictions["ttl"] += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _replay(entry[1])
+
+    def record(self, key, stream, should_store=None):
+        """
+        转发 stream 的每条消息，完整结束后存入缓存。中途出错或客户端断开时不缓存。
+
+        参数:
+            key: key() 返回的缓存键，为None时只转发
+            stream: 产出建议消息（字典或累积的字符串）的生成器
+            should_store: 可选的函数 should_store(messages)，返回False时不缓存，例如回答中包含调用失败的信息
+        """
+        if key is None:
+            yield from stream
+            return
+        messages, previous = [], None
+        for message in stream:
+            if isinstance(message, str) and previous is not None and message.startswith(previous):
+                messages.append(("append", message[len(previous):]))
+            else:
+                messages.append(("message", message))
+            previous = message if isinstance(message, str) else None
+            yield message
+        if should_store is None or should_store(list(_replay(messages))):
+            self._put(key, messages)
+
+    def _put(self, key, messages):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), messages)
+            self._entries.move_to_end(key)
+            self.stored += 1
+            now = time.monotonic()
+            for expired in [name for name, (stored_at, _) in self._entries.items() if now - stored_at > self.ttl]:
+                del self._entries[expired]
+                self.evictions["ttl"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions["lru"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stored": self.stored,
+                "evictions": dict(self.evictions),
+            }
+
+
+#按存入时的格式依次产出缓存的消息
+def _replay(messages):
+    text = ""
+    for kind, message in messages:
+        if kind == "append":
+            text += message
+            yield text
+        else:
+            text = message if isinstance(message, str) else ""
+            yield message
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+# 程序功能：异步分析任务表。提交视频后立即返回任务id，客户端可以查询状态或通过SSE订阅进度事件
+
+DEFAULT_MAX_JOBS = 100
+DEFAULT_JOB_TTL = 600  # 秒
+
+
+class JobTableFull(Exception):
+    """Raised when every slot of the job table is held by an unfinished job."""
+
+
+class Job:
+    """State and event log of one analysis job.
+
+    All methods must be called from the event loop thread; worker threads
+    should go through emit_threadsafe.
+    """
+
+    def __init__(self, loop):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.stage = None
+        self.progress = {}
+        self.measurements = None
+        # 分析过程的信息（停止原因、处理的帧数），与测量值一起报告
+        self.analysis = None
+        self.advice = ""
+        self.error = None
+        # 排队等待和姿态分析各自的耗时（秒），开始运行/分析结束后才有值
+        self.queue_seconds = None
+        self.processing_seconds = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._loop = loop
+        self._events = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def emit(self, event, **data):
+        """Records an event, updates the job state and wakes up the SSE subscribers."""
+        if event == "advice":
+            self.advice += data["text"]
+        elif event == "measurements":
+            self.measurements = data["measurements"]
+            self.analysis = data.get("analysis")
+        elif event == "error":
+            self.error = data["message"]
+            self.status = "error"
+        elif event == "done":
+            self.status = "done"
+        else:
+            self.progress[event] = data
+        if not self.finished:
+            self.status = "running"
+        self.stage = event
+        self.updated_at = time.time()
+        self._events.append((event, data))
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def emit_threadsafe(self, event, **data):
+        self._loop.call_soon_threadsafe(lambda: self.emit(event, **data))
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "measurements": self.measurements,
+            "analysis": self.analysis,
+            "error": self.error,
+            "queue_seconds": self.queue_seconds,
+            "processing_seconds": self.processing_seconds,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    async def stream(self):
+        """Yields every event of the job as a server-sent event, from the first one until the job finishes."""
+        index = 0
+        while True:
+            while index < len(self._events):
+                event, data = self._events[index]
+                index += 1
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if self.finished:
+                return
+            await self._changed.wait()
+
+
+class JobTable:
+    """Bounded in-memory table of jobs with TTL eviction.
+
+    Finished jobs not updated for ttl seconds are dropped; queued and running
+    jobs are kept until they finish. When the table is full the oldest
+    finished job is dropped; if every job is still unfinished, create raises
+    JobTableFull.
+    """
+
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS, ttl=DEFAULT_JOB_TTL):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+
+    def create(self):
+        self._evict()
+        if len(self._jobs) >= self.max_jobs:
+            raise JobTableFull("任务队列已满，请稍后再试")
+        job = Job(asyncio.get_running_loop())
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        self._evict()
+        return self._jobs.get(job_id)
+
+    def remove(self, job_id):
+        """删除任务，例如占用了位置但视频上传失败的任务。"""
+        self._jobs.pop(job_id, None)
+
+    def _evict(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and now - job.updated_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if len(self._jobs) >= self.max_jobs:
+            for job_id, job in self._jobs.items():
+                if job.finished:
+                    del self._jobs[job_id]
+                    break
@@ -0,0 +1,105 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 程序功能：服务器启动耗时报告和后台预热。较慢的依赖（TensorFlow、OpenCV、llama_index等）不在导入服务器时加载，
+# 而是在启动后由后台线程依次导入并加载模型，第一个请求不需要等待；每个模块和阶段的耗时都记录在报告中
+
+# 启动后是否在后台预热，SERVER_WARMUP=0 时在第一次使用时才导入和加载
+WARM_UP = os.getenv("SERVER_WARMUP", "1") != "0"
+
+
+class StartupReport:
+    """Wall-clock breakdown of the server start by imported module and by stage.
+
+    Module times are incremental: a module that is already imported by an
+    earlier one costs nothing, so the order of import_module calls decides
+    where shared dependencies are accounted.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.modules = {}  # 模块 -> 导入耗时（秒）
+        self.stages = {}  # 阶段 -> 耗时（秒）
+        self.errors = {}  # 模块或阶段 -> 错误信息
+        self.ready = threading.Event()
+        self._ready_at = None
+
+    def import_module(self, name):
+        """导入一个模块并记录耗时，已经导入过的模块不重复记录。失败时记录错误并返回None。"""
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(name)
+        except Exception as e:
+            self.errors[name] = str(e)
+            return None
+        self.modules[name] = time.perf_counter() - start
+        return module
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时，阶段中的异常只记录不抛出，预热失败时服务器仍可以在第一次使用时重试。"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = str(e)
+        finally:
+            self.stages[name] = time.perf_counter() - start
+
+    def mark(self, name):
+        """记录从开始到现在的时间，作为一个阶段。"""
+        self.stages[name] = time.perf_counter() - self.started_at
+
+    def finish(self):
+        self._ready_at = time.perf_counter()
+        self.ready.set()
+
+    def to_dict(self):
+        end = self._ready_at if self._ready_at is not None else time.perf_counter()
+        return {
+            "ready": self.ready.is_set(),
+            "total_seconds": end - self.started_at,
+            "stages": dict(self.stages),
+            "modules": dict(sorted(self.modules.items(), key=lambda item: -item[1])),
+            "errors": dict(self.errors),
+        }
+
+    def print(self):
+        report = self.to_dict()
+        print(f"\n启动耗时: {report['total_seconds']:.2f} 秒")
+        for name, seconds in report["stages"].items():
+            print(f"  - 阶段 {name:<24} {seconds:>7.2f} 秒")
+        for name, seconds in report["modules"].items():
+            print(f"  - 模块 {name:<24} {seconds:>7.2f} 秒")
+        for name, error in report["errors"].items():
+            print(f"  ✗ {name}: {error}")
+
+
+def start_warm_up(report, modules=(), stages=()):
+    """
+    在后台线程中依次导入 modules，再运行 stages 中的每个 (名称, 函数)，完成后打印报告。
+
+    返回:
+        threading.Thread: 预热线程
+    """
+    def _warm_up():
+        try:
+            with report.stage("warm_up"):
+                for name in modules:
+                    report.import_module(name)
+                for name, func in stages:
+                    with report.stage(name):
+                        func()
+        finally:
+            report.finish()
+            report.print()
+
+    thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
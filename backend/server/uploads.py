@@ -0,0 +1,211 @@
+import asyncio
+import os
+import tempfile
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# 程序功能：分块接收上传的视频。小文件保存在内存中，超过阈值后写入磁盘，并尽早检查文件大小和视频时长
+
+MB = 1024 * 1024
+# 单个视频的最大字节数
+DEFAULT_MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "500")) * MB
+# 超过该大小的视频写入磁盘上的临时文件，工作进程直接按路径读取，不需要把整个视频传给工作进程
+DEFAULT_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_MB", "32")) * MB
+# 视频的最大时长（秒），0表示不限制
+DEFAULT_MAX_DURATION = float(os.getenv("MAX_VIDEO_SECONDS", "120"))
+# 临时文件目录，默认使用系统临时目录
+UPLOAD_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# 除视频之外，multipart请求中边界和表单头部允许占用的字节数
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SpooledUpload:
+    """Upload buffer that keeps small videos in memory and spills large ones to a named file.
+
+    source is what pose_analyzer takes: the bytes while the upload is in
+    memory, otherwise the path of the spool file, so worker processes open
+    the file themselves instead of receiving a pickled copy. The in-memory
+    bytes are built once by finish(), so reading source does not copy the
+    video again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_UPLOAD_BYTES, spool_bytes=DEFAULT_SPOOL_BYTES, directory=UPLOAD_DIR):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.directory = directory
+        self.size = 0
+        self._buffer = bytearray()
+        # finish() 之后内存中的视频，只构造一次
+        self._data = None
+        self._file = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadError(f"视频大小超过限制（{self.max_bytes // MB} MB）", status_code=413)
+        if self._file is None and self.size > self.spool_bytes:
+            self._file = tempfile.NamedTemporaryFile(suffix=".mp4", dir=self.directory, delete=False)
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer += data
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def finish(self):
+        """Flushes the spool file or freezes the in-memory bytes; call once the whole upload has been written."""
+        if self._file is not None:
+            self._file.close()
+        else:
+            self._data, self._buffer = bytes(self._buffer), bytearray()
+
+    @property
+    def in_memory(self):
+        return self._file is None
+
+    @property
+    def source(self):
+        if self._file is not None:
+            return self._file.name
+        # finish() 之前只能复制还在写入的缓冲区
+        return self._data if self._data is not None else bytes(self._buffer)
+
+    def close(self):
+        """Drops the buffer and deletes the spool file."""
+        self._buffer = bytearray()
+        self._data = None
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self._file.name)
+            except FileNotFoundError:
+                pass
+
+
+async def receive_video_upload(request, field="video", max_bytes=DEFAULT_MAX_UPLOAD_BYTES,
+                               spool_bytes=DEFAULT_SPOOL_BYTES, max_duration=DEFAULT_MAX_DURATION):
+    """
+    分块读取 multipart/form-data 请求中的视频字段。
+
+    Content-Length 超过限制时在读取请求体之前就拒绝；没有 Content-Length（分块传输）时边读边计数，
+    超过限制立即停止读取。视频时长只读取元数据检查，不解码：大文件写入磁盘后先尝试用已收到的部分检查
+    （moov在文件开头的mp4可以读出时长），失败时在接收完成后再检查。
+
+    参数:
+        request: starlette 的 Request
+        field (str): 视频所在的表单字段
+        max_bytes (int): 视频的最大字节数
+        spool_bytes (int): 超过该大小后写入临时文件
+        max_duration (float): 视频的最大时长（秒），0表示不限制
+
+    返回:
+        SpooledUpload: 调用者使用完后需要调用 close()
+
+    异常:
+        UploadError: 请求格式错误（400）、文件过大或视频过长（413）、无法读取视频（415）
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes + _MULTIPART_OVERHEAD:
+        raise UploadError(f"视频大小超过限制（{max_bytes // MB} MB）", status_code=413)
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("请求必须是包含视频文件的 multipart/form-data")
+
+    upload = SpooledUpload(max_bytes, spool_bytes)
+    state = {"header_field": b"", "headers": {}, "current": None, "found": False}
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        name = state["header_field"].lower()
+        state["headers"][name] = state["headers"].get(name, b"") + data[start:end]
+
+    def on_header_end():
+        state["header_field"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["current"] = disposition.get(b"name", b"").decode()
+        if state["current"] == field:
+            state["found"] = True
+
+    def on_part_data(data, start, end):
+        if state["current"] == field:
+            upload.write(data[start:end])
+
+    def on_part_end():
+        state["current"] = None
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    duration_checked = not max_duration
+    partial_checked = False
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise UploadError(f"无法解析上传的表单: {e}") from e
+            if not duration_checked and not partial_checked and not upload.in_memory:
+                # 开始写入磁盘时尝试一次
+                partial_checked = True
+                upload.flush()
+                duration_checked = await asyncio.to_thread(_check_duration, upload.source, max_duration, True)
+        parser.finalize()
+        upload.finish()
+        if not state["found"] or upload.size == 0:
+            raise UploadError(f"请求中没有视频文件（字段 {field}）")
+        if not duration_checked:
+            await asyncio.to_thread(_check_duration, upload.source, max_duration)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+#检查视频时长，partial为True时检查的是只收到一部分的文件，读不到时长时返回False，之后再检查
+def _check_duration(source, max_duration, partial=False):
+    # OpenCV在第一次上传时才导入
+    from pose_detection.preprocessing import probe_video
+
+    try:
+        # 内存中的小文件也写入临时文件再按路径读取元数据，不在服务器进程中使用OpenCV的内存流解码
+        info = probe_video(source, ingest="tempfile")
+    except ValueError as e:
+        if partial:
+            return False
+        raise UploadError(f"无法读取视频: {e}", status_code=415) from e
+    if partial and not info["duration"]:
+        return False
+    if info["duration"] > max_duration:
+        raise UploadError(f"视频时长 {info['duration']:.0f} 秒超过限制（{max_duration:.0f} 秒）", status_code=413)
+    return True
@@ -0,0 +1,281 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 程序功能：轻量的耗时统计。span() 记录一段代码的耗时，observe() 记录一个数值，都汇总为Prometheus格式的直方图；
+# 在 trace() 中记录的span还会按请求写入本地JSONL文件（设置 TELEMETRY_TRACE_FILE 时）
+
+# 每个请求的span写入的JSONL文件，不设置时不写入
+TRACE_FILE = os.getenv("TELEMETRY_TRACE_FILE") or None
+
+# 直方图的默认分桶
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MS_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000)
+RATE_BUCKETS = (1, 5, 10, 20, 30, 60, 120, 240, 480, 1000)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with one series per label combination."""
+
+    def __init__(self, name, help, buckets=SECONDS_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # 标签值 -> [每个分桶的计数..., 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_labels(labels + [('le', _number(bound))])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(labels + [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{_labels(labels)} {values[-1]}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+_collectors = []
+
+
+def histogram(name, help, buckets=SECONDS_BUCKETS, labelnames=()):
+    """返回指定名称的直方图，第一次使用时创建。"""
+    with _metrics_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Histogram(name, help, buckets, labelnames)
+        return metric
+
+
+SPAN_SECONDS = histogram("bikefit_span_seconds", "Duration of instrumented spans", SECONDS_BUCKETS, ("span",))
+INFERENCE_MS_PER_FRAME = histogram(
+    "bikefit_inference_ms_per_frame", "MoveNet inference time per frame, including cropping", MS_BUCKETS, ("backend",)
+)
+DECODE_FPS = histogram("bikefit_decode_fps", "Video decoding throughput in frames per second", RATE_BUCKETS, ("mode",))
+LLM_TTFT_SECONDS = histogram("bikefit_llm_ttft_seconds", "LLM time to first token", SECONDS_BUCKETS, ("model",))
+LLM_TOKENS_PER_SECOND = histogram(
+    "bikefit_llm_tokens_per_second", "LLM streaming rate after the first token (stream chunks per second)",
+    RATE_BUCKETS, ("model",),
+)
+
+
+def register_collector(collect):
+    """
+    注册一个在渲染指标时调用的函数，用于导出其他模块已有的统计（例如准入队列、批处理）。
+
+    参数:
+        collect: 无参数函数，返回 [(名称, 类型, 说明, [(标签字典, 值), ...]), ...]，类型为 "gauge" 或 "counter"
+    """
+    _collectors.append(collect)
+
+
+def render_prometheus():
+    """返回所有指标的Prometheus文本格式。"""
+    lines = []
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            lines.append(f"# collector error: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# 当前请求的span列表，在 trace() 中有效；asyncio.to_thread 会把它带到工作线程中
+_trace = contextvars.ContextVar("telemetry_trace", default=None)
+# 工作进程中 collect() 收集的记录，每个工作进程同时只处理一个任务
+_collected = None
+_collected_lock = threading.Lock()
+
+
+def _record(kind, name, value, labels=None, start=None, attrs=None):
+    trace = _trace.get()
+    # 已经结束的trace不再记录
+    if kind == "span" and trace is not None and "start" in trace:
+        trace["spans"].append({
+            "name": name,
+            "start": round(start - trace["start"], 6),
+            "seconds": round(value, 6),
+            **({"attrs": attrs} if attrs else {}),
+        })
+    with _collected_lock:
+        if _collected is not None:
+            _collected.append((kind, name, value, labels or {}, attrs or {}))
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    记录一段代码的耗时。产出的字典可以在代码中补充属性，例如处理的帧数，会写入请求的trace。
+
+    用法:
+        with span("decode") as attrs:
+            ...
+            attrs["frames"] = len(frames)
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        seconds = time.perf_counter() - start
+        SPAN_SECONDS.observe(seconds, span=name)
+        _record("span", name, seconds, start=start, attrs=attrs)
+
+
+def observe(metric, value, **labels):
+    """向直方图记录一个值，metric 是本模块中的直方图对象。"""
+    metric.observe(value, **labels)
+    _record("metric", metric.name, value, labels)
+
+
+def time_stream(stream, model):
+    """
+    转发一个流式回答，记录首个片段的延迟（TTFT）和之后每秒产出的片段数。
+
+    参数:
+        stream: 大模型流式输出的迭代器
+        model (str): 模型名，作为指标的标签
+    """
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    with span("llm.generate", model=model) as attrs:
+        for chunk in stream:
+            if first is None:
+                first = time.perf_counter()
+                observe(LLM_TTFT_SECONDS, first - start, model=model)
+            chunks += 1
+            yield chunk
+        attrs["chunks"] = chunks
+        if first is not None and chunks > 1:
+            elapsed = time.perf_counter() - first
+            if elapsed > 0:
+                observe(LLM_TOKENS_PER_SECOND, (chunks - 1) / elapsed, model=model)
+
+
+@contextmanager
+def trace(name, **attrs):
+    """
+    记录一个请求中所有span的耗时，结束时写入 TELEMETRY_TRACE_FILE。
+
+    返回:
+        dict: trace，包含 id、name、spans 等，结束时补充 seconds
+    """
+    record = _new_trace(name, attrs)
+    token = _trace.set(record)
+    try:
+        yield record
+    finally:
+        _trace.reset(token)
+        _finish_trace(record)
+
+
+def trace_stream(stream, name, **attrs):
+    """
+    与 trace() 相同，但覆盖一个生成器的整个迭代过程，用于流式响应。
+    StreamingResponse 每次取下一条消息可能在不同的线程中，这里每一步都在同一个上下文中运行。
+    """
+    record = _new_trace(name, attrs)
+    context = contextvars.copy_context()
+    context.run(_trace.set, record)
+    try:
+        while True:
+            try:
+                message = context.run(next, stream)
+            except StopIteration:
+                return
+            yield message
+    finally:
+        if hasattr(stream, "close"):
+            context.run(stream.close)
+        _finish_trace(record)
+
+
+def _new_trace(name, attrs):
+    return {"id": uuid.uuid4().hex, "name": name, "time": time.time(), "start": time.perf_counter(),
+            "attrs": attrs, "spans": []}
+
+
+def _finish_trace(record):
+    record["seconds"] = round(time.perf_counter() - record.pop("start"), 6)
+    if TRACE_FILE:
+        _write_trace(record)
+
+
+_trace_file_lock = threading.Lock()
+
+
+def _write_trace(record):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_file_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def collect():
+    """在工作进程中收集这一段代码中的所有记录，之后在主进程中用 merge() 汇总。"""
+    global _collected
+    with _collected_lock:
+        _collected = records = []
+    try:
+        yield records
+    finally:
+        with _collected_lock:
+            _collected = None
+
+
+def merge(records):
+    """把工作进程 collect() 收集的记录加入本进程的指标和当前的trace。"""
+    now = time.perf_counter()
+    for kind, name, value, labels, attrs in records:
+        if kind == "span":
+            SPAN_SECONDS.observe(value, span=name)
+            # 工作进程的时钟与本进程不同，span的开始时间按结束于现在计算
+            _record("span", name, value, start=now - value, attrs=attrs)
+        else:
+            metric = _metrics.get(name)
+            if metric is not None:
+                metric.observe(value, **labels)
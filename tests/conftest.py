@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与服务器相同，backend 目录作为导入的根目录（pose_detection、server 等）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
@@ -0,0 +1,28 @@
+import pytest
+from starlette.requests import Request
+
+from server.admission import client_id
+
+PROXY = "10.0.0.2"
+
+
+def _request(peer, headers=()):
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": (peer, 50000),
+    })
+
+
+def test_direct_clients_are_keyed_on_their_address():
+    request = _request("203.0.113.7", [("X-Client-Id", "someone-else"), ("X-Forwarded-For", "198.51.100.1")])
+    assert client_id(request, frozenset({PROXY})) == "203.0.113.7"
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ([("X-Client-Id", "user-42")], "user-42"),
+    ([("X-Forwarded-For", "198.51.100.1, 203.0.113.7, " + PROXY)], "203.0.113.7"),
+    ([], PROXY),
+])
+def test_trusted_proxy_forwards_the_client(headers, expected):
+    assert client_id(_request(PROXY, headers), frozenset({PROXY})) == expected
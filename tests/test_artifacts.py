@@ -0,0 +1,53 @@
+import sys
+
+import pytest
+
+from pose_detection import artifacts
+from pose_detection.artifacts import ArtifactError, default_model_dir, verify_artifact, write_manifest
+
+
+def _model_dir(path, variant):
+    path.mkdir()
+    (path / "saved_model.pb").write_bytes(variant.encode())
+    write_manifest(str(path), variant=variant)
+    return str(path)
+
+
+def test_manifest_records_the_variant(tmp_path):
+    model_dir = _model_dir(tmp_path / "model", "thunder")
+
+    verify_artifact(model_dir, "thunder")
+    with pytest.raises(ArtifactError):
+        verify_artifact(model_dir, "lightning")
+
+
+def test_default_model_dir_is_per_variant(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "_MODEL_DIR_CANDIDATES", [str(tmp_path)])
+    monkeypatch.delenv("POSE_MODEL_DIR", raising=False)
+    assert default_model_dir("lightning") == str(tmp_path / "lightning model")
+
+    # POSE_MODEL_DIR 中有以变体命名的子目录时使用子目录
+    (tmp_path / "models" / "lightning").mkdir(parents=True)
+    monkeypatch.setenv("POSE_MODEL_DIR", str(tmp_path / "models"))
+    assert default_model_dir("lightning") == str(tmp_path / "models" / "lightning")
+    assert default_model_dir("thunder") == str(tmp_path / "models")
+
+
+def test_tflite_files_of_other_variants_are_skipped(tmp_path):
+    backends = pytest.importorskip("pose_detection.backends")
+    for name in ("movenet-lightning-float32.tflite", "movenet-thunder-float32.tflite"):
+        (tmp_path / name).write_bytes(b"")
+
+    for variant in ("thunder", "lightning"):
+        path = backends._find_tflite_file(str(tmp_path), variant, "fp32")
+        assert variant in path
+
+
+def test_fetch_does_not_overwrite_another_variant(tmp_path, monkeypatch):
+    model_dir = _model_dir(tmp_path / "model", "thunder")
+    # 不应该开始下载
+    monkeypatch.setitem(sys.modules, "kagglehub", None)
+
+    with pytest.raises(ArtifactError):
+        artifacts.fetch_artifact("lightning", model_dir)
+    verify_artifact(model_dir, "thunder")
@@ -0,0 +1,33 @@
+import math
+
+from benchmarks.synthetic import synthetic_track
+from pose_detection.convergence import FRAME_MEASUREMENTS, ConvergenceMonitor
+from pose_detection.stroke_detector import PedalStrokeDetector
+
+
+def _run(keypoints, timestamps, add_frames=True):
+    detector = PedalStrokeDetector(1 / (timestamps[1] - timestamps[0]))
+    monitor = ConvergenceMonitor()
+    for keypoints_frame, timestamp in zip(keypoints, timestamps):
+        events = detector.update(keypoints_frame, timestamp)
+        if add_frames:
+            monitor.add_frame(keypoints_frame, detector.facing_side)
+        for event in events:
+            monitor.add(event)
+    return monitor
+
+
+def test_frame_measurements_converge_per_stroke():
+    monitor = _run(*synthetic_track(300, noise=0))
+
+    assert monitor.converged
+    intervals = monitor.intervals()
+    assert all(intervals[name] < monitor.max_ci for name in FRAME_MEASUREMENTS)
+
+
+def test_frame_measurements_are_required_to_converge():
+    # 没有逐帧的肩膀和手肘角度时，只凭踩踏事件不能判定收敛
+    monitor = _run(*synthetic_track(300, noise=0), add_frames=False)
+
+    assert not monitor.converged
+    assert all(math.isinf(monitor.intervals()[name]) for name in FRAME_MEASUREMENTS)
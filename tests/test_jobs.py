@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from server import jobs as jobs_module
+from server.jobs import JobTable, JobTableFull
+
+
+def test_ttl_only_expires_finished_jobs(monkeypatch):
+    async def scenario():
+        table = JobTable(max_jobs=2, ttl=10)
+        running, finished = table.create(), table.create()
+        running.emit("started")
+        finished.emit("done")
+
+        now = jobs_module.time.time()
+        monkeypatch.setattr(jobs_module.time, "time", lambda: now + 60)
+        assert table.get(running.id) is running
+        assert table.get(finished.id) is None
+
+        # 运行中的任务占满任务表时拒绝新任务
+        table.create()
+        with pytest.raises(JobTableFull):
+            table.create()
+
+    asyncio.run(scenario())
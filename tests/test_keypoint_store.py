@@ -0,0 +1,12 @@
+import pytest
+
+from pose_detection import keypoint_store
+from pose_detection.keypoint_store import KeypointStore
+
+
+@pytest.mark.parametrize("name, value", [("DEFAULT_TARGET_FPS", 15.0), ("MAX_SECONDS", 20), ("TARGET_SIZE", (192, 192))])
+def test_decode_settings_change_the_key(name, value, tmp_path, monkeypatch):
+    store = KeypointStore(root=str(tmp_path))
+    before = store.key(b"video", "model", keypoint_store._preprocess_key())
+    monkeypatch.setattr(keypoint_store, name, value)
+    assert store.key(b"video", "model", keypoint_store._preprocess_key()) != before
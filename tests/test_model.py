@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+pytest.importorskip("tensorflow")
+
+from benchmarks.synthetic import synthetic_track
+from pose_detection.keypoints import KEYPOINT_DICT
+from pose_detection.model import _extremum_intervals
+
+
+def _anchors(num_frames, stride):
+    anchors = np.arange(0, num_frames, stride)
+    return anchors if anchors[-1] == num_frames - 1 else np.append(anchors, num_frames - 1)
+
+
+@pytest.mark.parametrize("stride", [3, 4, 5])
+@pytest.mark.parametrize("cadence", [60, 90])
+def test_extremum_intervals_cover_pedal_extremes(stride, cadence):
+    keypoints, _ = synthetic_track(300, cadence=cadence, noise=0)
+    ankle_y = keypoints[:, KEYPOINT_DICT["left_ankle"], 0]
+    anchors = _anchors(len(ankle_y), stride)
+
+    intervals = _extremum_intervals(anchors, ankle_y[anchors])
+
+    # 每个踏板的最高点和最低点要么就是锚点，要么在补算的区间内
+    extremes = np.concatenate([find_peaks(ankle_y)[0], find_peaks(-ankle_y)[0]])
+    for frame in extremes:
+        k = np.searchsorted(anchors, frame, side="right") - 1
+        assert anchors[k] == frame or intervals[k]
+    # 每个极值只补算一个区间
+    assert intervals.sum() <= len(extremes)
+
+
+def test_extremum_intervals_ignore_jitter_within_deadband():
+    rng = np.random.default_rng(0)
+    anchors = np.arange(0, 100, 4)
+    ankle_y = 0.7 + rng.uniform(-0.002, 0.002, len(anchors))
+    assert not _extremum_intervals(anchors, ankle_y).any()
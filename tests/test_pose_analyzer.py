@@ -0,0 +1,91 @@
+import itertools
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from benchmarks.fake_model import FakeMoveNet
+from benchmarks.synthetic import synthetic_track, write_synthetic_video
+from pose_detection import pose_analyzer as analyzer
+from pose_detection.convergence import ConvergenceMonitor
+from pose_detection.keypoint_store import KeypointStore, model_version
+
+NUM_FRAMES = 300
+
+
+def _replay_keypoints(keypoints, batch_size=8):
+    """替代 get_keypoints_from_video：按顺序返回合成骑手的关键点，同样按批调用 on_keypoints 和 stop（跳帧推理时不检查）。"""
+
+    def get_keypoints_from_video(frames, model, input_size, stride=1, progress=None, on_keypoints=None, stop=None):
+        result = []
+        frames = iter(frames)
+        while True:
+            batch = list(itertools.islice(frames, batch_size))
+            if not batch:
+                return result
+            batch_keypoints = keypoints[len(result) : len(result) + len(batch)].copy()
+            result.extend(batch_keypoints)
+            on_keypoints(batch_keypoints)
+            if stride == 1 and stop():
+                return result
+
+    return get_keypoints_from_video
+
+
+@pytest.fixture
+def video(tmp_path):
+    keypoints, _ = synthetic_track(NUM_FRAMES, noise=0)
+    path = str(tmp_path / "rider.mp4")
+    write_synthetic_video(path, keypoints, size=(320, 240))
+    return path, keypoints
+
+
+def test_converged_tracks_are_not_cached(video, tmp_path, monkeypatch):
+    path, keypoints = video
+    model = FakeMoveNet()
+    store = KeypointStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(analyzer, "get_model", lambda: (model, model.input_size))
+    monkeypatch.setattr(analyzer, "get_keypoint_store", lambda: store)
+    monkeypatch.setattr(analyzer, "get_keypoints_from_video", _replay_keypoints(keypoints))
+
+    for _ in range(2):
+        events = {}
+        result = analyzer.pose_analyzer(path, progress=lambda stage, **data: events.update({stage: data}))
+
+        assert result["analysis"]["stop_reason"] == "converged"
+        assert result["analysis"]["frames_processed"] < NUM_FRAMES
+        assert result["knee_angle_lowest"] == pytest.approx(64.7, abs=1)
+        assert store.get(store.key(path, model_version(model))) is None
+        # 分析信息与测量值分开报告，测量值中只有角度
+        assert set(events["measurements"]["measurements"]) == set(result) - {"analysis"}
+        assert events["measurements"]["analysis"] == result["analysis"]
+
+
+def test_full_tracks_are_cached(video, tmp_path, monkeypatch):
+    path, keypoints = video
+    model = FakeMoveNet()
+    store = KeypointStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(analyzer, "get_model", lambda: (model, model.input_size))
+    monkeypatch.setattr(analyzer, "get_keypoint_store", lambda: store)
+    monkeypatch.setattr(analyzer, "get_keypoints_from_video", _replay_keypoints(keypoints))
+    monkeypatch.setattr(analyzer, "ConvergenceMonitor", lambda: ConvergenceMonitor(min_strokes=0))
+
+    assert analyzer.pose_analyzer(path)["analysis"]["stop_reason"] == "end_of_video"
+    cached = store.get(store.key(path, model_version(model)))
+    assert cached is not None and len(cached) == NUM_FRAMES
+    assert analyzer.pose_analyzer(path)["analysis"]["stop_reason"] == "cached"
+
+
+def test_strided_tracks_are_cached_per_stride(video, tmp_path, monkeypatch):
+    path, keypoints = video
+    model = FakeMoveNet()
+    store = KeypointStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(analyzer, "get_model", lambda: (model, model.input_size))
+    monkeypatch.setattr(analyzer, "get_keypoint_store", lambda: store)
+    monkeypatch.setattr(analyzer, "get_keypoints_from_video", _replay_keypoints(keypoints))
+    monkeypatch.setattr(analyzer, "INFERENCE_STRIDE", 4)
+
+    # 跳帧推理不提前停止，关键点按跳帧间隔分开缓存
+    assert analyzer.pose_analyzer(path)["analysis"]["stop_reason"] == "end_of_video"
+    assert store.get(store.key(path, model_version(model, 4))) is not None
+    assert store.get(store.key(path, model_version(model))) is None
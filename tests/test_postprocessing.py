@@ -0,0 +1,24 @@
+import numpy as np
+
+from benchmarks.synthetic import synthetic_track
+from pose_detection.pose_track import PoseTrack
+from pose_detection.postprocessing import calculate_angles, filter_bad_knee_angles, get_lowest_pedal_frames
+
+
+def test_knee_angles_at_lowest_pedal_frames_survive_filter():
+    keypoints, timestamps = synthetic_track(300)
+    track = PoseTrack(keypoints, timestamps)
+    knee_angles = calculate_angles(track, [track.front_indices[:3]])[:, 0]
+    indices = get_lowest_pedal_frames(track, track.front_indices)
+
+    angles, kept = filter_bad_knee_angles(knee_angles[indices], indices)
+
+    # 合成骑手在上止点的膝盖角度约为65度，抖动产生的误检峰值被排除
+    assert len(kept) > len(indices) // 2
+    assert np.all(angles < 90)
+    assert abs(np.mean(angles) - 65) < 2
+
+
+def test_filter_bad_knee_angles_empty():
+    angles, indices = filter_bad_knee_angles([150.0, 160.0], [3, 4])
+    assert len(angles) == 0 and len(indices) == 0
@@ -0,0 +1,46 @@
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from pose_detection.preprocessing import iter_video_frames, probe_video
+
+NUM_FRAMES = 15
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (160, 120))
+    for i in range(NUM_FRAMES):
+        writer.write(np.full((120, 160, 3), i * 16, dtype=np.uint8))
+    writer.release()
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+@pytest.fixture(params=["pyav", "opencv"])
+def memory_backend(request, monkeypatch):
+    if request.param == "pyav":
+        pytest.importorskip("av")
+    else:
+        # 没有PyAV时从内存解码使用OpenCV的流缓冲后端
+        monkeypatch.setitem(sys.modules, "av", None)
+    return request.param
+
+
+def test_probe_bytes(video, memory_backend):
+    info = probe_video(video[1])
+    assert info["frame_count"] == NUM_FRAMES
+    assert (info["width"], info["height"]) == (160, 120)
+
+
+def test_decode_bytes_matches_file(video, memory_backend):
+    path, data = video
+    expected = list(iter_video_frames(path, timestamps=True))
+    decoded = list(iter_video_frames(data, ingest="memory", timestamps=True))
+    assert len(decoded) == len(expected) == NUM_FRAMES
+    np.testing.assert_allclose([t for _, t in decoded], [t for _, t in expected], atol=1e-3)
+    for (frame, _), (reference, _) in zip(decoded, expected):
+        assert np.abs(frame.astype(int) - reference.astype(int)).mean() < 2
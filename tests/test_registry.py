@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from benchmarks.fake_model import FakeMoveNet
+from pose_detection import registry
+from pose_detection.batcher import DynamicBatcher
+
+
+class BatchedFakeMoveNet(FakeMoveNet):
+    batched = True
+
+
+@pytest.mark.parametrize("backend, wrapped", [(FakeMoveNet, False), (BatchedFakeMoveNet, True)])
+def test_micro_batching_only_wraps_batched_backends(backend, wrapped, monkeypatch):
+    monkeypatch.setattr(registry, "MICRO_BATCH_SIZE", 8)
+    model, _ = registry.ModelRegistry(loader=lambda name, variant: backend()).get()
+    assert isinstance(model, DynamicBatcher) == wrapped
+    if wrapped:
+        model.close()
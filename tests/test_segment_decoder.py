@@ -0,0 +1,24 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from pose_detection.segment_decoder import _keyframe_indices
+
+av = pytest.importorskip("av")
+
+
+def test_keyframes_count_from_the_stream_start(tmp_path):
+    # 第一帧的 pts 不为0（例如剪辑过的视频），关键帧序号仍从0开始
+    path = str(tmp_path / "offset.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 64, 64, "yuv420p"
+        stream.options = {"g": "30", "x264-params": "scenecut=0"}
+        for i in range(90):
+            frame = av.VideoFrame.from_ndarray(np.full((64, 64, 3), i, np.uint8), format="rgb24")
+            frame.pts, frame.time_base = i + 45, Fraction(1, 30)
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+
+    assert _keyframe_indices(path, 30) == [0, 30, 60]
@@ -0,0 +1,27 @@
+import numpy as np
+from scipy.signal import find_peaks
+
+from pose_detection.stroke_detector import OnlinePeakDetector
+
+
+def _online_peaks(values, distance, lookahead=None):
+    detector = OnlinePeakDetector(distance, lookahead=lookahead)
+    peaks = []
+    for value in values:
+        peaks.extend(detector.push(value))
+    peaks.extend(detector.flush())
+    return sorted(peaks)
+
+
+def test_matches_find_peaks_on_float_signals():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        values = rng.normal(size=80).cumsum()
+        distance = int(rng.integers(1, 12))
+        expected = find_peaks(values, distance=distance)[0].tolist()
+        assert _online_peaks(values, distance, lookahead=len(values)) == expected
+
+
+def test_equal_heights_keep_the_later_peak():
+    # find_peaks 对同样高度的峰值的取舍取决于 np.argsort，这里固定保留靠后的峰值
+    assert _online_peaks([2, 3, 1, 2, 3, 1, 1, 1, 2, 0, 2, 2, 1], 3) == [1, 4, 10]
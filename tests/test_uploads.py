@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("python_multipart")
+
+from server.uploads import SpooledUpload
+
+
+def test_in_memory_source_is_built_once():
+    upload = SpooledUpload(max_bytes=1024, spool_bytes=1024)
+    upload.write(b"video")
+    upload.write(b" bytes")
+    upload.finish()
+
+    assert upload.source == b"video bytes"
+    assert isinstance(upload.source, bytes)
+    assert upload.source is upload.source
+
+
+def test_spooled_source_is_the_file_path(tmp_path):
+    upload = SpooledUpload(max_bytes=1024, spool_bytes=4, directory=str(tmp_path))
+    upload.write(b"video bytes")
+    upload.finish()
+    try:
+        with open(upload.source, "rb") as f:
+            assert f.read() == b"video bytes"
+    finally:
+        upload.close()